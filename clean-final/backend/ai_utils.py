@@ -4,53 +4,140 @@ This module handles interactions with the Ollama API.
 """
 
 import os
-import requests
+import httpx
 import subprocess
 import logging
 import shlex
 import json
+import time
 import base64
-from typing import List, Dict, Any, Optional
+import asyncio
+from typing import List, Dict, Any, Optional, AsyncIterator, Sequence, Tuple
+
+from metrics import instrument, record_ollama_usage, OLLAMA_REQUESTS
+from tracing import span, traced, annotate
+from ollama_pool import ollama_pool
+from prompts import RECOMMENDATION_PROMPT, STRUCTURED_RECOMMENDATION_PROMPT, CHAT_SYSTEM_PROMPT
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Ollama API configuration
+# Ollama API configuration (requests are spread over OLLAMA_API_URLS, see ollama_pool.py)
 OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434/api")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2")
 OLLAMA_VISION_MODEL = os.getenv("OLLAMA_VISION_MODEL", "llava")
+# Embedding model used by the semantic response cache
+OLLAMA_EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+
+# How long Ollama keeps a model loaded after a request (Ollama duration string, e.g. "30m", or "-1" for forever)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# Recommendation output mode: "markdown" (persuasive prose) or "json" (schema-constrained)
+RECOMMENDATION_OUTPUT_MODE = os.getenv("RECOMMENDATION_OUTPUT_MODE", "markdown").lower()
+
+# Concurrent model calls per recommendation batch (keep in line with OLLAMA_NUM_PARALLEL on the server)
+RECOMMENDATION_BATCH_CONCURRENCY = int(os.getenv("RECOMMENDATION_BATCH_CONCURRENCY", "4"))
+# Limits for /api/recommend/batch requests
+RECOMMENDATION_BATCH_MAX_CONCURRENCY = int(os.getenv("RECOMMENDATION_BATCH_MAX_CONCURRENCY", "16"))
+RECOMMENDATION_BATCH_MAX_QUERIES = int(os.getenv("RECOMMENDATION_BATCH_MAX_QUERIES", "10000"))
+
+# JSON schema passed to Ollama's "format" field for structured recommendations
+RECOMMENDATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "recommendations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "integer"},
+                    "score": {"type": "integer", "minimum": 1, "maximum": 100},
+                    "reason": {"type": "string"}
+                },
+                "required": ["id", "score", "reason"]
+            }
+        }
+    },
+    "required": ["recommendations"]
+}
+
+# Prompt used to describe uploaded product images
+PRODUCT_ANALYSIS_PROMPT = """Analyze this product image in detail and provide a comprehensive description of:
+1) What type of product or item is shown
+2) What category it belongs to (clothing, electronics, accessories, books, etc.)
+3) Its apparent color(s), material(s), and texture(s)
+4) Any distinctive features, patterns, or design elements
+5) What the product might be used for
+6) Any visible brand identifiers or logos
+7) The apparent size, shape, and form factor
+
+Be specific and detailed in your analysis. Focus only on what you can actually see in the image."""
+
+# Replies used when the model is unreachable or returns nothing useful (never cached)
+OLLAMA_UNAVAILABLE_REPLY = "I'm sorry, I'm having trouble connecting to my AI services right now. Please try again later."
+CHAT_EMPTY_REPLY = "I'm here to help with your shopping needs! How can I assist you today?"
+CHAT_ERROR_REPLY = "I'm sorry, I'm having trouble connecting to my services right now. Please try again in a moment!"
+FALLBACK_REPLIES = frozenset((OLLAMA_UNAVAILABLE_REPLY, CHAT_EMPTY_REPLY, CHAT_ERROR_REPLY))
 
+# Adaptive timeout of the vision CLI fallbacks is capped at this many seconds
+OLLAMA_CLI_TIMEOUT = 30.0
 
-async def call_ollama(messages: List[Dict[str, str]], model: str = OLLAMA_MODEL) -> str:
+# Shared async HTTP client so Ollama calls don't block the event loop
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get the shared async HTTP client used for Ollama requests."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        # Requests pass their own adaptive timeouts (see ollama_pool.py)
+        _http_client = httpx.AsyncClient(timeout=httpx.Timeout(None, connect=10.0))
+    return _http_client
+
+
+@instrument("ollama_chat")
+@traced("ollama.call")
+async def call_ollama(
+    messages: List[Dict[str, str]],
+    model: str = OLLAMA_MODEL,
+    response_format: Optional[Any] = None
+) -> str:
     """
     Call the Ollama API for text completion.
     
     Args:
         messages: A list of message objects in the format [{"role": "user", "content": "Hello"}]
         model: The Ollama model to use (default: llama3.2)
+        response_format: Optional Ollama "format" value ("json" or a JSON schema) to constrain the output
         
     Returns:
         The generated text response from the model
     """
+    payload = {
+        "model": model,
+        "messages": messages,
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE
+    }
+    if response_format is not None:
+        payload["format"] = response_format
+    
+    client = get_http_client()
     try:
-        response = requests.post(
-            f"{OLLAMA_API_URL}/chat",
-            json={
-                "model": model,
-                "messages": messages,
-                "stream": False
-            }
-        )
+        start = time.perf_counter()
+        response = await ollama_pool.post(client, "chat", payload)
         
         if response.status_code != 200:
-            logger.error(f"Ollama API error: {response.status_code} - {response.text}")
+            OLLAMA_REQUESTS.labels(model, "chat", str(response.status_code)).inc()
+            logger.error("Ollama API error: %s - %s", response.status_code, response.text)
             raise Exception(f"Failed to get response from Ollama: {response.status_code}")
             
         result = response.json()
+        record_ollama_usage(model, "chat", result, time.perf_counter() - start)
+        annotate(model=model, endpoint="chat", prompt_tokens=result.get("prompt_eval_count"),
+                 completion_tokens=result.get("eval_count"))
         return result["message"]["content"]
     except Exception as e:
-        logger.error(f"Ollama API error: {str(e)}")
+        logger.error("Ollama API error: %s", e)
         # Fallback to basic generate API if chat API fails
         try:
             # Get the last user message
@@ -61,23 +148,138 @@ async def call_ollama(messages: List[Dict[str, str]], model: str = OLLAMA_MODEL)
                     break
             
             if last_user_message:
-                response = requests.post(
-                    f"{OLLAMA_API_URL}/generate",
-                    json={
-                        "model": model,
-                        "prompt": last_user_message,
-                        "stream": False
-                    }
-                )
+                generate_payload = {
+                    "model": model,
+                    "prompt": last_user_message,
+                    "stream": False,
+                    "keep_alive": OLLAMA_KEEP_ALIVE
+                }
+                if response_format is not None:
+                    generate_payload["format"] = response_format
+                start = time.perf_counter()
+                response = await ollama_pool.post(client, "generate", generate_payload)
                 
                 if response.status_code == 200:
-                    return response.json().get("response", "I'm sorry, I couldn't process your request at the moment.")
+                    result = response.json()
+                    record_ollama_usage(model, "generate", result, time.perf_counter() - start)
+                    annotate(model=model, endpoint="generate", prompt_tokens=result.get("prompt_eval_count"),
+                             completion_tokens=result.get("eval_count"))
+                    return result.get("response", "I'm sorry, I couldn't process your request at the moment.")
+                OLLAMA_REQUESTS.labels(model, "generate", str(response.status_code)).inc()
         except Exception as e2:
-            logger.error(f"Fallback API error: {str(e2)}")
+            logger.error("Fallback API error: %s", e2)
             
-        return "I'm sorry, I'm having trouble connecting to my AI services right now. Please try again later."
+        return OLLAMA_UNAVAILABLE_REPLY
+
+
+@instrument("ollama_chat_stream")
+async def stream_ollama_chat(messages: List[Dict[str, str]], model: str = OLLAMA_MODEL) -> AsyncIterator[str]:
+    """
+    Stream a chat completion from Ollama token by token.
+    
+    Closing the generator early (e.g. when the user cancels) closes the connection,
+    which makes Ollama stop generating.
+    
+    Args:
+        messages: A list of message objects in the format [{"role": "user", "content": "Hello"}]
+        model: The Ollama model to use (default: llama3.2)
+        
+    Yields:
+        Text chunks of the reply as they are generated
+    """
+    client = get_http_client()
+    start = time.perf_counter()
+    async with ollama_pool.stream(
+        client, "chat", {"model": model, "messages": messages, "stream": True, "keep_alive": OLLAMA_KEEP_ALIVE}
+    ) as response:
+        if response.status_code != 200:
+            OLLAMA_REQUESTS.labels(model, "chat", str(response.status_code)).inc()
+            await response.aread()
+            raise Exception(f"Chat streaming failed: {response.status_code} - {response.text}")
+        
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                raise Exception(f"Chat streaming failed: {chunk['error']}")
+            content = chunk.get("message", {}).get("content")
+            if content:
+                yield content
+            if chunk.get("done"):
+                record_ollama_usage(model, "chat", chunk, time.perf_counter() - start)
+                break
 
 
+@instrument("ollama_embed")
+@traced("ollama.embed")
+async def embed_texts(texts: Sequence[str], model: str = OLLAMA_EMBED_MODEL) -> List[List[float]]:
+    """
+    Embed texts with Ollama's embedding endpoint.
+    
+    Args:
+        texts: The texts to embed (one request for all of them)
+        model: The Ollama embedding model
+        
+    Returns:
+        One embedding vector per text
+        
+    Raises:
+        Exception: If Ollama is unreachable or returns an error
+    """
+    start = time.perf_counter()
+    response = await ollama_pool.post(
+        get_http_client(), "embed", {"model": model, "input": list(texts), "keep_alive": OLLAMA_KEEP_ALIVE}
+    )
+    if response.status_code != 200:
+        OLLAMA_REQUESTS.labels(model, "embed", str(response.status_code)).inc()
+        raise Exception(f"Failed to get embeddings from Ollama: {response.status_code}")
+    result = response.json()
+    record_ollama_usage(model, "embed", result, time.perf_counter() - start)
+    return result["embeddings"]
+
+
+async def _run_cli(command, timeout: float, shell: bool = False) -> str:
+    """
+    Run a CLI command without blocking the event loop.
+    
+    Args:
+        command: Shell command string (shell=True) or argument list
+        timeout: Seconds before the process is killed
+        shell: Whether to run the command through the shell
+        
+    Returns:
+        The combined stdout and stderr text
+        
+    Raises:
+        subprocess.CalledProcessError: The command exited with a non-zero status
+        subprocess.TimeoutExpired: The command ran longer than timeout
+    """
+    if shell:
+        process = await asyncio.create_subprocess_shell(
+            command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+    else:
+        process = await asyncio.create_subprocess_exec(
+            *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+    try:
+        output, _ = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise subprocess.TimeoutExpired(command, timeout)
+    except asyncio.CancelledError:
+        # The request went away; do not leave the CLI generating
+        process.kill()
+        await process.wait()
+        raise
+    text = output.decode("utf-8", errors="replace")
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, output=text)
+    return text
+
+
+@instrument("ollama_vision")
+@traced("ollama.vision")
 async def analyze_image_with_ollama(image_path: str, prompt: str) -> str:
     """
     Analyze an image using Ollama's vision model.
@@ -90,85 +292,150 @@ async def analyze_image_with_ollama(image_path: str, prompt: str) -> str:
         The text analysis of the image
     """
     # Try three different methods to analyze the image, falling back if previous ones fail
+    cli_timeout = min(OLLAMA_CLI_TIMEOUT, ollama_pool.tracker.timeout(OLLAMA_VISION_MODEL, "cli"))
     
     # Method 1: Use subprocess to call Ollama CLI directly
-    try:
-        # Properly escape the command arguments for security
-        model = OLLAMA_VISION_MODEL
-        escaped_prompt = shlex.quote(prompt)
-        escaped_path = shlex.quote(image_path)
-        
-        command = f'ollama run {model} -i {escaped_path} {escaped_prompt}'
-        logger.info(f"Executing method 1: {command}")
-        
-        # Run the command and capture output
-        result = subprocess.check_output(
-            command, 
-            shell=True, 
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-            timeout=30  # Add timeout to prevent hanging
-        )
-        
-        return result.strip()
-    except subprocess.CalledProcessError as e:
-        logger.warning(f"Method 1 failed with error: {e.output}")
-        # Fall back to method 2
-    except subprocess.TimeoutExpired:
-        logger.warning("Method 1 timed out")
-        # Fall back to method 2
-    except Exception as e:
-        logger.warning(f"Method 1 failed with error: {str(e)}")
-        # Fall back to method 2
+    with span("analyze_image_with_ollama.cli_shell", method="cli_shell") as attempt:
+        try:
+            # Properly escape the command arguments for security
+            model = OLLAMA_VISION_MODEL
+            escaped_prompt = shlex.quote(prompt)
+            escaped_path = shlex.quote(image_path)
+        
+            command = f'ollama run {model} -i {escaped_path} {escaped_prompt}'
+            logger.debug("Executing method 1: %s", command)
+        
+            # Run the command and capture output
+            start = time.perf_counter()
+            result = await _run_cli(command, cli_timeout, shell=True)  # Timeout prevents hanging
+            ollama_pool.tracker.record(OLLAMA_VISION_MODEL, "cli", time.perf_counter() - start)
+        
+            return result.strip()
+        except subprocess.CalledProcessError as e:
+            logger.warning("Method 1 failed with error: %s", e.output)
+            attempt.error = e.output
+            # Fall back to method 2
+        except subprocess.TimeoutExpired:
+            logger.warning("Method 1 timed out")
+            attempt.error = "timed out"
+            # Fall back to method 2
+        except Exception as e:
+            logger.warning("Method 1 failed with error: %s", e)
+            attempt.error = str(e)
+            # Fall back to method 2
     
     # Method 2: Try calling ollama CLI with arguments as list (no shell)
-    try:
-        logger.info("Trying method 2: subprocess with args list")
-        result = subprocess.check_output(
-            ["ollama", "run", OLLAMA_VISION_MODEL, "-i", image_path, prompt],
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-            timeout=30
-        )
-        return result.strip()
-    except subprocess.CalledProcessError as e:
-        logger.warning(f"Method 2 failed with error: {e.output}")
-        # Fall back to method 3
-    except subprocess.TimeoutExpired:
-        logger.warning("Method 2 timed out")
-        # Fall back to method 3
-    except Exception as e:
-        logger.warning(f"Method 2 failed with error: {str(e)}")
-        # Fall back to method 3
+    with span("analyze_image_with_ollama.cli_args", method="cli_args") as attempt:
+        try:
+            logger.debug("Trying method 2: subprocess with args list")
+            start = time.perf_counter()
+            result = await _run_cli(["ollama", "run", OLLAMA_VISION_MODEL, "-i", image_path, prompt], cli_timeout)
+            ollama_pool.tracker.record(OLLAMA_VISION_MODEL, "cli", time.perf_counter() - start)
+            return result.strip()
+        except subprocess.CalledProcessError as e:
+            logger.warning("Method 2 failed with error: %s", e.output)
+            attempt.error = e.output
+            # Fall back to method 3
+        except subprocess.TimeoutExpired:
+            logger.warning("Method 2 timed out")
+            attempt.error = "timed out"
+            # Fall back to method 3
+        except Exception as e:
+            logger.warning("Method 2 failed with error: %s", e)
+            attempt.error = str(e)
+            # Fall back to method 3
     
     # Method 3: Use Ollama's API directly with an image
-    try:
-        logger.info("Trying method 3: Ollama REST API with base64 image")
-        
-        # Read the image file and encode it as base64
-        with open(image_path, "rb") as image_file:
-            image_data = base64.b64encode(image_file.read()).decode("utf-8")
-        
-        # Prepare the API request
-        response = requests.post(
-            f"{OLLAMA_API_URL}/generate",
-            json={
-                "model": OLLAMA_VISION_MODEL,
-                "prompt": prompt,
-                "images": [image_data],
-                "stream": False
-            }
-        )
+    with span("analyze_image_with_ollama.api", method="api") as attempt:
+        try:
+            logger.debug("Trying method 3: Ollama REST API with base64 image")
+        
+            # Read the image file and encode it as base64
+            with open(image_path, "rb") as image_file:
+                image_data = base64.b64encode(image_file.read()).decode("utf-8")
+        
+            # Prepare the API request
+            start = time.perf_counter()
+            response = await ollama_pool.post(
+                get_http_client(),
+                "generate",
+                {
+                    "model": OLLAMA_VISION_MODEL,
+                    "prompt": prompt,
+                    "images": [image_data],
+                    "stream": False,
+                    "keep_alive": OLLAMA_KEEP_ALIVE
+                }
+            )
         
+            if response.status_code != 200:
+                OLLAMA_REQUESTS.labels(OLLAMA_VISION_MODEL, "generate", str(response.status_code)).inc()
+                logger.error("Method 3 API error: %s - %s", response.status_code, response.text)
+                raise Exception(f"Failed with status code: {response.status_code}")
+        
+            result = response.json()
+            record_ollama_usage(OLLAMA_VISION_MODEL, "generate", result, time.perf_counter() - start)
+            return result.get("response", "")
+        except Exception as e:
+            logger.error("All methods failed. Final error: %s", e)
+            attempt.error = str(e)
+            return "I'm unable to analyze this image at the moment. Please try again later or use a different image."
+
+
+@instrument("ollama_vision_stream")
+async def stream_image_analysis(image_path: str, prompt: str, model: str = OLLAMA_VISION_MODEL) -> AsyncIterator[str]:
+    """
+    Stream an image analysis from Ollama's vision model token by token.
+    
+    Args:
+        image_path: Path to the image file
+        prompt: The text prompt to guide the image analysis
+        model: The Ollama vision model to use (default: llava)
+        
+    Yields:
+        Text chunks of the analysis as they are generated
+    """
+    with open(image_path, "rb") as image_file:
+        image_data = base64.b64encode(image_file.read()).decode("utf-8")
+    
+    client = get_http_client()
+    start = time.perf_counter()
+    async with ollama_pool.stream(
+        client,
+        "generate",
+        {
+            "model": model,
+            "prompt": prompt,
+            "images": [image_data],
+            "stream": True,
+            "keep_alive": OLLAMA_KEEP_ALIVE
+        }
+    ) as response:
         if response.status_code != 200:
-            logger.error(f"Method 3 API error: {response.status_code} - {response.text}")
-            raise Exception(f"Failed with status code: {response.status_code}")
+            OLLAMA_REQUESTS.labels(model, "generate", str(response.status_code)).inc()
+            await response.aread()
+            raise Exception(f"Vision streaming failed: {response.status_code} - {response.text}")
         
-        result = response.json()
-        return result.get("response", "")
-    except Exception as e:
-        logger.error(f"All methods failed. Final error: {str(e)}")
-        return "I'm unable to analyze this image at the moment. Please try again later or use a different image."
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                raise Exception(f"Vision streaming failed: {chunk['error']}")
+            if chunk.get("response"):
+                yield chunk["response"]
+            if chunk.get("done"):
+                # The final chunk carries the token counts and durations
+                record_ollama_usage(model, "generate", chunk, time.perf_counter() - start)
+                break
+
+
+def is_usable_image_description(description: str) -> bool:
+    """Check whether a vision model description actually describes the image."""
+    if not description:
+        return False
+    description_lower = description.lower()
+    return not any(phrase in description_lower for phrase in ("cannot analyze", "can't analyze", "unable to analyze", "cannot see"))
 
 
 class RecommendationGenerator:
@@ -186,46 +453,8 @@ class RecommendationGenerator:
         Returns:
             AI-generated product recommendations
         """
-        # Create recommendation prompt
-        recommendation_prompt = [
-            {
-                "role": "system", 
-                "content": """You are Pocket AI, a product recommendation specialist for an e-commerce platform. Your task is to accurately match user requests to relevant products from our catalog and provide detailed, persuasive recommendations.
-
-CRITICAL RULES:
-1. You MUST ONLY recommend products that are in our catalog
-2. You MUST use the EXACT product names from the catalog WITHOUT ANY CHANGES
-3. DO NOT invent products or modify product names in any way
-4. DO NOT paraphrase or abbreviate product names
-5. When listing a product name, it must match the catalog EXACTLY character-for-character
-6. NEVER suggest products that aren't in the catalog, even as alternatives
-7. ONLY recommend products that are HIGHLY RELEVANT to the user's query - do not suggest loosely related products
-8. If you can't find at least 2 highly relevant products, it's better to recommend just 1 perfect match than multiple mediocre matches
-9. NEVER use phrases like "I couldn't find a product named X" - only recommend actual products
-10. For each product, assign a relevance score from 1-100 based on how well it matches the query (include this in your reasoning)"""
-            },
-            {
-                "role": "user",
-                "content": f"""I'm looking for: "{query}".
-
-Here is our EXACT product catalog with IDs, names, and details:
-{product_summary}
-
-Based on my request, recommend ONLY products that are HIGHLY RELEVANT to what I'm looking for. ONLY recommend products that EXACTLY match names in the catalog above.
-
-For each recommendation, structure your response like this:
-
-## [EXACT PRODUCT NAME] ($PRICE)
-
-### Perfect Match Because:
-- [Relevance Score: X/100] - Explain why you assigned this score
-- [First reason this product matches my query]
-- [Second reason this product matches my query]
-- [Third reason this product matches my query]
-
-Product ID: [PRODUCT_ID]"""
-            }
-        ]
+        # Instructions and catalog first, so Ollama can reuse their evaluation across queries
+        recommendation_prompt = RECOMMENDATION_PROMPT.messages(product_summary, query=query)
         
         try:
             response = await call_ollama(recommendation_prompt)
@@ -237,7 +466,7 @@ Product ID: [PRODUCT_ID]"""
                 
             return response
         except Exception as e:
-            logger.error(f"Error generating recommendations: {str(e)}")
+            logger.error("Error generating recommendations: %s", e)
             # Return a fallback response
             return """I'm sorry, but I couldn't generate product recommendations at this time. Here are some popular products from our catalog instead:
 
@@ -253,6 +482,78 @@ Product ID: 1
 - Compact design fits anywhere
 Product ID: 5"""
 
+    @staticmethod
+    async def get_structured_recommendations(query: str, product_summary: str) -> str:
+        """
+        Generate product recommendations as schema-constrained JSON.
+        
+        The model returns only {"recommendations": [{"id", "score", "reason"}]}, which
+        needs far fewer output tokens than the markdown format and can be validated
+        without scraping the text.
+        
+        Args:
+            query: User's product query
+            product_summary: Summary of available products
+            
+        Returns:
+            The raw JSON text produced by the model (empty object on failure)
+        """
+        recommendation_prompt = STRUCTURED_RECOMMENDATION_PROMPT.messages(product_summary, query=query)
+        
+        try:
+            return await call_ollama(recommendation_prompt, response_format=RECOMMENDATION_SCHEMA)
+        except Exception as e:
+            logger.error("Error generating structured recommendations: %s", e)
+            return '{"recommendations": []}'
+
+    @staticmethod
+    async def get_batch_recommendations(
+        queries: Sequence[str],
+        product_summary: str,
+        structured: bool = False,
+        concurrency: int = RECOMMENDATION_BATCH_CONCURRENCY
+    ) -> AsyncIterator[Tuple[int, str, float]]:
+        """
+        Generate recommendations for many queries against one catalog summary.
+        
+        A fixed pool of workers takes the queries in order, so at most `concurrency`
+        model calls are in flight. Results are yielded as they finish, not in query order.
+        Closing the iterator early cancels the calls still running.
+        
+        Args:
+            queries: User queries
+            product_summary: Summary of available products, shared by all queries
+            structured: Generate schema-constrained JSON instead of markdown
+            concurrency: Maximum concurrent model calls
+            
+        Yields:
+            (query index, raw model output, seconds spent on the query)
+        """
+        generate = (RecommendationGenerator.get_structured_recommendations if structured
+                    else RecommendationGenerator.get_product_recommendations)
+        pending = iter(range(len(queries)))
+        results: asyncio.Queue = asyncio.Queue()
+        
+        async def worker():
+            for index in pending:
+                start = time.perf_counter()
+                try:
+                    text = await generate(queries[index], product_summary)
+                except Exception as e:
+                    # The generators already fall back on model errors; never leave the batch waiting
+                    logger.error("Batch recommendation %s failed: %s", index, e)
+                    text = ""
+                await results.put((index, text, time.perf_counter() - start))
+        
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, len(queries))))]
+        try:
+            for _ in range(len(queries)):
+                yield await results.get()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
 
 class ImageAnalyzer:
     """Class to analyze product images using Ollama's vision model."""
@@ -268,31 +569,36 @@ class ImageAnalyzer:
         Returns:
             Detailed description of the product in the image
         """
-        # Create analysis prompt
-        analysis_prompt = """Analyze this product image in detail and provide a comprehensive description of:
-1) What type of product or item is shown
-2) What category it belongs to (clothing, electronics, accessories, books, etc.)
-3) Its apparent color(s), material(s), and texture(s)
-4) Any distinctive features, patterns, or design elements
-5) What the product might be used for
-6) Any visible brand identifiers or logos
-7) The apparent size, shape, and form factor
-
-Be specific and detailed in your analysis. Focus only on what you can actually see in the image."""
-        
         try:
             # Call image analysis function
-            description = await analyze_image_with_ollama(image_path, analysis_prompt)
+            description = await analyze_image_with_ollama(image_path, PRODUCT_ANALYSIS_PROMPT)
             
             # Check if the result is empty or contains error messages
-            if not description or "cannot analyze" in description.lower() or "cannot see" in description.lower():
+            if not is_usable_image_description(description):
                 logger.warning("Image analysis failed or returned unusable result")
                 return "I see a product image, but can't analyze the details completely. It appears to be a consumer product that might be in categories like electronics, clothing, or home goods."
                 
             return description
         except Exception as e:
-            logger.error(f"Error analyzing image: {str(e)}")
+            logger.error("Error analyzing image: %s", e)
             return "I see a product image, but I'm having trouble analyzing it in detail right now. It appears to be a consumer product, though I can't identify specific features."
+    
+    @staticmethod
+    async def stream_product_image(image_path: str) -> AsyncIterator[str]:
+        """
+        Stream a product image analysis as it is generated.
+        
+        Unlike analyze_product_image this does not fall back to other methods, so
+        callers can start working on early tokens and handle failures themselves.
+        
+        Args:
+            image_path: Path to the image file
+            
+        Yields:
+            Text chunks of the product description
+        """
+        async for chunk in stream_image_analysis(image_path, PRODUCT_ANALYSIS_PROMPT):
+            yield chunk
 
 
 class ChatAssistant:
@@ -309,20 +615,8 @@ class ChatAssistant:
         Returns:
             AI-generated response to the user's message
         """
-        # Add system prompt to messages
-        system_message = {
-            "role": "system",
-            "content": """You are Pocket AI, a helpful and friendly e-commerce shopping assistant. You help users find products, answer questions about products, and provide information about shopping on our platform.
-
-Important guidelines:
-1. Be friendly, conversational, and helpful
-2. If users ask for product recommendations, encourage them to use the dedicated recommendation feature
-3. If users mention images or ask about product images, inform them about the image search feature
-4. Keep responses concise and to-the-point
-5. Focus on helping the user accomplish their shopping goals
-6. If a user's message is unclear, politely ask for clarification
-7. You are an e-commerce assistant for Pocket AI, a fictional company that sells various products"""
-        }
+        # Add system prompt to messages (static, so it stays a reusable prefix)
+        system_message = {"role": "system", "content": CHAT_SYSTEM_PROMPT}
         
         # Insert system message at the beginning
         full_messages = [system_message] + messages
@@ -333,9 +627,24 @@ Important guidelines:
             # Basic sanity check
             if not response or len(response) < 10:
                 logger.warning("Chat response was too short or empty, using fallback")
-                return "I'm here to help with your shopping needs! How can I assist you today?"
+                return CHAT_EMPTY_REPLY
                 
             return response
         except Exception as e:
-            logger.error(f"Error generating chat response: {str(e)}")
-            return "I'm sorry, I'm having trouble connecting to my services right now. Please try again in a moment!" 
\ No newline at end of file
+            logger.error("Error generating chat response: %s", e)
+            return CHAT_ERROR_REPLY
+
+    @staticmethod
+    async def stream_chat_response(messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """
+        Stream a chat response based on conversation history.
+        
+        Args:
+            messages: List of chat messages with roles and content
+            
+        Yields:
+            Text chunks of the AI-generated response
+        """
+        full_messages = [{"role": "system", "content": CHAT_SYSTEM_PROMPT}] + messages
+        async for chunk in stream_ollama_chat(full_messages):
+            yield chunk
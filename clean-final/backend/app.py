@@ -4,13 +4,19 @@ This module defines the FastAPI routes and application.
 """
 
 import os
+import json
+import time
+import asyncio
 import logging
-import re
 import traceback
 from typing import List, Dict, Any, Optional
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks
+from fastapi import (
+    FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks, Request, Response, Query, WebSocket,
+    WebSocketDisconnect
+)
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import shutil
 import uvicorn
@@ -25,29 +31,65 @@ try:
     from product_matcher import analyze_image, get_product_recommendations
 except ImportError as e:
     logging.error(f"Failed to import product_matcher: {e}")
-    # Define fallback functions
-    async def analyze_image(image_path):
+    # Define fallback functions (blocking, like the product_matcher ones they replace)
+    def analyze_image(image_path, fallback=True):
+        if not fallback:
+            return None
         return "I can see a product image, but I'm unable to analyze it in detail at the moment."
         
-    async def get_product_recommendations(image_description):
+    def get_product_recommendations(image_description):
         return "Based on what I can see, I would recommend checking our electronics or clothing categories."
 
 # Import our custom modules
-from products import products, get_product_by_id, get_product_summary, get_random_products
+from products import (
+    catalog_store, get_catalog, get_product_by_id, get_random_products, get_random_product_ids,
+    record_recommended_products, search_products
+)
+from product_search import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 from session import get_session, add_message_to_session, get_session_messages
+from response_parser import ParsedResponse, get_response_parser
+from prompts import (
+    IMAGE_MATCH_PROMPT, IMAGE_MATCH_CANDIDATES, IMAGE_MATCH_NO_CANDIDATES, IMAGE_FALLBACK_PROMPT, PRODUCT_MATCH_PROMPT
+)
+import semantic_cache
+from cache_warmer import cache_warmer, CACHE_WARM_ENABLED, WorkerActivityMiddleware
+from image_pipeline import StageTimer, get_candidate_prefilter, add_color_candidates
+from color_index import nearest_color_products
+from image_hash import compute_image_hash, lookup_analysis, remember_analysis
+from model_manager import model_manager, OLLAMA_WARMUP_ENABLED
+from ollama_pool import ollama_pool
+from rate_limit import RateLimitMiddleware, rate_limiter, retry_after_header
+from metrics import instrument, render_metrics, MetricsMiddleware, UPLOAD_SIZE, CHAT_WEBSOCKETS
+from tracing import TracingMiddleware, traced
+from log_config import configure_logging, get_payload_logger, Payload
 from ai_utils import (
     RecommendationGenerator, 
     ImageAnalyzer, 
-    ChatAssistant
+    ChatAssistant,
+    RECOMMENDATION_OUTPUT_MODE,
+    RECOMMENDATION_BATCH_CONCURRENCY,
+    RECOMMENDATION_BATCH_MAX_CONCURRENCY,
+    RECOMMENDATION_BATCH_MAX_QUERIES,
+    FALLBACK_REPLIES,
+    CHAT_EMPTY_REPLY,
+    CHAT_ERROR_REPLY,
+    PRODUCT_ANALYSIS_PROMPT,
+    analyze_image_with_ollama,
+    is_usable_image_description
 )
 
 # Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging("backend")
 logger = logging.getLogger(__name__)
+# Full model output is only logged for a sample of requests (see LOG_SAMPLE_RATES)
+payload_logger = get_payload_logger(__name__)
 
 # Create the FastAPI app
 app = FastAPI(title="Pocket AI E-commerce Agent")
 
+# Answer requests over their session's or client's rate limit with 429 (inside CORS, so browsers can read it)
+app.add_middleware(RateLimitMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -57,6 +99,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Record per-route request counts, latency and in-flight requests
+app.add_middleware(MetricsMiddleware)
+
+if CACHE_WARM_ENABLED:
+    # Let the cache warmers of all workers see this worker's live requests
+    app.add_middleware(WorkerActivityMiddleware)
+
+# Start (or continue, when the frontend sent X-Trace-Id) a trace for each request
+app.add_middleware(TracingMiddleware, service="backend")
+
 # Create upload directory if it doesn't exist
 os.makedirs("uploads", exist_ok=True)
 
@@ -70,6 +122,13 @@ class ChatRequest(BaseModel):
 class RecommendRequest(BaseModel):
     sessionId: Optional[str] = None
     query: str
+    structured: Optional[bool] = None  # Override RECOMMENDATION_OUTPUT_MODE for this request
+
+
+class BatchRecommendRequest(BaseModel):
+    queries: List[str]
+    structured: Optional[bool] = None  # Override RECOMMENDATION_OUTPUT_MODE for the whole batch
+    concurrency: Optional[int] = None  # Concurrent model calls (default RECOMMENDATION_BATCH_CONCURRENCY)
 
 
 # Define response models
@@ -92,9 +151,19 @@ class ImageSearchResponse(BaseModel):
     products: List[Dict[str, Any]]
 
 
+class ProductSearchResponse(BaseModel):
+    products: List[Dict[str, Any]]
+    total: int
+    facets: Dict[str, Any]
+    nextCursor: Optional[str] = None
+
+
 class HealthResponse(BaseModel):
     status: str
     timestamp: str
+    models: Optional[Dict[str, Any]] = None
+    catalog: Optional[Dict[str, Any]] = None
+    ollama: Optional[Dict[str, Any]] = None
 
 
 # Helper function to cleanup uploaded files
@@ -104,10 +173,12 @@ def remove_file(file_path: str):
         if os.path.exists(file_path):
             os.unlink(file_path)
     except Exception as e:
-        logger.error(f"Error removing file {file_path}: {str(e)}")
+        logger.error("Error removing file %s: %s", file_path, e)
 
 
 # Helper function to extract product IDs from AI recommendation text
+@instrument("extract_product_ids")
+@traced("extract_product_ids")
 def extract_product_ids_from_recommendation(recommendation_text: str) -> List[int]:
     """
     Extract product IDs from recommendation text.
@@ -118,82 +189,173 @@ def extract_product_ids_from_recommendation(recommendation_text: str) -> List[in
     Returns:
         A list of product IDs mentioned in the text
     """
-    mentioned_ids = []
-    valid_product_ids = [p["id"] for p in products]
-    
-    # Pattern 1: "Product ID: X" format
-    id_pattern = re.compile(r"product\s+id:\s*(\d+)", re.IGNORECASE)
-    for match in id_pattern.finditer(recommendation_text):
-        try:
-            product_id = int(match.group(1))
-            if product_id in valid_product_ids and product_id not in mentioned_ids:
-                mentioned_ids.append(product_id)
-        except (ValueError, IndexError):
-            continue
-    
-    # If we don't have 3 products yet, try extracting from exact product names
-    if len(mentioned_ids) < 3:
-        for product in products:
-            if product["id"] in mentioned_ids:
-                continue
-                
-            # Check for exact product name matches
-            if product["name"] in recommendation_text:
-                mentioned_ids.append(product["id"])
-                if len(mentioned_ids) >= 3:
-                    break
+    parsed = get_response_parser(get_catalog()).parse(recommendation_text)
+    mentioned_ids = parsed.ranked_ids(limit=3)
     
     # If we still don't have at least one product, return random products
-    if not mentioned_ids:
+    if mentioned_ids:
+        record_recommended_products(mentioned_ids)
+    else:
         logger.warning("No product IDs found in recommendation, using random products")
-        mentioned_ids = get_random_products(3)
-    
-    # Verify all IDs actually exist in the catalog
-    verified_ids = [pid for pid in mentioned_ids if pid in valid_product_ids]
+        mentioned_ids = get_random_product_ids(3, weighted=True)
     
-    # Log any discrepancies
-    if len(verified_ids) < len(mentioned_ids):
-        logger.warning(f"Removed {len(mentioned_ids) - len(verified_ids)} invalid product IDs from recommendations")
+    return mentioned_ids
+
+
+# Helper function to present structured recommendations to the frontend
+def render_structured_recommendation(parsed: ParsedResponse, product_ids: List[int]) -> str:
+    """
+    Render validated structured recommendations in the markdown layout the frontend parses.
     
-    return verified_ids[:3]  # Limit to 3 products
+    Args:
+        parsed: The validated structured response
+        product_ids: The product IDs to render, in order
+        
+    Returns:
+        Markdown recommendation text with one section per product
+    """
+    sections = []
+    for product_id in product_ids:
+        product = get_product_by_id(product_id)
+        if product is None:
+            continue
+        reason = parsed.reasons.get(product_id) or "Matches your request"
+        sections.append(
+            f"## {product['name']} (${product['price']})\n\n"
+            f"### Perfect Match Because:\n"
+            f"- [Relevance Score: {parsed.relevance_scores.get(product_id, 100)}/100] - {reason}\n\n"
+            f"Product ID: {product_id}"
+        )
+    return "\n\n".join(sections)
+
+
+# Lifecycle hooks
+@app.on_event("startup")
+async def start_model_manager():
+    """Preload the Ollama models and start keep-alive pings so the first user doesn't pay the load time."""
+    if OLLAMA_WARMUP_ENABLED:
+        model_manager.start()
+
+
+@app.on_event("startup")
+async def start_catalog_reload():
+    """Build the catalog indexes in the background and start watching the catalog file."""
+    catalog_store.start()
+
+
+@app.on_event("startup")
+async def start_semantic_cache_invalidation():
+    """Drop cached recommendations of previous catalog versions when the catalog is reloaded."""
+    catalog_store.on_reload(lambda catalog: semantic_cache.invalidate("recommend", catalog.version))
+
+
+@app.on_event("startup")
+async def start_cache_warmer():
+    """Precompute recommendations for likely queries at startup and after each catalog reload."""
+    if CACHE_WARM_ENABLED:
+        catalog_store.on_reload(cache_warmer.on_catalog_reload)
+        cache_warmer.start()
+
+
+@app.on_event("shutdown")
+async def stop_model_manager():
+    """Stop the keep-alive pings."""
+    await model_manager.stop()
+
+
+@app.on_event("shutdown")
+async def stop_cache_warmer():
+    """Stop the cache warmer."""
+    await cache_warmer.stop()
+
+
+@app.on_event("shutdown")
+async def stop_catalog_reload():
+    """Stop watching the catalog file."""
+    catalog_store.stop()
 
 
 # API Routes
 @app.get("/api/health", response_model=HealthResponse)
 async def health_check():
-    """Health check endpoint to verify the API is running."""
+    """Health check endpoint to verify the API is running and report model residency."""
     from datetime import datetime
     return {
         "status": "OK",
-        "timestamp": datetime.now().isoformat()
+        "timestamp": datetime.now().isoformat(),
+        "models": model_manager.residency(),
+        "catalog": {"version": catalog_store.current.version, "products": len(catalog_store.current),
+                    "source": catalog_store.current.source},
+        "ollama": {"hosts": ollama_pool.urls, "hedging": ollama_pool.hedge_enabled,
+                   "latency": ollama_pool.tracker.snapshot()}
     }
 
 
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Metrics endpoint in the Prometheus text exposition format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/products", response_model=ProductSearchResponse)
+async def list_products(
+    category: List[str] = Query(default=[]),
+    type: List[str] = Query(default=[]),
+    tag: List[str] = Query(default=[]),
+    minPrice: Optional[float] = Query(default=None, ge=0),
+    maxPrice: Optional[float] = Query(default=None, ge=0),
+    sort: str = "id",
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    """
+    Browse the catalog with combined filters, sorting and cursor pagination.
+
+    Repeated category/type parameters match any of the values, repeated tag parameters
+    must all match. Facet counts cover every matching product, not just the page.
+    """
+    try:
+        result = search_products(category, type, tag, minPrice, maxPrice, sort, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result["products"] = [dict(product) for product in result["products"]]
+    return result
+
+
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, response: Response):
     """Chat endpoint for general conversation with the AI assistant."""
     try:
         # Get or create session
-        session_id, session = get_session(request.sessionId)
+        session_id, session = await get_session(request.sessionId)
         
         # Add user message to history
-        add_message_to_session(session_id, "user", request.message)
+        await add_message_to_session(session_id, "user", request.message)
         
         # Get messages for context
-        messages = get_session_messages(session_id)
+        messages = await get_session_messages(session_id)
         
-        # Get AI response
-        bot_reply = await ChatAssistant.get_chat_response(messages)
+        # Get AI response; a first turn has no history, so near-duplicate openers can share a reply
+        if [message["role"] for message in messages if message["role"] != "system"] == ["user"]:
+            first_turn = list(messages)
+            bot_reply, cache_result = await semantic_cache.cached_response(
+                "chat", request.message, lambda: ChatAssistant.get_chat_response(first_turn),
+                is_cacheable=lambda reply: reply not in FALLBACK_REPLIES,
+                agree=semantic_cache.agree_by_embedding()
+            )
+            response.headers["X-Semantic-Cache"] = cache_result
+        else:
+            bot_reply = await ChatAssistant.get_chat_response(messages)
         
         # Add bot response to history
-        add_message_to_session(session_id, "assistant", bot_reply)
+        await add_message_to_session(session_id, "assistant", bot_reply)
         
         return {
             "sessionId": session_id,
             "reply": bot_reply
         }
     except Exception as e:
-        logger.error(f"Chat error: {str(e)}")
+        logger.error("Chat error: %s", e)
         logger.error(traceback.format_exc())
         # Return a friendly error message
         return {
@@ -202,210 +364,539 @@ async def chat(request: ChatRequest):
         }
 
 
+# The open chat WebSocket of each session; a newer connection replaces the older one
+chat_connections: Dict[str, WebSocket] = {}
+
+
+async def stream_chat_reply(websocket: WebSocket, session_id: str, messages: List[Dict[str, str]]) -> None:
+    """
+    Stream one assistant reply over a chat WebSocket and add it to the session history.
+    
+    Args:
+        websocket: The client connection
+        session_id: The session the reply belongs to
+        messages: The session's message list, ending with the user's message
+    """
+    parts: List[str] = []
+    await websocket.send_json({"type": "start"})
+    try:
+        async for chunk in ChatAssistant.stream_chat_response(list(messages)):
+            parts.append(chunk)
+            await websocket.send_json({"type": "token", "text": chunk})
+    except asyncio.CancelledError:
+        # Cancelled by the user (or the connection closed): keep what was generated so far
+        reply = "".join(parts)
+        if reply:
+            await add_message_to_session(session_id, "assistant", reply)
+        try:
+            await websocket.send_json({"type": "cancelled", "reply": reply})
+        except Exception:
+            pass
+        raise
+    except Exception as e:
+        logger.error("Chat stream error: %s", e)
+        await websocket.send_json({"type": "error", "error": CHAT_ERROR_REPLY})
+        return
+    reply = "".join(parts) or CHAT_EMPTY_REPLY
+    await add_message_to_session(session_id, "assistant", reply)
+    await websocket.send_json({"type": "done", "reply": reply})
+
+
+@app.websocket("/api/chat/ws")
+async def chat_websocket(websocket: WebSocket, sessionId: Optional[str] = None):
+    """
+    Chat over one persistent connection per session, with replies streamed token by token.
+    
+    Client messages: {"type": "message", "message": "..."}, {"type": "cancel"} and {"type": "ping"}.
+    Server messages: {"type": "session", "sessionId"} after connecting; per reply {"type": "start"},
+    {"type": "token", "text"}... and one of {"type": "done", "reply"}, {"type": "cancelled", "reply"}
+    or {"type": "error", "error"}; {"type": "pong"}.
+    """
+    await websocket.accept()
+    session_id, _ = await get_session(sessionId)
+    client = rate_limiter.client_address(websocket.client.host if websocket.client else None,
+                                         websocket.headers.get("x-forwarded-for"))
+    previous = chat_connections.get(session_id)
+    chat_connections[session_id] = websocket
+    if previous is not None:
+        try:
+            await previous.close(code=4000, reason="Replaced by a newer connection")
+        except Exception:
+            pass
+    CHAT_WEBSOCKETS.inc()
+    reply_task: Optional[asyncio.Task] = None
+    try:
+        await websocket.send_json({"type": "session", "sessionId": session_id})
+        while True:
+            try:
+                data = json.loads(await websocket.receive_text())
+                kind = data.get("type")
+            except (ValueError, AttributeError):
+                await websocket.send_json({"type": "error", "error": "Messages must be JSON objects"})
+                continue
+            if kind == "cancel":
+                if reply_task is not None and not reply_task.done():
+                    reply_task.cancel()
+            elif kind == "ping":
+                await websocket.send_json({"type": "pong"})
+            elif kind == "message":
+                text = str(data.get("message") or "").strip()
+                if not text:
+                    await websocket.send_json({"type": "error", "error": "Empty message"})
+                elif reply_task is not None and not reply_task.done():
+                    await websocket.send_json({"type": "error", "error": "A reply is already in progress"})
+                elif (wait := await rate_limiter.acquire("/api/chat", client, session_id)) > 0:
+                    # Each message is charged like a /api/chat request
+                    await websocket.send_json({"type": "error", "retryAfter": int(retry_after_header(wait)),
+                                               "error": f"Too many messages, retry in {retry_after_header(wait)} seconds"})
+                else:
+                    # The history is read per message, since other workers may have added to it
+                    await add_message_to_session(session_id, "user", text)
+                    messages = await get_session_messages(session_id)
+                    reply_task = asyncio.create_task(stream_chat_reply(websocket, session_id, messages))
+            else:
+                await websocket.send_json({"type": "error", "error": f"Unknown message type: {kind}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if reply_task is not None and not reply_task.done():
+            reply_task.cancel()
+        if chat_connections.get(session_id) is websocket:
+            del chat_connections[session_id]
+        CHAT_WEBSOCKETS.dec()
+
+
+def build_recommendation(query: str, model_output: str, structured: bool, catalog, parser) -> Dict[str, Any]:
+    """
+    Turn a model recommendation into the products and text returned to the client.
+    
+    Args:
+        query: The user's query
+        model_output: Markdown recommendation, or JSON when structured
+        structured: Whether model_output is schema-constrained JSON
+        catalog: The catalog snapshot the recommendation was generated from
+        parser: The response parser of that catalog
+        
+    Returns:
+        A dictionary with recommendationText, products and, when nothing relevant matched, error
+    """
+    if structured:
+        # Schema-constrained JSON: IDs and scores come validated, no text scraping needed
+        parsed = parser.parse_structured(model_output)
+        mentioned_ids = parsed.ranked_ids(limit=3)
+        record_recommended_products(mentioned_ids)
+        payload_logger.info("Structured recommendations for %r: %s", query, Payload(model_output))
+    else:
+        payload_logger.info("Recommendation text for %r: %s", query, Payload(model_output))
+        
+        # Extract product IDs and relevance scores from the recommendation in one pass
+        parsed = parser.parse(model_output)
+        mentioned_ids = parsed.ranked_ids(limit=3)
+        if mentioned_ids:
+            record_recommended_products(mentioned_ids)
+        else:
+            logger.warning("No product IDs found in recommendation, using random products")
+            mentioned_ids = get_random_product_ids(3, weighted=True)
+    relevance_scores = parsed.relevance_scores
+    
+    # Get the full product details for recommended items
+    recommended_products = [product for product in map(catalog.get, mentioned_ids)
+                            if product is not None]
+        
+    # Filter products by relevance score (minimum 70)
+    min_relevance_score = 70
+    filtered_products = []
+    for product in recommended_products:
+        product_id = product['id']
+        if product_id in relevance_scores:
+            score = relevance_scores[product_id]
+            if score >= min_relevance_score:
+                filtered_products.append(product)
+            else:
+                logger.debug("Filtering out product %s due to low relevance score: %s", product_id, score)
+        else:
+            # If no score found, include the product (backward compatibility)
+            filtered_products.append(product)
+            
+    recommended_products = filtered_products
+    
+    recommendation_text = model_output
+    if structured:
+        recommendation_text = render_structured_recommendation(
+            parsed, [product["id"] for product in recommended_products]
+        )
+    
+    logger.info("Recommendation served", extra={
+        "query": query,
+        "structured": structured,
+        "candidateIds": mentioned_ids,
+        "productIds": [product["id"] for product in recommended_products],
+        "scores": {product_id: relevance_scores.get(product_id) for product_id in mentioned_ids},
+    })
+    
+    # If no products found, return error message
+    if not recommended_products:
+        logger.warning("No highly relevant product matches found!")
+        return {
+            "recommendationText": recommendation_text,
+            "products": [],
+            "error": "No highly relevant product matches found for your query. Please try a different search term."
+        }
+    
+    return {
+        "recommendationText": recommendation_text,
+        "products": recommended_products
+    }
+
+
 @app.post("/api/recommend", response_model=RecommendResponse)
-async def recommend(request: RecommendRequest):
+async def recommend(request: RecommendRequest, response: Response):
     """Product recommendation endpoint based on text queries."""
     try:
-        logger.info(f"\n=== PRODUCT RECOMMENDATION REQUEST ===")
-        logger.info(f"Query: {request.query}")
+        logger.debug("Recommendation request: %s", request.query)
         
         # Get or create session
-        session_id, _ = get_session(request.sessionId)
+        session_id, _ = await get_session(request.sessionId)
         
         # Get product summary for the AI prompt
-        product_summary = get_product_summary()
-        
-        # Get AI recommendations
-        logger.info("Calling Ollama API for recommendations...")
-        recommendation_text = await RecommendationGenerator.get_product_recommendations(
-            request.query, product_summary
-        )
-        logger.info("Received recommendation text from Ollama")
-        
-        # Log the recommendation text for debugging
-        logger.info("\nAI RECOMMENDATION TEXT:")
-        logger.info("------------------------")
-        logger.info(recommendation_text)
-        logger.info("------------------------\n")
-        
-        # Extract product IDs from the recommendation
-        mentioned_ids = extract_product_ids_from_recommendation(recommendation_text)
-        logger.info(f"Extracted product IDs: {mentioned_ids}")
-        
-        # Get the full product details for recommended items
-        recommended_products = [get_product_by_id(product_id) for product_id in mentioned_ids 
-                                if get_product_by_id(product_id) is not None]
-        
-        # Extract relevance scores from recommendation text
-        relevance_scores = {}
-        score_pattern = re.compile(r"Relevance Score:\s*(\d+)/100.*?Product ID:\s*(\d+)", re.DOTALL)
-        for match in score_pattern.finditer(recommendation_text):
-            score = int(match.group(1))
-            product_id = int(match.group(2))
-            relevance_scores[product_id] = score
-            
-        # Filter products by relevance score (minimum 70)
-        min_relevance_score = 70
-        filtered_products = []
-        for product in recommended_products:
-            product_id = product['id']
-            if product_id in relevance_scores:
-                score = relevance_scores[product_id]
-                logger.info(f"Product {product['name']} (ID: {product_id}) has relevance score: {score}")
-                if score >= min_relevance_score:
-                    filtered_products.append(product)
-                else:
-                    logger.info(f"Filtering out product {product['name']} due to low relevance score: {score}")
-            else:
-                # If no score found, include the product (backward compatibility)
-                filtered_products.append(product)
-                
-        recommended_products = filtered_products
+        catalog = get_catalog()
+        product_summary = catalog.summary
         
-        logger.info(f"Found {len(recommended_products)} relevant products: {[p['name'] for p in recommended_products]}")
+        parser = get_response_parser(catalog)
+        use_structured = (request.structured if request.structured is not None
+                          else RECOMMENDATION_OUTPUT_MODE == "json")
         
-        # If no products found, return error message
-        if not recommended_products:
-            logger.warning("No highly relevant product matches found!")
-            return {
-                "sessionId": session_id,
-                "recommendationText": recommendation_text,
-                "products": [],
-                "error": "No highly relevant product matches found for your query. Please try a different search term."
-            }
+        if use_structured:
+            def generate():
+                logger.debug("Calling Ollama API for structured recommendations")
+                return RecommendationGenerator.get_structured_recommendations(request.query, product_summary)
+        else:
+            def generate():
+                # Get AI recommendations
+                logger.debug("Calling Ollama API for recommendations")
+                return RecommendationGenerator.get_product_recommendations(request.query, product_summary)
         
-        logger.info(f"Sending response with {len(recommended_products)} products")
-        logger.info("=== END OF REQUEST ===\n")
+        # Near-duplicate queries against the same catalog version reuse an earlier model output
+        model_output, cache_result = await semantic_cache.cached_response(
+            semantic_cache.recommendation_namespace(use_structured), request.query, generate,
+            generation=catalog.version,
+            is_cacheable=lambda output: bool(parser.recommended_ids(output, use_structured)),
+            agree=lambda cached, fresh: bool(set(parser.recommended_ids(cached, use_structured))
+                                             & set(parser.recommended_ids(fresh, use_structured)))
+        )
+        response.headers["X-Semantic-Cache"] = cache_result
         
-        return {
-            "sessionId": session_id,
-            "recommendationText": recommendation_text,
-            "products": recommended_products
-        }
+        result = build_recommendation(request.query, model_output, use_structured, catalog, parser)
+        return dict(result, sessionId=session_id)
     except Exception as e:
-        logger.error(f"Recommendation error: {str(e)}")
+        logger.error("Recommendation error: %s", e)
         raise HTTPException(status_code=500, detail=f"Recommendation service error: {str(e)}")
 
 
+@app.post("/api/recommend/batch")
+async def recommend_batch(request: BatchRecommendRequest, http_request: Request):
+    """
+    Recommendations for many queries, streamed as NDJSON in completion order.
+    
+    Every query uses the same catalog snapshot, summary and parser. Each line carries the
+    query index; the last line is a summary with the aggregate throughput. The batch is
+    rate-limited per query, like that many /api/recommend requests.
+    """
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="No queries given")
+    if len(request.queries) > RECOMMENDATION_BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {RECOMMENDATION_BATCH_MAX_QUERIES} queries per batch")
+    
+    route = "/api/recommend/batch"
+    session_id = http_request.headers.get("x-session-id")
+    max_queries = rate_limiter.max_items(route, session_id)
+    if max_queries is not None and len(request.queries) > max_queries:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {max_queries} queries per batch under the rate limit")
+    client = rate_limiter.client_address(http_request.client.host if http_request.client else None,
+                                         http_request.headers.get("x-forwarded-for"))
+    wait = await rate_limiter.acquire(route, client, session_id, items=len(request.queries))
+    if wait > 0:
+        raise HTTPException(status_code=429, detail=f"Too many requests, retry in {retry_after_header(wait)} seconds",
+                            headers={"Retry-After": retry_after_header(wait)})
+    
+    catalog = get_catalog()
+    product_summary = catalog.summary
+    parser = get_response_parser(catalog)
+    use_structured = (request.structured if request.structured is not None
+                      else RECOMMENDATION_OUTPUT_MODE == "json")
+    concurrency = max(1, min(request.concurrency or RECOMMENDATION_BATCH_CONCURRENCY,
+                             RECOMMENDATION_BATCH_MAX_CONCURRENCY))
+    logger.info("Recommendation batch started", extra={
+        "queries": len(request.queries), "concurrency": concurrency, "catalogVersion": catalog.version})
+    
+    async def stream_results():
+        start = time.perf_counter()
+        completed = failed = 0
+        results = RecommendationGenerator.get_batch_recommendations(
+            request.queries, product_summary, structured=use_structured, concurrency=concurrency
+        )
+        try:
+            async for index, model_output, seconds in results:
+                query = request.queries[index]
+                try:
+                    line = build_recommendation(query, model_output, use_structured, catalog, parser)
+                    line["products"] = [dict(product) for product in line["products"]]
+                except Exception as e:
+                    logger.error("Batch recommendation %s error: %s", index, e)
+                    line = {"recommendationText": "", "products": [], "error": f"Recommendation error: {e}"}
+                failed += "error" in line
+                completed += 1
+                yield json.dumps(dict(line, index=index, query=query, latencyMs=round(seconds * 1000, 1))) + "\n"
+        finally:
+            await results.aclose()
+        elapsed = time.perf_counter() - start
+        summary = {
+            "queries": len(request.queries),
+            "completed": completed,
+            "withoutProducts": failed,
+            "concurrency": concurrency,
+            "elapsedSeconds": round(elapsed, 3),
+            "queriesPerSecond": round(completed / elapsed, 3) if elapsed > 0 else None,
+            "catalogVersion": catalog.version,
+        }
+        logger.info("Recommendation batch finished", extra=summary)
+        yield json.dumps({"summary": summary}) + "\n"
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+def build_image_match_prompt(image_description: str, product_summary: str, use_vision_model: bool,
+                             candidates: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, str]]:
+    """
+    Build the product matching prompt for an image search.
+    
+    Args:
+        image_description: Description of the uploaded image
+        product_summary: Summary of the whole catalog snapshot
+        use_vision_model: Whether the description came from the vision model
+        candidates: Prefiltered products most likely to match, if any
+        
+    Returns:
+        The chat messages for the text model
+    """
+    # Instructions and the whole catalog first, so the prefix is shared by every upload;
+    # the image description and the shortlist, which vary per upload, last (see prompts.py)
+    if use_vision_model:
+        if candidates:
+            shortlist = IMAGE_MATCH_CANDIDATES.format(products="\n".join(
+                f"- Product ID: {product['id']} - {product['name']}" for product in candidates
+            ))
+        else:
+            shortlist = IMAGE_MATCH_NO_CANDIDATES
+        return IMAGE_MATCH_PROMPT.messages(product_summary, description=image_description, candidates=shortlist)
+    
+    # Fallback when vision model isn't available
+    return IMAGE_FALLBACK_PROMPT.messages(product_summary)
+
+
 @app.post("/api/image-search", response_model=ImageSearchResponse)
 async def image_search(
     background_tasks: BackgroundTasks,
+    response: Response,
     image: UploadFile = File(...),
     sessionId: Optional[str] = Form(None)
 ):
-    """Image search endpoint to find products based on uploaded images."""
-    logger.info(f"=== IMAGE SEARCH REQUEST ===")
-    logger.info(f"Received image: {image.filename}")
+    """
+    Image search endpoint to find products based on uploaded images.
+    
+    Vision analysis is streamed while the catalog summary is prepared concurrently,
+    and the streamed tokens are used to prefilter candidate products before the
+    description is complete. Products closest in color to the upload join the shortlist,
+    and are returned directly when the vision model is unavailable. Near-duplicates of earlier uploads reuse their description,
+    and their matches while the catalog is unchanged (see X-Image-Cache).
+    Per-stage durations are reported in the Server-Timing header.
+    """
+    logger.debug("Image search request: %s", image.filename)
+    timer = StageTimer()
+    request_start = time.perf_counter()
     
     try:
         if not image.filename:
             raise HTTPException(status_code=400, detail="No image file uploaded")
         
         # Get or create session
-        session_id, _ = get_session(sessionId)
-        
-        # Create uploads directory if it doesn't exist
-        upload_dir = "uploads"
-        os.makedirs(upload_dir, exist_ok=True)
+        session_id, _ = await get_session(sessionId)
         
-        # Create a unique filename to avoid conflicts
-        from datetime import datetime
-        import uuid
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_id = str(uuid.uuid4())[:8]
-        file_ext = os.path.splitext(image.filename)[1]
-        safe_filename = f"{timestamp}_{unique_id}{file_ext}"
-        file_path = os.path.join(upload_dir, safe_filename)
-        
-        # Save the uploaded file
-        logger.info(f"Saving image to: {file_path}")
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
+        with timer.stage("upload"):
+            # Create uploads directory if it doesn't exist
+            upload_dir = "uploads"
+            os.makedirs(upload_dir, exist_ok=True)
+            
+            # Create a unique filename to avoid conflicts
+            from datetime import datetime
+            import uuid
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            unique_id = str(uuid.uuid4())[:8]
+            file_ext = os.path.splitext(image.filename)[1]
+            safe_filename = f"{timestamp}_{unique_id}{file_ext}"
+            file_path = os.path.join(upload_dir, safe_filename)
+            
+            # Save the uploaded file
+            logger.debug("Saving image to: %s", file_path)
+            with open(file_path, "wb") as buffer:
+                shutil.copyfileobj(image.file, buffer)
+            UPLOAD_SIZE.labels("/api/image-search").observe(os.path.getsize(file_path))
         
         # Schedule file cleanup
         background_tasks.add_task(remove_file, file_path)
         
-        # Try to use vision model for image analysis
-        use_vision_model = True
-        try:
-            # Analyze the image
-            logger.info("Analyzing image with Ollama vision model...")
-            image_description = await ImageAnalyzer.analyze_product_image(file_path)
-            logger.info("Image analysis successful")
-        except Exception as e:
-            logger.warning(f"Vision model error: {str(e)}")
-            use_vision_model = False
-            image_description = "Image analysis is currently limited. We've selected some products based on popular categories."
+        with timer.stage("hash"):
+            upload_hash = await compute_image_hash(file_path)
+            duplicate = lookup_analysis("/api/image-search", upload_hash)
         
-        # Get product summary for the AI prompt
-        product_summary = get_product_summary()
+        catalog = get_catalog()
+        if duplicate is not None and duplicate["catalogVersion"] == catalog.version and duplicate["productIds"]:
+            matched_products = [product for product in map(catalog.get, duplicate["productIds"])
+                                if product is not None]
+            if matched_products:
+                timer.record("total", (time.perf_counter() - request_start) * 1000)
+                response.headers["Server-Timing"] = timer.server_timing_header()
+                response.headers["X-Image-Cache"] = "hit"
+                logger.info("Image search served from a near-duplicate upload", extra={
+                    "productIds": [product["id"] for product in matched_products],
+                    "timings": timer.timings,
+                })
+                return {
+                    "sessionId": session_id,
+                    "imageDescription": duplicate["imageDescription"],
+                    "matchExplanation": duplicate["matchExplanation"],
+                    "products": matched_products
+                }
+        
+        prefilter = get_candidate_prefilter(catalog).session()
+        
+        async def analyze_image_stage():
+            """Stream the vision analysis, feeding the prefilter as tokens arrive."""
+            if duplicate is not None:
+                # A near-duplicate was analyzed before; only the match has to be redone
+                prefilter.feed(duplicate["imageDescription"])
+                return duplicate["imageDescription"], True
+            with timer.stage("vision"):
+                vision_start = time.perf_counter()
+                chunks = []
+                try:
+                    logger.debug("Streaming image analysis from Ollama vision model...")
+                    async for chunk in ImageAnalyzer.stream_product_image(file_path):
+                        if not chunks:
+                            timer.record("vision_first_token", (time.perf_counter() - vision_start) * 1000)
+                        chunks.append(chunk)
+                        prefilter.feed(chunk)
+                    description = "".join(chunks).strip()
+                    if is_usable_image_description(description):
+                        logger.debug("Image analysis successful")
+                        return description, True
+                    logger.warning("Streamed image analysis was unusable, trying other methods")
+                except Exception as e:
+                    logger.warning("Streaming vision analysis failed: %s", e)
+                
+                try:
+                    # Fall back to the CLI/API methods; ImageAnalyzer would hide a failure behind generic text
+                    description = await analyze_image_with_ollama(file_path, PRODUCT_ANALYSIS_PROMPT)
+                    if is_usable_image_description(description):
+                        prefilter.feed(description)
+                        return description, True
+                    logger.warning("Vision model returned an unusable analysis")
+                except Exception as e:
+                    logger.warning("Vision model error: %s", e)
+                return "Image analysis is currently limited. We've selected some products based on popular categories.", False
+        
+        async def prepare_catalog_stage():
+            """Build the full catalog summary and the fallback prompt while vision runs."""
+            with timer.stage("catalog"):
+                product_summary = catalog.summary
+                fallback_prompt = build_image_match_prompt("", product_summary, use_vision_model=False)
+                return product_summary, fallback_prompt
+        
+        async def match_colors_stage():
+            """Find the products closest in color to the upload while vision runs."""
+            with timer.stage("colors"):
+                return await nearest_color_products(catalog, file_path)
+        
+        (image_description, use_vision_model), (product_summary, fallback_prompt), color_products = await asyncio.gather(
+            analyze_image_stage(), prepare_catalog_stage(), match_colors_stage()
+        )
+        
+        if not use_vision_model and color_products:
+            # Without a description the colors are the best evidence; no matching call needed
+            matched_products = color_products[:3]
+            timer.record("total", (time.perf_counter() - request_start) * 1000)
+            response.headers["Server-Timing"] = timer.server_timing_header()
+            response.headers["X-Image-Cache"] = "bypass" if upload_hash is None else "miss"
+            logger.info("Image search served by color", extra={
+                "productIds": [product["id"] for product in matched_products],
+                "timings": timer.timings,
+            })
+            return {
+                "sessionId": session_id,
+                "imageDescription": image_description,
+                "matchExplanation": "These products are the closest in color to your image.",
+                "products": matched_products
+            }
         
         # Create prompt for matching products based on image description
-        if use_vision_model:
-            logger.info("Using vision model results for product matching")
-            match_prompt = [
-                {
-                    "role": "system",
-                    "content": "You are Pocket AI, a product matching specialist for an e-commerce platform. Your task is to find products in our catalog that match what's shown in a user's image."
-                },
-                {
-                    "role": "user",
-                    "content": f"""Based on this description of an image: "{image_description}"
-
-Here are the available products in our catalog:
-{product_summary}
-
-Find exactly 3 products from our catalog that best match what's shown in the image. For each product:
-1. Clearly state the product ID number (e.g., "Product ID: 7")
-2. Explain specifically why this product matches the image
-3. Highlight the features that are similar to what's in the image
-
-Format your response to clearly highlight the product IDs so they can be easily extracted. Be accurate and precise in your matching."""
-                }
-            ]
-        else:
-            # Fallback when vision model isn't available
-            logger.info("Using fallback for product recommendations (vision model failed)")
-            match_prompt = [
-                {
-                    "role": "system",
-                    "content": "You are Pocket AI, a product recommendation specialist for an e-commerce platform."
-                },
-                {
-                    "role": "user",
-                    "content": f"""A user has uploaded an image, but we can't analyze it directly. Let's recommend some diverse products that might be useful.
-
-Here are the available products in our catalog:
-{product_summary}
-
-Please recommend 3 diverse products from different categories that a typical shopper might be interested in. For each product:
-1. Clearly state the product ID number (e.g., "Product ID: 7")
-2. Explain why this product would appeal to shoppers
-3. Mention its key features and benefits
-
-Format your response to clearly highlight the product IDs so they can be easily extracted."""
-                }
-            ]
+        with timer.stage("prefilter"):
+            if use_vision_model:
+                candidates = add_color_candidates(prefilter.candidates(), color_products)
+                if candidates:
+                    logger.debug("Prefiltered catalog to %s candidate products", len(candidates))
+                logger.debug("Using vision model results for product matching")
+                match_prompt = build_image_match_prompt(image_description, product_summary, use_vision_model=True,
+                                                        candidates=candidates)
+            else:
+                logger.debug("Using fallback for product recommendations (vision model failed)")
+                match_prompt = fallback_prompt
         
         # Get AI-generated product matches
-        logger.info("Getting product matches from Ollama...")
-        match_explanation = await ChatAssistant.get_chat_response(match_prompt)
+        with timer.stage("match"):
+            logger.debug("Getting product matches from Ollama...")
+            match_explanation = await ChatAssistant.get_chat_response(match_prompt)
         
-        # Extract product IDs from the match explanation
-        mentioned_ids = extract_product_ids_from_recommendation(match_explanation)
-        logger.info(f"Extracted product IDs: {mentioned_ids}")
+        with timer.stage("extract"):
+            # Extract product IDs from the match explanation
+            mentioned_ids = extract_product_ids_from_recommendation(match_explanation)
+            logger.debug("Extracted product IDs: %s", mentioned_ids)
+            
+            # Get the full product details for matched items
+            matched_products = [product for product in map(catalog.get, mentioned_ids)
+                                if product is not None]
+            
+            # If no products found, use random products
+            matched_ids = [product["id"] for product in matched_products]
+            if not matched_products and color_products:
+                logger.warning("No products matched, using the products closest in color instead")
+                matched_products = color_products[:3]
+            elif not matched_products:
+                logger.warning("No products matched, using random products instead")
+                matched_products = get_random_products(3, weighted=True)
         
-        # Get the full product details for matched items
-        matched_products = [get_product_by_id(product_id) for product_id in mentioned_ids 
-                           if get_product_by_id(product_id) is not None]
+        if use_vision_model and is_usable_image_description(image_description):
+            # Never let near-duplicates reuse a failed analysis
+            remember_analysis("/api/image-search", upload_hash, {
+                "catalogVersion": catalog.version,
+                "imageDescription": image_description,
+                "matchExplanation": match_explanation,
+                "productIds": matched_ids,
+            })
         
-        # If no products found, use random products
-        if not matched_products:
-            logger.warning("No products matched, using random products instead")
-            matched_products = get_random_products(3)
+        timer.record("total", (time.perf_counter() - request_start) * 1000)
+        response.headers["Server-Timing"] = timer.server_timing_header()
+        if upload_hash is None:
+            response.headers["X-Image-Cache"] = "bypass"
+        else:
+            response.headers["X-Image-Cache"] = "description" if duplicate is not None else "miss"
         
-        logger.info(f"Returning {len(matched_products)} products")
-        logger.info("=== END OF IMAGE SEARCH REQUEST ===")
+        logger.info("Image search served", extra={
+            "productIds": [product["id"] for product in matched_products],
+            "usedVisionModel": use_vision_model,
+            "timings": timer.timings,
+        })
         
         return {
             "sessionId": session_id,
@@ -416,26 +907,31 @@ Format your response to clearly highlight the product IDs so they can be easily
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Image search error: {str(e)}")
+        logger.error("Image search error: %s", e)
         raise HTTPException(status_code=500, detail=f"Image search error: {str(e)}")
 
 
 @app.post("/api/product-match", response_model=ImageSearchResponse)
 async def product_match(
     background_tasks: BackgroundTasks,
+    response: Response,
     image: UploadFile = File(...),
     sessionId: Optional[str] = Form(None)
 ):
-    """Product matcher endpoint using the dedicated product_matcher.py functionality."""
-    logger.info(f"=== PRODUCT MATCHER REQUEST ===")
-    logger.info(f"Received image: {image.filename}")
+    """
+    Product matcher endpoint using the dedicated product_matcher.py functionality.
+    
+    Near-duplicates of earlier uploads reuse their analysis (see X-Image-Cache). When no
+    product is matched, the product closest in color is used if catalog images are indexed.
+    """
+    logger.debug("Product matcher request: %s", image.filename)
     
     try:
         if not image.filename:
             raise HTTPException(status_code=400, detail="No image file uploaded")
         
         # Get or create session
-        session_id, _ = get_session(sessionId)
+        session_id, _ = await get_session(sessionId)
         
         # Create uploads directory if it doesn't exist
         upload_dir = "uploads"
@@ -451,39 +947,65 @@ async def product_match(
         file_path = os.path.join(upload_dir, safe_filename)
         
         # Save the uploaded file
-        logger.info(f"Saving image to: {file_path}")
+        logger.debug("Saving image to: %s", file_path)
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(image.file, buffer)
+        UPLOAD_SIZE.labels("/api/product-match").observe(os.path.getsize(file_path))
         
         # Schedule file cleanup
         background_tasks.add_task(remove_file, file_path)
         
+        upload_hash = await compute_image_hash(file_path)
+        duplicate = lookup_analysis("/api/product-match", upload_hash)
+        catalog = get_catalog()
+        if duplicate is not None and duplicate["catalogVersion"] == catalog.version:
+            matched_product = catalog.get(duplicate["productId"])
+            if matched_product is not None:
+                response.headers["X-Image-Cache"] = "hit"
+                logger.info("Product match served from a near-duplicate upload",
+                            extra={"productIds": [matched_product["id"]]})
+                return {
+                    "sessionId": session_id,
+                    "imageDescription": duplicate["imageDescription"],
+                    "matchExplanation": duplicate["matchExplanation"],
+                    "products": [matched_product]
+                }
+        if upload_hash is None:
+            response.headers["X-Image-Cache"] = "bypass"
+        else:
+            response.headers["X-Image-Cache"] = "description" if duplicate is not None else "miss"
+        
         try:
-            # Use product_matcher.py to analyze the image
-            logger.info("Analyzing image with product_matcher...")
-            image_description = analyze_image(file_path)
+            if duplicate is not None:
+                # A near-duplicate was analyzed before; only the match has to be redone
+                image_description = duplicate["imageDescription"]
+            else:
+                # Use product_matcher.py to analyze the image (blocking, so off the event loop)
+                logger.debug("Analyzing image with product_matcher...")
+                image_description = await run_in_threadpool(analyze_image, file_path, fallback=False)
+            described = bool(image_description)
             
-            if not image_description:
+            if not described:
                 logger.warning("Product matcher image analysis returned None, using fallback")
                 image_description = "Image analysis is currently limited. We've selected a product based on popular categories."
             else:
-                logger.info("Image analysis successful")
-                logger.info(f"Image description: {image_description[:100]}...")
+                logger.debug("Image analysis successful")
+                payload_logger.info("Image description: %s", Payload(image_description))
                 
             # Use product_matcher.py to get product recommendations
-            logger.info("Getting best product match from product_matcher...")
-            match_explanation = get_product_recommendations(image_description)
+            logger.debug("Getting best product match from product_matcher...")
+            match_explanation = await run_in_threadpool(get_product_recommendations, image_description)
             
             if not match_explanation:
                 logger.warning("Product matching returned None, using fallback")
                 match_explanation = "We couldn't find a specific product match. Here's a popular item you might be interested in."
-                matched_products = [get_random_products(1)[0]]
+                matched_products = await nearest_color_products(catalog, file_path, 1) or get_random_products(1, weighted=True)
             else:
-                logger.info(f"Match explanation received: {len(match_explanation)} chars")
+                logger.debug("Match explanation received: %s chars", len(match_explanation))
                 
                 # Extract product IDs from the match explanation
                 mentioned_ids = extract_product_ids_from_recommendation(match_explanation)
-                logger.info(f"Extracted product IDs: {mentioned_ids}")
+                logger.debug("Extracted product IDs: %s", mentioned_ids)
                 
                 # Get the full product details for matched items
                 if mentioned_ids:
@@ -495,40 +1017,25 @@ async def product_match(
                 
                 # If no product found, use a random product
                 if not matched_products:
-                    logger.warning("No product matched, using random product instead")
-                    matched_products = [get_random_products(1)[0]]
+                    logger.warning("No product matched, using the closest product in color or a random one instead")
+                    matched_products = await nearest_color_products(catalog, file_path, 1) or get_random_products(1, weighted=True)
+                elif described:
+                    remember_analysis("/api/product-match", upload_hash, {
+                        "catalogVersion": catalog.version,
+                        "imageDescription": image_description,
+                        "matchExplanation": match_explanation,
+                        "productId": matched_products[0]["id"],
+                    })
         except Exception as analysis_error:
             # Fallback to using the built-in image analysis if product_matcher fails
-            logger.error(f"Error using product_matcher: {str(analysis_error)}")
-            logger.info("Falling back to built-in image analysis...")
+            logger.error("Error using product_matcher: %s", analysis_error)
+            logger.debug("Falling back to built-in image analysis...")
             
             # Use the built-in image analyzer instead
             image_description = await ImageAnalyzer.analyze_product_image(file_path)
             
-            # Get product summary for the AI prompt
-            product_summary = get_product_summary()
-            
-            # Create prompt for matching products based on image description
-            match_prompt = [
-                {
-                    "role": "system",
-                    "content": "You are Pocket AI, a product matching specialist for an e-commerce platform. Your task is to find the best product in our catalog that matches what's shown in a user's image."
-                },
-                {
-                    "role": "user",
-                    "content": f"""Based on this description of an image: "{image_description}"
-
-Here are the available products in our catalog:
-{product_summary}
-
-Find the single best product from our catalog that matches what's shown in the image:
-1. Clearly state the product ID number (e.g., "Product ID: 7")
-2. Explain specifically why this product matches the image
-3. Highlight the features that are similar to what's in the image
-
-Format your response to clearly highlight the product ID so it can be easily extracted. Be accurate and precise in your matching."""
-                }
-            ]
+            # Create prompt for matching products based on image description (catalog first, see prompts.py)
+            match_prompt = PRODUCT_MATCH_PROMPT.messages(catalog.summary, description=image_description)
             
             # Get AI-generated product match
             match_explanation = await ChatAssistant.get_chat_response(match_prompt)
@@ -545,10 +1052,9 @@ Format your response to clearly highlight the product ID so it can be easily ext
             
             # If no product found, use a random product
             if not matched_products:
-                matched_products = [get_random_products(1)[0]]
+                matched_products = await nearest_color_products(catalog, file_path, 1) or get_random_products(1, weighted=True)
         
-        logger.info(f"Returning {len(matched_products)} product")
-        logger.info("=== END OF PRODUCT MATCHER REQUEST ===")
+        logger.info("Product match served", extra={"productIds": [product["id"] for product in matched_products]})
         
         return {
             "sessionId": session_id,
@@ -559,7 +1065,7 @@ Format your response to clearly highlight the product ID so it can be easily ext
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Product matcher error: {str(e)}")
+        logger.error("Product matcher error: %s", e)
         import traceback
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Product matcher error: {str(e)}")
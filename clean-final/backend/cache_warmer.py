@@ -0,0 +1,311 @@
+"""
+Recommendation cache warming for the Pocket AI e-commerce agent.
+After a deploy, or a catalog reload (which drops cached recommendations), the semantic
+cache is empty and the first visitors all wait for Ollama. The warmer precomputes
+recommendations for the queries of a seed file, the most frequent queries of the
+backend's JSON log and a default query per catalog category. It sends one model call
+at a time, and only while the backend has no requests in flight. With several workers,
+each worker holds a shared lock on CACHE_WARM_BUSY_LOCK while it serves requests, so a
+warmer also waits for the requests of the other workers.
+"""
+
+import os
+import json
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from ai_utils import RecommendationGenerator, RECOMMENDATION_OUTPUT_MODE
+from catalog import Catalog
+from metrics import HTTP_IN_FLIGHT, CACHE_WARM_QUERIES
+from products import get_catalog
+from response_parser import get_response_parser
+from session import SESSION_SQLITE_PATH
+import semantic_cache
+
+logger = logging.getLogger(__name__)
+
+# Set to "true" to warm the recommendation cache at startup and after catalog reloads
+CACHE_WARM_ENABLED = os.getenv("CACHE_WARM_ENABLED", "false").lower() in ("1", "true", "yes")
+# Query log: JSON log lines with a "query" field (the backend's LOG_FILE by default)
+CACHE_WARM_QUERY_LOG = os.getenv("CACHE_WARM_QUERY_LOG", os.getenv("LOG_FILE", ""))
+# Plain text file with one query per line, warmed before the logged queries
+CACHE_WARM_SEED_FILE = os.getenv("CACHE_WARM_SEED_FILE", "")
+# Number of most frequent logged queries to warm
+CACHE_WARM_TOP_N = int(os.getenv("CACHE_WARM_TOP_N", "50"))
+# Default query per catalog category ("" disables the category defaults)
+CACHE_WARM_CATEGORY_QUERY = os.getenv("CACHE_WARM_CATEGORY_QUERY", "popular {category} products")
+# Seconds between warm runs (0: only at startup and after catalog reloads)
+CACHE_WARM_INTERVAL = float(os.getenv("CACHE_WARM_INTERVAL", "0"))
+# Seconds to wait between two warm requests
+CACHE_WARM_PAUSE = float(os.getenv("CACHE_WARM_PAUSE", "1"))
+# Lock file shared by the workers to tell each other's warmers about live requests (unset: next to
+# SESSION_SQLITE_PATH, which production mode sets; without either only the own worker's requests count)
+CACHE_WARM_BUSY_LOCK = os.getenv("CACHE_WARM_BUSY_LOCK", f"{SESSION_SQLITE_PATH}.busy" if SESSION_SQLITE_PATH else "")
+
+# Only the end of a large query log is read
+QUERY_LOG_MAX_BYTES = 64 * 1024 * 1024
+# Seconds between checks whether live requests have finished
+IDLE_POLL_INTERVAL = 0.25
+
+
+def read_seed_queries(path: str) -> List[str]:
+    """Read one query per line, skipping blank lines and "#" comments."""
+    if not path:
+        return []
+    try:
+        with open(path, encoding="utf-8") as seed_file:
+            return [line.strip() for line in seed_file if line.strip() and not line.lstrip().startswith("#")]
+    except OSError as e:
+        logger.warning("Cannot read cache warm seed file %s: %s", path, e)
+        return []
+
+
+def read_top_queries(path: str, limit: int) -> List[str]:
+    """
+    Count the queries of a JSON log and return the most frequent ones.
+
+    Args:
+        path: Log file with one JSON object per line; lines with a "query" string are counted
+        limit: Number of queries to return
+
+    Returns:
+        Queries, most frequent first (each in the spelling first seen)
+    """
+    if not path or limit <= 0:
+        return []
+    counts: Counter = Counter()
+    spelling: Dict[str, str] = {}
+    try:
+        with open(path, "rb") as log_file:
+            log_file.seek(0, os.SEEK_END)
+            start = max(0, log_file.tell() - QUERY_LOG_MAX_BYTES)
+            log_file.seek(start)
+            if start:
+                log_file.readline()  # Skip the partial first line
+            for line in log_file:
+                if b'"query"' not in line:
+                    continue
+                try:
+                    query = json.loads(line).get("query")
+                except ValueError:
+                    continue
+                if isinstance(query, str):
+                    key = semantic_cache.normalize_query(query)
+                    if key:
+                        counts[key] += 1
+                        spelling.setdefault(key, query)
+    except OSError as e:
+        logger.warning("Cannot read cache warm query log %s: %s", path, e)
+        return []
+    return [spelling[key] for key, _ in counts.most_common(limit)]
+
+
+class WorkerActivity:
+    """Whether any backend worker is serving requests, shared through a file lock (Unix only)."""
+
+    def __init__(self, path: str = CACHE_WARM_BUSY_LOCK):
+        """
+        Args:
+            path: Lock file shared by the workers ("" to only track this worker)
+        """
+        self.path = path if fcntl is not None else ""
+        self.in_flight = 0
+        self._file = None
+        self._held = False
+
+    def _lock_file(self):
+        # Opened in the worker process on first use; every worker needs its own open file
+        if self._file is None:
+            self._file = open(self.path, "ab")
+        return self._file
+
+    def _try_lock(self, operation: int) -> bool:
+        try:
+            fcntl.flock(self._lock_file(), operation | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def enter(self) -> None:
+        """Count a live request; the first one takes the shared lock."""
+        self.in_flight += 1
+        if self.path and not self._held:
+            # Fails only while a warmer is checking; the next request retries
+            self._held = self._try_lock(fcntl.LOCK_SH)
+
+    def exit(self) -> None:
+        """Count a finished request; the last one releases the shared lock."""
+        self.in_flight -= 1
+        if self.in_flight == 0 and self._held:
+            fcntl.flock(self._lock_file(), fcntl.LOCK_UN)
+            self._held = False
+
+    def idle(self) -> bool:
+        """Whether no worker has requests in flight."""
+        if self.in_flight > 0:
+            return False
+        if not self.path:
+            return True
+        # The exclusive lock is only granted while no worker holds the shared one
+        if not self._try_lock(fcntl.LOCK_EX):
+            return False
+        fcntl.flock(self._lock_file(), fcntl.LOCK_UN)
+        return True
+
+
+# Live requests of this worker, published to the warmers of all workers
+worker_activity = WorkerActivity()
+
+
+class WorkerActivityMiddleware:
+    """ASGI middleware counting live HTTP requests in worker_activity."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        worker_activity.enter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            worker_activity.exit()
+
+
+class CacheWarmer:
+    """Precomputes recommendations for likely queries in the background."""
+
+    def __init__(self, seed_file: str = CACHE_WARM_SEED_FILE, query_log: str = CACHE_WARM_QUERY_LOG,
+                 top_n: int = CACHE_WARM_TOP_N, category_query: str = CACHE_WARM_CATEGORY_QUERY,
+                 interval: float = CACHE_WARM_INTERVAL, pause: float = CACHE_WARM_PAUSE,
+                 structured: bool = RECOMMENDATION_OUTPUT_MODE == "json"):
+        """
+        Args:
+            seed_file: Plain text file of queries to always warm
+            query_log: JSON log whose most frequent queries are warmed
+            top_n: Number of logged queries to warm
+            category_query: Query template with a {category} placeholder ("" to skip categories)
+            interval: Seconds between runs (0 for startup and catalog reloads only)
+            pause: Seconds between warm requests
+            structured: Warm structured (JSON) instead of markdown recommendations
+        """
+        self.seed_file = seed_file
+        self.query_log = query_log
+        self.top_n = top_n
+        self.category_query = category_query
+        self.interval = interval
+        self.pause = pause
+        self.structured = structured
+        self.status: Dict[str, Any] = {"runs": 0, "lastRun": None}
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    def queries(self, catalog: Catalog) -> List[str]:
+        """The queries to warm, in order: seed file, top logged queries, category defaults (deduplicated)."""
+        candidates = read_seed_queries(self.seed_file) + read_top_queries(self.query_log, self.top_n)
+        if self.category_query:
+            candidates += [self.category_query.format(category=category) for category in sorted(catalog.by_category)]
+        seen = set()
+        queries = []
+        for query in candidates:
+            key = semantic_cache.normalize_query(query)
+            if key and key not in seen:
+                seen.add(key)
+                queries.append(query)
+        return queries
+
+    async def _wait_until_idle(self) -> None:
+        # Live requests always go first; the warmer only starts a model call when nothing is in
+        # flight, in this worker or (through the shared lock) in any other
+        while HTTP_IN_FLIGHT.labels().value > 0 or not worker_activity.idle():
+            await asyncio.sleep(IDLE_POLL_INTERVAL)
+
+    async def warm_once(self) -> Dict[str, int]:
+        """
+        Warm the cache for every query against the current catalog.
+
+        Returns:
+            Counts of queries by result: warmed, cached (already answered), skipped (no usable
+            recommendation) and failed
+        """
+        catalog = get_catalog()
+        parser = get_response_parser(catalog)
+        namespace = semantic_cache.recommendation_namespace(self.structured)
+        if self.structured:
+            generator = RecommendationGenerator.get_structured_recommendations
+        else:
+            generator = RecommendationGenerator.get_product_recommendations
+        results = Counter()
+        # Reading a large query log would block the event loop
+        queries = await asyncio.get_running_loop().run_in_executor(None, self.queries, catalog)
+        logger.info("Warming the recommendation cache with %s queries for catalog v%s", len(queries), catalog.version)
+        for query in queries:
+            await self._wait_until_idle()
+            if catalog is not get_catalog():
+                # A reload happened; its own run warms the new catalog
+                break
+            try:
+                result = await semantic_cache.warm(
+                    namespace, query, lambda: generator(query, catalog.summary), generation=catalog.version,
+                    is_cacheable=lambda output: bool(parser.recommended_ids(output, self.structured))
+                )
+            except Exception as e:
+                logger.warning("Cache warming stopped, cannot warm %r: %s", query, e)
+                results["failed"] += 1
+                CACHE_WARM_QUERIES.labels("failed").inc()
+                break
+            results[result] += 1
+            CACHE_WARM_QUERIES.labels(result).inc()
+            if result != "cached":
+                await asyncio.sleep(self.pause)
+        self.status.update(runs=self.status["runs"] + 1, lastRun=dict(results, catalogVersion=catalog.version))
+        logger.info("Cache warming finished: %s", dict(results))
+        return dict(results)
+
+    async def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            try:
+                await self.warm_once()
+            except Exception as e:
+                logger.error("Cache warming failed: %s", e)
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval if self.interval > 0 else None)
+            except asyncio.TimeoutError:
+                pass
+
+    def on_catalog_reload(self, catalog: Catalog) -> None:
+        """Schedule a run for a reloaded catalog (called from the reload thread)."""
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def start(self) -> None:
+        """Start warming in the background."""
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop warming."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Shared warmer for the backend process
+cache_warmer = CacheWarmer()
@@ -0,0 +1,431 @@
+"""
+Catalog loading for the Pocket AI e-commerce agent.
+This module loads the product catalog from JSONL, JSON, CSV or SQLite files into
+immutable, column-oriented snapshots (see product_table.py) with lookup indexes, and
+hot-reloads it when the file changes (or on SIGUSR1) by building a new snapshot in the
+background and swapping it in. With CATALOG_SNAPSHOT_PATH, the catalog and its indexes
+are instead mapped from a shared file written by the launcher (see catalog_snapshot.py).
+"""
+
+import os
+import csv
+import json
+import time
+import signal
+import sqlite3
+import logging
+import threading
+from functools import cached_property
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Union
+
+import numpy as np
+
+from catalog_snapshot import SnapshotFile, write_snapshot
+from product_table import ProductSelection, ProductTable, ProductTableBuilder, ProductView
+
+logger = logging.getLogger(__name__)
+
+# SQLite table read by the loader
+CATALOG_SQLITE_TABLE = os.getenv("CATALOG_SQLITE_TABLE", "products")
+
+REQUIRED_FIELDS = ("id", "name", "category", "type", "price")
+
+# Derived indexes (parsers, prefilters, ...) built per catalog snapshot, by name
+INDEX_FACTORIES: Dict[str, Callable[["Catalog"], Any]] = {}
+# Index name -> (dump, restore) functions for indexes stored in shared snapshot files
+INDEX_CODECS: Dict[str, tuple] = {}
+
+
+def register_index(name: str, dump: Optional[Callable] = None, restore: Optional[Callable] = None) -> Callable:
+    """
+    Decorator registering a factory for an index derived from a catalog snapshot.
+
+    Registered indexes are built in the background before a reloaded catalog is
+    swapped in, so requests never wait for them.
+
+    Args:
+        name: The index name passed to Catalog.index()
+        dump: Optional function (catalog, index) -> (arrays, metadata) used to store the
+            index in a shared snapshot file
+        restore: Optional function (catalog, arrays, metadata) -> index that rebuilds it
+            from the mapped arrays without scanning the catalog
+    """
+    def decorator(factory: Callable[["Catalog"], Any]) -> Callable[["Catalog"], Any]:
+        INDEX_FACTORIES[name] = factory
+        if dump is not None and restore is not None:
+            INDEX_CODECS[name] = (dump, restore)
+        return factory
+    return decorator
+
+
+def format_product_summary(product_list: Iterable[Mapping[str, Any]]) -> str:
+    """Format products as the one-line-per-product summary used in AI prompts."""
+    return "\n".join([
+        f"ID {p['id']}: {p['name']} (${p['price']}) - Category: {p['category']}, "
+        f"Type: {p['type']}, Tags: [{', '.join(p['tags'])}]"
+        for p in product_list
+    ])
+
+
+def _parse_tags(value: Any) -> List[str]:
+    if value is None or value == "":
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(tag).strip() for tag in value if str(tag).strip()]
+    value = str(value).strip()
+    if value.startswith("["):
+        return _parse_tags(json.loads(value))
+    separator = "|" if "|" in value else ","
+    return [tag.strip() for tag in value.split(separator) if tag.strip()]
+
+
+def normalize_product(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validate a raw catalog record and convert it to the product dictionary format.
+
+    Args:
+        raw: The record as read from the file
+
+    Returns:
+        The product dictionary
+    """
+    missing = [field for field in REQUIRED_FIELDS if raw.get(field) in (None, "")]
+    if missing:
+        raise ValueError(f"missing fields {missing}")
+
+    return {
+        "id": int(raw["id"]),
+        "name": str(raw["name"]),
+        "category": str(raw["category"]).strip().lower(),
+        "type": str(raw["type"]).strip().lower(),
+        "tags": _parse_tags(raw.get("tags")),
+        "price": float(raw["price"]),
+        "image": str(raw.get("image") or ""),
+    }
+
+
+def _read_records(path: str) -> Iterator[Dict[str, Any]]:
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".jsonl":
+        with open(path, "r", encoding="utf-8") as catalog_file:
+            for line in catalog_file:
+                if line.strip():
+                    yield json.loads(line)
+    elif extension == ".json":
+        with open(path, "r", encoding="utf-8") as catalog_file:
+            yield from json.load(catalog_file)
+    elif extension == ".csv":
+        with open(path, "r", encoding="utf-8", newline="") as catalog_file:
+            yield from csv.DictReader(catalog_file)
+    elif extension in (".db", ".sqlite", ".sqlite3"):
+        # Read-only so a writer updating the database is never blocked
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        connection.row_factory = sqlite3.Row
+        try:
+            for row in connection.execute(f'SELECT * FROM "{CATALOG_SQLITE_TABLE}" ORDER BY id'):
+                yield dict(row)
+        finally:
+            connection.close()
+    else:
+        raise ValueError(f"Unsupported catalog format: {extension or path}")
+
+
+def _check_unique_ids(table: ProductTable, path: str) -> None:
+    order = np.argsort(table.ids, kind="stable")
+    duplicates = np.flatnonzero(np.diff(table.ids[order]) == 0)
+    if len(duplicates):
+        row = int(order[duplicates[0] + 1])
+        raise ValueError(f"{path}: duplicate product ID {table.product_id(row)} (record {row + 1})")
+
+
+def load_catalog_file(path: str) -> ProductTable:
+    """
+    Load and validate a catalog file.
+
+    Records are added to the columnar table as they are read, so no per-product
+    dictionaries are kept while loading large catalogs.
+
+    Args:
+        path: A .jsonl, .json, .csv or SQLite (.db/.sqlite) file
+
+    Returns:
+        The product table
+
+    Raises:
+        ValueError: If a record is invalid or an ID is duplicated
+    """
+    builder = ProductTableBuilder()
+    records = _read_records(path)
+    position = 0
+    while True:
+        position += 1
+        try:
+            raw = next(records, None)
+            if raw is None:
+                break
+            builder.append(normalize_product(raw))
+        except (ValueError, TypeError, csv.Error, sqlite3.Error) as e:
+            raise ValueError(f"{path}: invalid record {position}: {str(e)}") from e
+    if not len(builder):
+        raise ValueError(f"{path}: catalog is empty")
+    table = builder.build()
+    _check_unique_ids(table, path)
+    return table
+
+
+class Catalog:
+    """An immutable snapshot of the product catalog with its lookup indexes."""
+
+    def __init__(self, products: Union[ProductTable, List[Dict[str, Any]]], version: int = 1,
+                 source: str = "built-in", category_rows: Optional[Dict[str, np.ndarray]] = None,
+                 snapshot: Optional[SnapshotFile] = None):
+        """
+        Build the snapshot.
+
+        Args:
+            products: A product table, or product dictionaries to convert into one
+            version: Increases with every reload; use it to invalidate caches
+            source: Where the catalog was loaded from
+            category_rows: Precomputed rows of each category (from a snapshot file)
+            snapshot: Shared snapshot file holding stored indexes
+        """
+        self.products = products if isinstance(products, ProductTable) else ProductTable.from_products(products)
+        self.version = version
+        self.source = source
+        self.loaded_at = time.time()
+        if category_rows is None:
+            category_rows = self.products.rows_by_category()
+        self.by_category: Dict[str, ProductSelection] = {
+            category: self.products.select(rows) for category, rows in category_rows.items()
+        }
+        self._snapshot = snapshot
+        self._indexes: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_snapshot(cls, path: str) -> "Catalog":
+        """
+        Map a catalog written by save_snapshot; nothing is copied or rebuilt.
+
+        Args:
+            path: The snapshot file
+
+        Returns:
+            The catalog, with its version and source as stored in the file
+        """
+        snapshot = SnapshotFile(path)
+        header = snapshot.header
+        order = snapshot.array("category_order")
+        bounds = np.cumsum([0] + header["category_counts"])
+        category_rows = {category: order[bounds[i]:bounds[i + 1]]
+                         for i, category in enumerate(header["category_names"])}
+        return cls(ProductTable.from_snapshot(snapshot), header["version"], header["source"],
+                   category_rows=category_rows, snapshot=snapshot)
+
+    def save_snapshot(self, path: str) -> None:
+        """
+        Write the catalog, its category groups, prompt summary and every index registered
+        with dump/restore functions to a snapshot file that workers can map.
+
+        Args:
+            path: Destination file (replaced atomically)
+        """
+        arrays = {f"products.{name}": array for name, array in self.products.snapshot_arrays().items()}
+        category_names = list(self.by_category)
+        arrays["category_order"] = np.concatenate([self.by_category[name].rows for name in category_names])
+        arrays["summary"] = np.frombuffer(self.summary.encode("utf-8"), dtype=np.uint8)
+        index_meta = {}
+        for name, (dump, _) in INDEX_CODECS.items():
+            index_arrays, index_meta[name] = dump(self, self.index(name))
+            arrays.update({f"index.{name}.{key}": array for key, array in index_arrays.items()})
+        write_snapshot(path, arrays, {
+            "version": self.version,
+            "source": self.source,
+            "products": self.products.snapshot_meta(),
+            "category_names": category_names,
+            "category_counts": [len(self.by_category[name]) for name in category_names],
+            "indexes": index_meta,
+        })
+
+    @cached_property
+    def summary(self) -> str:
+        """The one-line-per-product prompt summary, formatted on first use."""
+        if self._snapshot is not None and "summary" in self._snapshot:
+            return self._snapshot.array("summary").tobytes().decode("utf-8")
+        return format_product_summary(self.products)
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def __iter__(self) -> Iterator[ProductView]:
+        return iter(self.products)
+
+    def get(self, product_id: int) -> Optional[ProductView]:
+        """Get a product by ID."""
+        return self.products.get(product_id)
+
+    def index(self, name: str) -> Any:
+        """
+        Get a derived index registered with register_index, building it on first use.
+
+        Args:
+            name: The registered index name
+
+        Returns:
+            The index for this snapshot
+        """
+        index = self._indexes.get(name)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(name)
+                if index is None:
+                    stored = self._snapshot.header["indexes"].get(name) if self._snapshot is not None else None
+                    if stored is not None and name in INDEX_CODECS:
+                        restore = INDEX_CODECS[name][1]
+                        index = restore(self, self._snapshot.arrays(f"index.{name}."), stored)
+                    else:
+                        logger.info("Building %s index for catalog v%s (%s products)", name, self.version, len(self))
+                        index = INDEX_FACTORIES[name](self)
+                    self._indexes[name] = index
+        return index
+
+    def build_indexes(self) -> None:
+        """Build the prompt summary and every registered index."""
+        self.summary
+        for name in list(INDEX_FACTORIES):
+            self.index(name)
+
+
+class CatalogStore:
+    """Holds the current catalog snapshot and reloads it when the source file changes."""
+
+    def __init__(self, path: Optional[str], default_products: List[Dict[str, Any]], watch_interval: float = 2.0,
+                 snapshot_path: Optional[str] = None):
+        """
+        Load the initial catalog.
+
+        Args:
+            path: Catalog file, or None to use the built-in products
+            default_products: The built-in products
+            watch_interval: Seconds between file change checks (0 disables watching)
+            snapshot_path: Shared snapshot file to map instead of loading `path`; the
+                launcher rewrites it when the catalog changes, and this file is watched instead
+        """
+        self.path = path
+        self.default_products = default_products
+        self.watch_interval = watch_interval
+        self.snapshot_path = snapshot_path
+        self._listeners: List[Callable[[Catalog], None]] = []
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._signature = self._file_signature()
+        if snapshot_path:
+            try:
+                self.current = Catalog.from_snapshot(snapshot_path)
+                logger.info("Mapped catalog v%s (%s products) from %s",
+                            self.current.version, len(self.current), snapshot_path)
+                return
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Cannot map catalog snapshot %s, loading the catalog directly: %s", snapshot_path, e)
+                self.snapshot_path = None
+                self._signature = self._file_signature()
+        self.current = self._load(version=1)
+
+    @property
+    def watched_path(self) -> Optional[str]:
+        """The file whose changes trigger a reload."""
+        return self.snapshot_path or self.path
+
+    def _file_signature(self) -> Optional[tuple]:
+        if not self.watched_path:
+            return None
+        try:
+            stat = os.stat(self.watched_path)
+        except OSError:
+            return None
+        # The inode changes when a snapshot is atomically replaced
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _load(self, version: int) -> Catalog:
+        if self.snapshot_path:
+            return Catalog.from_snapshot(self.snapshot_path)
+        if not self.path:
+            return Catalog(self.default_products, version, "built-in")
+        products = load_catalog_file(self.path)
+        logger.info("Loaded %s products from %s", len(products), self.path)
+        return Catalog(products, version, self.path)
+
+    def on_reload(self, callback: Callable[[Catalog], None]) -> None:
+        """Register a callback invoked with the new catalog after each reload."""
+        self._listeners.append(callback)
+
+    def reload(self) -> bool:
+        """
+        Load the catalog again, build its indexes and swap it in atomically.
+
+        Requests keep using the previous snapshot until the swap. If loading fails
+        the current catalog stays active.
+
+        Returns:
+            True if a new catalog was installed
+        """
+        with self._reload_lock:
+            signature = self._file_signature()
+            try:
+                catalog = self._load(self.current.version + 1)
+                catalog.build_indexes()
+            except Exception as e:
+                # Remember the signature so a broken file is not retried until it changes again
+                self._signature = signature
+                logger.error("Catalog reload failed, keeping version %s: %s", self.current.version, e)
+                return False
+            self._signature = signature
+            self.current = catalog
+        logger.info("Catalog v%s active (%s products)", catalog.version, len(catalog))
+        for callback in self._listeners:
+            try:
+                callback(catalog)
+            except Exception as e:
+                logger.error("Catalog reload listener failed: %s", e)
+        return True
+
+    def reload_in_background(self) -> threading.Thread:
+        """Start a reload on a background thread."""
+        thread = threading.Thread(target=self.reload, name="catalog-reload", daemon=True)
+        thread.start()
+        return thread
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.watch_interval):
+            signature = self._file_signature()
+            if signature is not None and signature != self._signature:
+                logger.info("Catalog file %s changed, reloading", self.watched_path)
+                self.reload()
+
+    def start(self, build_indexes: bool = True) -> None:
+        """
+        Start watching the catalog file and listen for SIGUSR1.
+
+        Args:
+            build_indexes: Also build the current snapshot's indexes in the background
+        """
+        if build_indexes:
+            threading.Thread(target=self.current.build_indexes, name="catalog-indexes", daemon=True).start()
+        if hasattr(signal, "SIGUSR1"):
+            try:
+                signal.signal(signal.SIGUSR1, lambda signum, frame: self.reload_in_background())
+            except ValueError:
+                # Signal handlers can only be installed from the main thread
+                logger.debug("Not in the main thread, catalog reload signal not installed")
+        if self.watched_path and self.watch_interval > 0 and self._watcher is None:
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, name="catalog-watcher", daemon=True)
+            self._watcher.start()
+
+    def stop(self) -> None:
+        """Stop watching the catalog file."""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
@@ -0,0 +1,140 @@
+"""
+Shared catalog snapshots for the Pocket AI e-commerce agent.
+The launcher writes the catalog columns and their derived indexes to one file, and
+every worker maps that file read-only. The operating system then keeps a single copy
+of the catalog in memory for all workers, and workers start without rebuilding indexes.
+
+Usage: python catalog_snapshot.py <output file>   (builds from CATALOG_PATH or the built-in products)
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# File layout: magic, header offset (uint64), 64-byte aligned arrays, JSON header at the end
+MAGIC = b"PKTCAT01"
+PREAMBLE = struct.Struct("<8sQ")
+ALIGNMENT = 64
+
+
+def write_snapshot(path: str, arrays: Dict[str, np.ndarray], header: Dict[str, Any]) -> None:
+    """
+    Write arrays and a JSON header to a snapshot file, replacing it atomically.
+
+    Workers that still map the previous file keep reading it until they switch over.
+
+    Args:
+        path: Destination file
+        arrays: Named one-dimensional arrays (bytes heaps as uint8 arrays)
+        header: JSON-serializable metadata stored alongside the arrays
+    """
+    temp_path = f"{path}.tmp-{os.getpid()}"
+    layout = {}
+    with open(temp_path, "wb") as snapshot_file:
+        snapshot_file.write(PREAMBLE.pack(MAGIC, 0))
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            offset = -snapshot_file.tell() % ALIGNMENT
+            snapshot_file.write(b"\0" * offset)
+            layout[name] = {"dtype": array.dtype.str, "count": int(array.size), "offset": snapshot_file.tell()}
+            snapshot_file.write(array.tobytes())
+        header_offset = snapshot_file.tell()
+        snapshot_file.write(json.dumps(dict(header, arrays=layout)).encode("utf-8"))
+        snapshot_file.seek(0)
+        snapshot_file.write(PREAMBLE.pack(MAGIC, header_offset))
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(temp_path, path)
+
+
+class SnapshotFile:
+    """A snapshot file mapped read-only; arrays are views into the shared mapping."""
+
+    def __init__(self, path: str):
+        """
+        Map a snapshot file.
+
+        Args:
+            path: The snapshot file
+
+        Raises:
+            ValueError: If the file is not a catalog snapshot
+        """
+        self.path = path
+        with open(path, "rb") as snapshot_file:
+            self.buffer = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.buffer) < PREAMBLE.size:
+            raise ValueError(f"{path}: not a catalog snapshot")
+        magic, header_offset = PREAMBLE.unpack_from(self.buffer)
+        if magic != MAGIC or not header_offset:
+            raise ValueError(f"{path}: not a catalog snapshot")
+        self.header: Dict[str, Any] = json.loads(self.buffer[header_offset:].decode("utf-8"))
+        self._layout: Dict[str, Dict[str, Any]] = self.header["arrays"]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._layout
+
+    def array(self, name: str) -> np.ndarray:
+        """Get a stored array (read-only, backed by the mapping)."""
+        entry = self._layout[name]
+        return np.frombuffer(self.buffer, dtype=np.dtype(entry["dtype"]), count=entry["count"], offset=entry["offset"])
+
+    def heap(self, name: str) -> Tuple[mmap.mmap, int]:
+        """Get a stored bytes heap as (mapping, start offset) so strings are sliced without copying the heap."""
+        return self.buffer, self._layout[name]["offset"]
+
+    def arrays(self, prefix: str) -> Dict[str, np.ndarray]:
+        """Get all arrays stored under a prefix, keyed by the rest of their name."""
+        return {name[len(prefix):]: self.array(name) for name in self._layout if name.startswith(prefix)}
+
+
+def read_snapshot_version(path: str) -> Optional[int]:
+    """Catalog version stored in an existing snapshot, or None if there is no readable snapshot."""
+    try:
+        return int(SnapshotFile(path).header["version"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def main(argv=None) -> int:
+    """Build the catalog snapshot used by the workers (run by the launcher)."""
+    args = sys.argv[1:] if argv is None else argv
+    if len(args) != 1:
+        print(__doc__.strip().splitlines()[-1], file=sys.stderr)
+        return 2
+    output = os.path.abspath(args[0])
+
+    # Same import setup as app.py: shared modules live in the parent directory
+    parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if parent_dir not in sys.path:
+        sys.path.insert(0, parent_dir)
+    # Building must read the source catalog, not a previous snapshot
+    os.environ.pop("CATALOG_SNAPSHOT_PATH", None)
+    from log_config import configure_logging
+    configure_logging("catalog-snapshot", fmt=os.getenv("LOG_FORMAT", "text"))
+
+    # Importing these modules registers the derived indexes stored in the snapshot
+    import image_pipeline  # noqa: F401
+    import product_search  # noqa: F401
+    import response_parser  # noqa: F401
+    from products import get_catalog
+
+    catalog = get_catalog()
+    previous_version = read_snapshot_version(output)
+    if previous_version is not None:
+        catalog.version = previous_version + 1
+    catalog.save_snapshot(output)
+    logger.info("Wrote catalog snapshot v%s (%s products) to %s", catalog.version, len(catalog), output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+Color-histogram index of catalog images for the Pocket AI e-commerce agent.
+Every catalog image found in CATALOG_IMAGE_DIR is reduced to a 64-bin RGB histogram
+(4 levels per channel, near-white background pixels left out). The square roots of the
+normalized histograms are stored as rows of one float32 matrix, so the Bhattacharyya
+similarity of an upload to every catalog image is a single matrix-vector product.
+Image search uses the nearest products to widen its candidate shortlist, and answers
+without a matching model call when the vision model is unavailable. Decoding needs
+the optional Pillow package; without it, or without catalog images, the index is empty.
+"""
+
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from catalog import Catalog, register_index
+
+logger = logging.getLogger(__name__)
+
+# Directory holding the catalog images named by the products' "image" field (unset: no color index)
+CATALOG_IMAGE_DIR = os.getenv("CATALOG_IMAGE_DIR", "")
+# Color-nearest products added to the image search shortlist
+COLOR_PREFILTER_CANDIDATES = int(os.getenv("COLOR_PREFILTER_CANDIDATES", "5"))
+# Minimum histogram similarity (0-1) for a product to count as close in color
+COLOR_PREFILTER_MIN_SIMILARITY = float(os.getenv("COLOR_PREFILTER_MIN_SIMILARITY", "0.6"))
+
+LEVELS = 4  # Quantization levels per channel
+BINS = LEVELS ** 3
+THUMBNAIL_SIZE = 32
+# Pixels with every channel at or above this are treated as studio background
+BACKGROUND_LEVEL = 235
+# Below this fraction of foreground pixels the whole image is counted
+MIN_FOREGROUND = 0.1
+# Threads decoding catalog images while the index is built
+DECODE_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def is_available() -> bool:
+    """Whether images can be decoded (Pillow is installed)."""
+    return Image is not None
+
+
+def color_histogram(pixels: np.ndarray) -> np.ndarray:
+    """
+    Compute the color signature of an RGB image.
+
+    Args:
+        pixels: uint8 array of shape (height, width, 3)
+
+    Returns:
+        float32 vector of BINS unit-length values (square roots of the normalized
+        histogram); the dot product of two signatures is their Bhattacharyya coefficient
+    """
+    pixels = pixels.reshape(-1, 3)
+    foreground = pixels.min(axis=1) < BACKGROUND_LEVEL
+    if np.count_nonzero(foreground) >= MIN_FOREGROUND * len(pixels):
+        pixels = pixels[foreground]
+    levels = (pixels // (256 // LEVELS)).astype(np.intp)
+    bins = (levels[:, 0] * LEVELS + levels[:, 1]) * LEVELS + levels[:, 2]
+    counts = np.bincount(bins, minlength=BINS).astype(np.float32)
+    return np.sqrt(counts / max(counts.sum(), 1.0))
+
+
+def image_histogram(path: str) -> np.ndarray:
+    """Decode an image file into a small RGB thumbnail and compute its color signature."""
+    with Image.open(path) as image:
+        # Let the JPEG decoder downscale while decoding instead of decoding the full image
+        image.draft("RGB", (THUMBNAIL_SIZE * 2, THUMBNAIL_SIZE * 2))
+        thumbnail = image.convert("RGB").resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.BILINEAR)
+    return color_histogram(np.asarray(thumbnail, dtype=np.uint8))
+
+
+def resolve_image_path(image: str, image_dir: str = CATALOG_IMAGE_DIR) -> Optional[str]:
+    """Map a product's "image" field to a local file, or None for URLs and unset directories."""
+    if not image or "://" in image:
+        return None
+    if os.path.isabs(image):
+        return image
+    return os.path.join(image_dir, image) if image_dir else None
+
+
+class ColorIndex:
+    """Color signatures of the catalog images, one matrix row per catalog position."""
+
+    def __init__(self, products: List[Dict], signatures: np.ndarray, present: np.ndarray):
+        """
+        Args:
+            products: The catalog products, in catalog order
+            signatures: float32 matrix of shape (len(products), BINS)
+            present: Whether each product's image could be read
+        """
+        self.products = products
+        self.signatures = signatures
+        self.present = present
+        self.available = int(np.count_nonzero(present))
+
+    def nearest(self, signature: np.ndarray, count: int = COLOR_PREFILTER_CANDIDATES,
+                min_similarity: float = COLOR_PREFILTER_MIN_SIMILARITY) -> List[Tuple[Dict, float]]:
+        """
+        Find the products whose images are closest in color.
+
+        Args:
+            signature: Color signature of the query image
+            count: Maximum number of products
+            min_similarity: Minimum Bhattacharyya coefficient
+
+        Returns:
+            (product, similarity) pairs, most similar first
+        """
+        if not self.available or count <= 0:
+            return []
+        scores = np.where(self.present, self.signatures @ signature, -1.0)
+        count = min(count, len(scores))
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.products[position], float(scores[position]))
+                for position in top.tolist() if scores[position] >= min_similarity]
+
+
+def _read_signature(path: Optional[str]) -> Optional[np.ndarray]:
+    if path is None or not os.path.isfile(path):
+        return None
+    try:
+        return image_histogram(path)
+    except Exception as e:
+        logger.warning("Cannot read catalog image %s: %s", path, e)
+        return None
+
+
+def dump_color_index(catalog: Catalog, index: ColorIndex) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """Store a color index in a catalog snapshot."""
+    return {"signatures": index.signatures, "present": index.present}, {}
+
+
+def restore_color_index(catalog: Catalog, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]) -> ColorIndex:
+    """Recreate a color index from a catalog snapshot without decoding the images."""
+    return ColorIndex(catalog.products, arrays["signatures"], arrays["present"])
+
+
+@register_index("color_index", dump=dump_color_index, restore=restore_color_index)
+def build_color_index(catalog: Catalog) -> ColorIndex:
+    """Decode the catalog images and build the color index for a catalog snapshot."""
+    products = catalog.products
+    signatures = np.zeros((len(products), BINS), dtype=np.float32)
+    present = np.zeros(len(products), dtype=bool)
+    if not is_available() or not CATALOG_IMAGE_DIR:
+        return ColorIndex(products, signatures, present)
+    paths = [resolve_image_path(product["image"]) for product in products]
+    with ThreadPoolExecutor(max_workers=DECODE_WORKERS) as executor:
+        for position, signature in enumerate(executor.map(_read_signature, paths)):
+            if signature is not None:
+                signatures[position] = signature
+                present[position] = True
+    index = ColorIndex(products, signatures, present)
+    logger.info("Color index: %s of %s catalog images read from %s", index.available, len(products), CATALOG_IMAGE_DIR)
+    return index
+
+
+def get_color_index(catalog: Catalog) -> ColorIndex:
+    """
+    Get the color index for a catalog snapshot, built once per snapshot.
+
+    Args:
+        catalog: The current catalog snapshot
+
+    Returns:
+        A ColorIndex for the catalog
+    """
+    return catalog.index("color_index")
+
+
+async def nearest_color_products(catalog: Catalog, path: str,
+                                 count: int = COLOR_PREFILTER_CANDIDATES) -> List[Dict]:
+    """
+    Find the catalog products closest in color to an uploaded image.
+
+    Args:
+        catalog: The current catalog snapshot
+        path: Path to the uploaded image
+        count: Maximum number of products
+
+    Returns:
+        The nearest products, most similar first (empty when there is no color index
+        or the upload cannot be decoded)
+    """
+    index = get_color_index(catalog)
+    if not index.available:
+        return []
+    try:
+        signature = await asyncio.get_running_loop().run_in_executor(None, image_histogram, path)
+    except Exception as e:
+        logger.warning("Cannot compute the color histogram of %s: %s", path, e)
+        return []
+    return [product for product, _ in index.nearest(signature, count)]
+
+
+if Image is None:
+    logger.warning("Pillow is not installed; the color prefilter and color fallback are disabled")
+elif not CATALOG_IMAGE_DIR:
+    logger.warning("CATALOG_IMAGE_DIR is not set; the color prefilter and color fallback are disabled")
@@ -0,0 +1,277 @@
+"""
+Near-duplicate detection for uploaded images in the Pocket AI e-commerce agent.
+Each upload gets a 64-bit difference hash (dHash) of its downscaled grayscale image,
+which barely changes when a photo is resized, recompressed or slightly re-exposed. The
+hashes of analyzed uploads are kept in a multi-index hash table: the hash is split into
+four 16-bit chunks, each with its own table, and since two hashes within Hamming distance
+d share a chunk that differs in at most d // 4 bits, a lookup only probes those chunk
+neighbours instead of scanning every stored hash. The grayscale hash cannot tell color
+variants of a product apart, so the upload's color signature (see color_index.py) is
+stored too and a near-duplicate must also agree in color. A near-duplicate upload reuses
+the vision model's description, and the product match too while the catalog is unchanged.
+Decoding needs the optional Pillow package; without it uploads are never matched.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from color_index import THUMBNAIL_SIZE, color_histogram
+from metrics import IMAGE_HASH_LOOKUPS, IMAGE_HASH_DISTANCE
+
+logger = logging.getLogger(__name__)
+
+# Set to "false" to analyze every upload, even near-duplicates of earlier ones
+IMAGE_HASH_ENABLED = os.getenv("IMAGE_HASH_ENABLED", "true").lower() not in ("0", "false", "no")
+# Maximum Hamming distance (of 64 bits) between the hashes of two near-duplicate images
+IMAGE_HASH_MAX_DISTANCE = int(os.getenv("IMAGE_HASH_MAX_DISTANCE", "6"))
+# Minimum color similarity (Bhattacharyya coefficient) of near-duplicates, so color variants are told apart
+IMAGE_HASH_MIN_COLOR_SIMILARITY = float(os.getenv("IMAGE_HASH_MIN_COLOR_SIMILARITY", "0.9"))
+# Analyzed uploads remembered per endpoint (least recently used ones are dropped)
+IMAGE_HASH_MAX_ENTRIES = int(os.getenv("IMAGE_HASH_MAX_ENTRIES", "4096"))
+# Seconds an analysis is reused (0 keeps it until it is dropped)
+IMAGE_HASH_TTL = float(os.getenv("IMAGE_HASH_TTL", "86400"))
+
+HASH_SIZE = 8  # dHash grid: 8 rows of 8 horizontal gradients = 64 bits
+HASH_CHUNKS = 4
+CHUNK_BITS = 64 // HASH_CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+# Distances above this would need too many probes per chunk to stay cheaper than a scan
+MAX_SUPPORTED_DISTANCE = 4 * HASH_CHUNKS - 1
+
+# An upload's fingerprint: its dHash and its color signature
+ImageHash = Tuple[int, np.ndarray]
+
+
+def is_available() -> bool:
+    """Whether uploads can be hashed (Pillow is installed and hashing is enabled)."""
+    return IMAGE_HASH_ENABLED and Image is not None
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two hashes."""
+    return bin(a ^ b).count("1")
+
+
+def dhash(image) -> int:
+    """
+    Compute the difference hash of a decoded image.
+
+    Args:
+        image: A Pillow image
+
+    Returns:
+        64-bit hash; bit i is set when pixel i of the 9x8 grayscale thumbnail is
+        brighter than its left neighbour
+    """
+    thumbnail = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def image_fingerprint(path: str) -> ImageHash:
+    """
+    Decode an image file once into its dHash and its color signature.
+
+    Args:
+        path: Path to the image
+
+    Returns:
+        (dHash, color signature as computed by color_index.color_histogram)
+    """
+    with Image.open(path) as image:
+        # Let the JPEG decoder downscale while decoding instead of decoding the full image
+        image.draft("RGB", (max(HASH_SIZE * 8, THUMBNAIL_SIZE * 2),) * 2)
+        image = image.convert("RGB")
+        colors = image.resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.BILINEAR)
+        return dhash(image), color_histogram(np.asarray(colors, dtype=np.uint8))
+
+
+async def compute_image_hash(path: str) -> Optional[ImageHash]:
+    """
+    Fingerprint an uploaded image off the event loop.
+
+    Args:
+        path: Path to the uploaded image
+
+    Returns:
+        The image's dHash and color signature, or None if hashing is unavailable or the
+        file cannot be decoded
+    """
+    if not is_available():
+        return None
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, image_fingerprint, path)
+    except Exception as e:
+        logger.warning("Cannot hash image %s: %s", path, e)
+        return None
+
+
+def _probe_masks(radius: int) -> List[int]:
+    """XOR masks turning a chunk into itself and every value differing in at most radius bits."""
+    masks = [0]
+    for flips in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), flips):
+            masks.append(sum(1 << bit for bit in bits))
+    return masks
+
+
+class ImageHashIndex:
+    """Bounded multi-index hash table mapping image fingerprints to earlier analysis results."""
+
+    def __init__(self, route: str, max_distance: int = IMAGE_HASH_MAX_DISTANCE,
+                 max_entries: int = IMAGE_HASH_MAX_ENTRIES, ttl: float = IMAGE_HASH_TTL,
+                 min_color_similarity: float = IMAGE_HASH_MIN_COLOR_SIMILARITY):
+        """
+        Args:
+            route: Endpoint whose uploads are indexed, used as the metrics label
+            max_distance: Maximum Hamming distance of a near-duplicate
+            max_entries: Maximum number of remembered uploads
+            ttl: Seconds an entry stays valid (0 for no expiry)
+            min_color_similarity: Minimum color similarity of a near-duplicate
+        """
+        self.route = route
+        self.max_distance = max(0, min(max_distance, MAX_SUPPORTED_DISTANCE))
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.min_color_similarity = min_color_similarity
+        self._masks = _probe_masks(self.max_distance // HASH_CHUNKS)
+        self._lock = threading.Lock()
+        self._next_key = 0
+        # key -> (hash, color signature, expiry, value), least recently used first; color
+        # variants of a product share a hash, so several entries may have the same one
+        self._entries: "OrderedDict[int, Tuple[int, np.ndarray, float, Any]]" = OrderedDict()
+        # One table per chunk: chunk value -> keys of the entries whose hash has it
+        self._tables: List[Dict[int, Set[int]]] = [{} for _ in range(HASH_CHUNKS)]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _chunks(image_hash: int) -> List[int]:
+        return [(image_hash >> (CHUNK_BITS * i)) & CHUNK_MASK for i in range(HASH_CHUNKS)]
+
+    def _remove(self, key: int) -> None:
+        image_hash = self._entries.pop(key)[0]
+        for table, chunk in zip(self._tables, self._chunks(image_hash)):
+            keys = table[chunk]
+            keys.discard(key)
+            if not keys:
+                del table[chunk]
+
+    def _candidates(self, image_hash: int) -> Set[int]:
+        keys: Set[int] = set()
+        for table, chunk in zip(self._tables, self._chunks(image_hash)):
+            for mask in self._masks:
+                keys.update(table.get(chunk ^ mask, ()))
+        return keys
+
+    def find(self, fingerprint: ImageHash) -> Tuple[Any, Optional[int]]:
+        """
+        Find the closest remembered near-duplicate of an image.
+
+        Args:
+            fingerprint: The image's dHash and color signature
+
+        Returns:
+            (stored value of the closest valid near-duplicate and its Hamming distance) or (None, None)
+        """
+        image_hash, colors = fingerprint
+        with self._lock:
+            now = time.time()
+            best, best_distance = None, None
+            for key in self._candidates(image_hash):
+                candidate_hash, candidate_colors, expires, _ = self._entries[key]
+                distance = hamming_distance(image_hash, candidate_hash)
+                if distance > self.max_distance or (best_distance is not None and distance >= best_distance):
+                    continue
+                if expires <= now or float(colors @ candidate_colors) < self.min_color_similarity:
+                    continue
+                best, best_distance = key, distance
+            if best is None:
+                return None, None
+            self._entries.move_to_end(best)
+            return self._entries[best][3], best_distance
+
+    def put(self, fingerprint: ImageHash, value: Any) -> None:
+        """
+        Remember the analysis of an image, dropping the least recently used entry when full.
+
+        Args:
+            fingerprint: The image's dHash and color signature
+            value: The analysis result to reuse for near-duplicates
+        """
+        image_hash, colors = fingerprint
+        expires = time.time() + self.ttl if self.ttl > 0 else float("inf")
+        with self._lock:
+            for key in self._candidates(image_hash):
+                candidate_hash, candidate_colors, _, _ = self._entries[key]
+                if candidate_hash == image_hash and float(colors @ candidate_colors) >= self.min_color_similarity:
+                    # Same image again: refresh its entry
+                    self._entries[key] = (image_hash, colors, expires, value)
+                    self._entries.move_to_end(key)
+                    return
+            while len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = (image_hash, colors, expires, value)
+            for table, chunk in zip(self._tables, self._chunks(image_hash)):
+                table.setdefault(chunk, set()).add(key)
+
+
+_indexes: Dict[str, ImageHashIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(route: str) -> ImageHashIndex:
+    """Get the shared near-duplicate index of an endpoint."""
+    with _indexes_lock:
+        index = _indexes.get(route)
+        if index is None:
+            index = _indexes[route] = ImageHashIndex(route)
+        return index
+
+
+def lookup_analysis(route: str, image_hash: Optional[ImageHash]) -> Any:
+    """
+    Look up the earlier analysis of a near-duplicate upload and count the result.
+
+    Args:
+        route: Endpoint the image was uploaded to
+        image_hash: The upload's fingerprint, or None when it could not be hashed
+
+    Returns:
+        The stored analysis, or None
+    """
+    if image_hash is None:
+        IMAGE_HASH_LOOKUPS.labels(route, "bypass").inc()
+        return None
+    value, distance = get_index(route).find(image_hash)
+    if distance is not None:
+        IMAGE_HASH_DISTANCE.labels(route).observe(distance)
+    IMAGE_HASH_LOOKUPS.labels(route, "hit" if value is not None else "miss").inc()
+    return value
+
+
+def remember_analysis(route: str, image_hash: Optional[ImageHash], value: Any) -> None:
+    """Store the analysis of an upload for its future near-duplicates."""
+    if image_hash is not None:
+        get_index(route).put(image_hash, value)
+
+
+if IMAGE_HASH_ENABLED and Image is None:
+    logger.warning("Pillow is not installed; near-duplicate image detection is disabled")
@@ -0,0 +1,242 @@
+"""
+Image search pipeline helpers for the Pocket AI e-commerce agent.
+This module provides per-stage timing and incremental candidate prefiltering
+so /api/image-search can overlap vision analysis with catalog preparation.
+"""
+
+import os
+import re
+import time
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from tracing import span
+from catalog import Catalog, register_index
+
+logger = logging.getLogger(__name__)
+
+# Prefilter limits: below the minimum the full catalog is used, above the maximum only the best are kept
+PREFILTER_MIN_CANDIDATES = int(os.getenv("IMAGE_PREFILTER_MIN_CANDIDATES", "3"))
+PREFILTER_MAX_CANDIDATES = int(os.getenv("IMAGE_PREFILTER_MAX_CANDIDATES", "30"))
+
+# Weights for each kind of catalog term found in the image description
+TERM_WEIGHTS = {"type": 3, "category": 2, "tag": 2, "name": 1}
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+
+def _normalize_term(term: str) -> str:
+    """Lowercase a term and strip a plural "s" so "shoes" and "shoe" match."""
+    term = term.lower()
+    if len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+        term = term[:-1]
+    return term
+
+
+class StageTimer:
+    """Collects wall-clock durations of named pipeline stages."""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block, record it under the given stage name and trace it as a span."""
+        start = time.perf_counter()
+        try:
+            with span(f"image_search.{name}"):
+                yield
+        finally:
+            self.timings[name] = (time.perf_counter() - start) * 1000
+
+    def record(self, name: str, duration_ms: float) -> None:
+        """Record a duration measured elsewhere."""
+        self.timings[name] = duration_ms
+
+    def server_timing_header(self) -> str:
+        """Format the timings as a Server-Timing header value."""
+        return ", ".join(f"{name};dur={duration:.1f}" for name, duration in self.timings.items())
+
+
+class PostingIndex:
+    """Read-only term index stored as flat arrays (postings of each term are contiguous)."""
+
+    __slots__ = ("slots", "offsets", "positions", "weights")
+
+    def __init__(self, terms: List[str], offsets: np.ndarray, positions: np.ndarray, weights: np.ndarray):
+        """
+        Wrap stored postings.
+
+        Args:
+            terms: Indexed terms, in posting order
+            offsets: Start of each term's postings, followed by the number of postings
+            positions: Catalog positions of all postings
+            weights: Weight of each posting
+        """
+        self.slots = {term: slot for slot, term in enumerate(terms)}
+        self.offsets = offsets
+        self.positions = positions
+        self.weights = weights
+
+    def get(self, term: str, default=()) -> Any:
+        """Get the (position, weight) postings of a term."""
+        slot = self.slots.get(term)
+        if slot is None:
+            return default
+        start, end = self.offsets.item(slot), self.offsets.item(slot + 1)
+        return zip(self.positions[start:end].tolist(), self.weights[start:end].tolist())
+
+
+class CandidatePrefilter:
+    """Term index over the catalog used to shortlist products from a description."""
+
+    def __init__(self, catalog: List[Dict]):
+        """
+        Build the term index for a catalog.
+
+        Args:
+            catalog: List of product dictionaries
+        """
+        self.catalog = catalog
+        self.index: Dict[str, List[tuple]] = {}
+        for position, product in enumerate(catalog):
+            terms = {(_normalize_term(product["category"]), TERM_WEIGHTS["category"]),
+                     (_normalize_term(product["type"]), TERM_WEIGHTS["type"])}
+            for tag in product["tags"]:
+                terms.add((_normalize_term(tag), TERM_WEIGHTS["tag"]))
+            for word in WORD_PATTERN.findall(product["name"].lower()):
+                if len(word) > 3:
+                    terms.add((_normalize_term(word), TERM_WEIGHTS["name"]))
+
+            best_weights: Dict[str, int] = {}
+            for term, weight in terms:
+                best_weights[term] = max(weight, best_weights.get(term, 0))
+            for term, weight in best_weights.items():
+                self.index.setdefault(term, []).append((position, weight))
+
+    def session(self) -> "PrefilterSession":
+        """Start scoring a new description."""
+        return PrefilterSession(self)
+
+
+class PrefilterSession:
+    """Incrementally scores catalog products while a description is streamed in."""
+
+    def __init__(self, prefilter: CandidatePrefilter):
+        self.prefilter = prefilter
+        self.scores: Dict[int, int] = {}
+        self.seen_terms: Set[str] = set()
+        self.pending = ""
+
+    def feed(self, chunk: str) -> None:
+        """
+        Consume a chunk of streamed text, scoring only the words completed so far.
+
+        Args:
+            chunk: The next piece of the description
+        """
+        text = self.pending + chunk.lower()
+        # Hold back a trailing partial word until the next chunk completes it
+        cut = len(text)
+        while cut > 0 and (text[cut - 1].isalnum() or text[cut - 1] == "-"):
+            cut -= 1
+        self.pending = text[cut:]
+        self._score(text[:cut])
+
+    def finish(self) -> None:
+        """Score any word still held back at the end of the stream."""
+        self._score(self.pending)
+        self.pending = ""
+
+    def _score(self, text: str) -> None:
+        index = self.prefilter.index
+        for word in WORD_PATTERN.findall(text):
+            term = _normalize_term(word)
+            if term in self.seen_terms:
+                continue
+            self.seen_terms.add(term)
+            for position, weight in index.get(term, ()):
+                self.scores[position] = self.scores.get(position, 0) + weight
+
+    def candidates(self, min_count: int = PREFILTER_MIN_CANDIDATES,
+                   max_count: int = PREFILTER_MAX_CANDIDATES) -> Optional[List[Dict]]:
+        """
+        Get the shortlisted products, best first.
+
+        Args:
+            min_count: Minimum number of matches needed for the shortlist to be trusted
+            max_count: Maximum number of products to keep
+
+        Returns:
+            The candidate products, or None if the description matched too little
+        """
+        self.finish()
+        if len(self.scores) < min_count:
+            return None
+        ranked = sorted(self.scores.items(), key=lambda item: (-item[1], item[0]))[:max_count]
+        catalog = self.prefilter.catalog
+        return [catalog[position] for position, _ in ranked]
+
+
+def add_color_candidates(candidates: Optional[List[Dict]], color_candidates: List[Dict],
+                         max_count: int = PREFILTER_MAX_CANDIDATES) -> Optional[List[Dict]]:
+    """
+    Make room in a term shortlist for the products closest in color to the image.
+
+    Args:
+        candidates: The term prefilter's shortlist, or None when the full catalog is used
+        color_candidates: Products nearest in color, most similar first
+        max_count: Maximum size of the combined shortlist
+
+    Returns:
+        The shortlist with the color candidates it lacked appended, or None
+    """
+    if candidates is None:
+        return None
+    shortlisted = {product["id"] for product in candidates}
+    extra = [product for product in color_candidates if product["id"] not in shortlisted][:max_count]
+    return candidates[:max_count - len(extra)] + extra
+
+
+def dump_candidate_prefilter(catalog: Catalog,
+                             prefilter: CandidatePrefilter) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """Store a prefilter's term index in a catalog snapshot as flat posting arrays."""
+    terms = list(prefilter.index)
+    postings = [prefilter.index[term] for term in terms]
+    offsets = np.cumsum([0] + [len(term_postings) for term_postings in postings], dtype=np.int64)
+    positions = np.fromiter((position for term_postings in postings for position, _ in term_postings),
+                            dtype=np.int32, count=offsets.item(-1))
+    weights = np.fromiter((weight for term_postings in postings for _, weight in term_postings),
+                          dtype=np.uint8, count=offsets.item(-1))
+    return {"offsets": offsets, "positions": positions, "weights": weights}, {"terms": terms}
+
+
+def restore_candidate_prefilter(catalog: Catalog, arrays: Dict[str, np.ndarray],
+                                meta: Dict[str, Any]) -> CandidatePrefilter:
+    """Recreate a prefilter from a catalog snapshot without scanning the catalog."""
+    prefilter = CandidatePrefilter.__new__(CandidatePrefilter)
+    prefilter.catalog = catalog.products
+    prefilter.index = PostingIndex(meta["terms"], arrays["offsets"], arrays["positions"], arrays["weights"])
+    return prefilter
+
+
+@register_index("image_prefilter", dump=dump_candidate_prefilter, restore=restore_candidate_prefilter)
+def build_candidate_prefilter(catalog: Catalog) -> CandidatePrefilter:
+    """Build the image candidate prefilter for a catalog snapshot."""
+    return CandidatePrefilter(catalog.products)
+
+
+def get_candidate_prefilter(catalog: Catalog) -> CandidatePrefilter:
+    """
+    Get the prefilter for a catalog snapshot, built once per snapshot.
+
+    Args:
+        catalog: The current catalog snapshot
+
+    Returns:
+        A CandidatePrefilter for the catalog
+    """
+    return catalog.index("image_prefilter")
@@ -0,0 +1,384 @@
+"""
+Metrics for the Pocket AI e-commerce agent.
+This module provides lightweight Prometheus-style counters, gauges and histograms,
+an instrumentation decorator for pipeline stages, and an ASGI middleware for routes.
+Metrics are kept per process, so each uvicorn worker reports its own values.
+"""
+
+import time
+import bisect
+import asyncio
+import inspect
+import threading
+import functools
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Default latency buckets in seconds (sub-millisecond parsing up to multi-minute generations)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+SIMILARITY_BUCKETS = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.92, 0.94, 0.96, 0.98, 0.99, 1.0)
+SIZE_BUCKETS = (1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 2 * 1024 * 1024,
+                5 * 1024 * 1024, 10 * 1024 * 1024, 25 * 1024 * 1024)
+HAMMING_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16)
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Tuple[str, ...], labelvalues: Tuple[str, ...],
+                   extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class for labelled metrics."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: Any, **kwargs: Any):
+        """Get the child metric for a set of label values."""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """Render the metric in the Prometheus text exposition format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        with self.lock:
+            self.value = value
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+                for key, child in list(self._children.items())]
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        # Buckets are inclusive upper bounds; values above the last bound go to +Inf
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, child in list(self._children.items()):
+            with child.lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+    """Create (or get) a registered counter."""
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+    """Create (or get) a registered gauge."""
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Iterable[str] = (),
+              buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+    """Create (or get) a registered histogram."""
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# Application metrics
+HTTP_REQUESTS = counter("pocket_ai_http_requests_total", "HTTP requests handled", ("method", "route", "status"))
+HTTP_LATENCY = histogram("pocket_ai_http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+HTTP_IN_FLIGHT = gauge("pocket_ai_http_requests_in_flight", "HTTP requests currently being handled")
+STAGE_LATENCY = histogram("pocket_ai_stage_duration_seconds", "Latency of internal pipeline stages", ("stage",))
+STAGE_ERRORS = counter("pocket_ai_stage_errors_total", "Exceptions raised by pipeline stages", ("stage",))
+STAGE_IN_FLIGHT = gauge("pocket_ai_stage_in_flight", "Pipeline stage calls currently running", ("stage",))
+OLLAMA_TOKENS = counter("pocket_ai_ollama_tokens_total", "Tokens processed by Ollama", ("model", "kind"))
+OLLAMA_REQUESTS = counter("pocket_ai_ollama_requests_total", "Ollama API responses", ("model", "endpoint", "status"))
+OLLAMA_QUEUE_WAIT = histogram("pocket_ai_ollama_queue_wait_seconds",
+                              "Time an Ollama request spent outside model execution (queueing and transfer)",
+                              ("model",))
+OLLAMA_LOAD = histogram("pocket_ai_ollama_load_duration_seconds", "Model load time reported by Ollama", ("model",))
+OLLAMA_HEDGES = counter("pocket_ai_ollama_hedges_total",
+                        "Hedged Ollama requests: sent after the hedge delay, won or lost by the hedge, "
+                        "and failovers after a host error", ("model", "endpoint", "outcome"))
+OLLAMA_TIMEOUTS = counter("pocket_ai_ollama_timeouts_total", "Ollama requests abandoned after the adaptive timeout",
+                          ("model", "endpoint"))
+OLLAMA_TIMEOUT_SECONDS = gauge("pocket_ai_ollama_timeout_seconds", "Current adaptive timeout of Ollama requests",
+                               ("model", "endpoint"))
+SEMANTIC_CACHE_LOOKUPS = counter("pocket_ai_semantic_cache_lookups_total",
+                                 "Semantic cache lookups by result (exact, hit, coalesced, miss, bypass)", ("namespace", "result"))
+SEMANTIC_CACHE_SIMILARITY = histogram("pocket_ai_semantic_cache_similarity",
+                                      "Cosine similarity of the nearest cached query per lookup", ("namespace",),
+                                      SIMILARITY_BUCKETS)
+SEMANTIC_CACHE_AUDITS = counter("pocket_ai_semantic_cache_audits_total",
+                                "Sampled semantic cache hits re-generated and compared (agree, false_hit)",
+                                ("namespace", "outcome"))
+SEMANTIC_CACHE_ENTRIES = gauge("pocket_ai_semantic_cache_entries", "Entries held by the semantic cache", ("namespace",))
+CACHE_WARM_QUERIES = counter("pocket_ai_cache_warm_queries_total",
+                             "Queries processed by the cache warmer (warmed, cached, skipped, failed)", ("result",))
+CHAT_WEBSOCKETS = gauge("pocket_ai_chat_websockets", "Open chat WebSocket connections")
+IMAGE_HASH_LOOKUPS = counter("pocket_ai_image_hash_lookups_total",
+                             "Near-duplicate lookups of uploaded images by result", ("route", "result"))
+IMAGE_HASH_DISTANCE = histogram("pocket_ai_image_hash_distance", "Hamming distance of near-duplicate uploads",
+                                ("route",), HAMMING_BUCKETS)
+RATE_LIMITED_REQUESTS = counter("pocket_ai_rate_limited_requests_total",
+                                "Requests refused by the rate limiter, by the bucket that ran out (session, client)",
+                                ("route", "bucket"))
+UPLOAD_SIZE = histogram("pocket_ai_upload_size_bytes", "Size of uploaded images", ("route",), SIZE_BUCKETS)
+
+
+def record_ollama_usage(model: str, endpoint: str, result: Dict[str, Any], elapsed: float) -> None:
+    """
+    Record token counts and timing details from an Ollama response.
+
+    Args:
+        model: The model that served the request
+        endpoint: The Ollama endpoint ("chat", "generate" or "embed")
+        result: The (final) response JSON, containing eval_count, prompt_eval_count and durations
+        elapsed: Wall-clock seconds observed by the caller
+    """
+    OLLAMA_REQUESTS.labels(model, endpoint, "ok").inc()
+    if result.get("prompt_eval_count"):
+        OLLAMA_TOKENS.labels(model, "prompt").inc(result["prompt_eval_count"])
+    if result.get("eval_count"):
+        OLLAMA_TOKENS.labels(model, "completion").inc(result["eval_count"])
+    if result.get("load_duration"):
+        OLLAMA_LOAD.labels(model).observe(result["load_duration"] / 1e9)
+    if result.get("total_duration"):
+        # Ollama reports durations in nanoseconds
+        OLLAMA_QUEUE_WAIT.labels(model).observe(max(0.0, elapsed - result["total_duration"] / 1e9))
+
+
+def instrument(stage: str) -> Callable:
+    """
+    Decorator recording latency, errors and in-flight calls of a pipeline stage.
+
+    Works with regular functions, coroutine functions and async generators.
+
+    Args:
+        stage: The stage label used in the metrics
+    """
+    def decorator(func: Callable) -> Callable:
+        latency = STAGE_LATENCY.labels(stage)
+        errors = STAGE_ERRORS.labels(stage)
+        in_flight = STAGE_IN_FLIGHT.labels(stage)
+
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def async_gen_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                in_flight.inc()
+                try:
+                    async for item in func(*args, **kwargs):
+                        yield item
+                except BaseException as e:
+                    if not isinstance(e, (GeneratorExit, asyncio.CancelledError)):
+                        errors.inc()
+                    raise
+                finally:
+                    in_flight.dec()
+                    latency.observe(time.perf_counter() - start)
+            return async_gen_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                in_flight.inc()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    errors.inc()
+                    raise
+                finally:
+                    in_flight.dec()
+                    latency.observe(time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            in_flight.inc()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                in_flight.dec()
+                latency.observe(time.perf_counter() - start)
+        return wrapper
+
+    return decorator
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route request counts, latency and in-flight requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        HTTP_IN_FLIGHT.inc()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # Use the route template (set by the router) to keep label cardinality bounded
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_REQUESTS.labels(method, route_label, str(status_code)).inc()
+            HTTP_LATENCY.labels(method, route_label).observe(time.perf_counter() - start)
+
+
+def render_metrics() -> str:
+    """Render all registered metrics."""
+    return REGISTRY.render()
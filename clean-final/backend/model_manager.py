@@ -0,0 +1,177 @@
+"""
+Model lifecycle management for the Pocket AI e-commerce agent.
+This module preloads the Ollama models at backend startup on every host of the
+Ollama pool, keeps them resident with periodic keep-alive pings and reports which
+models are loaded, as last checked by the keep-alive loop.
+"""
+
+import os
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+import httpx
+
+from ai_utils import OLLAMA_MODEL, OLLAMA_VISION_MODEL, OLLAMA_KEEP_ALIVE
+from ollama_pool import OLLAMA_API_URLS
+
+logger = logging.getLogger(__name__)
+
+# Models to warm up, comma separated (default: the text and vision models)
+OLLAMA_WARM_MODELS = [
+    model.strip()
+    for model in os.getenv("OLLAMA_WARM_MODELS", f"{OLLAMA_MODEL},{OLLAMA_VISION_MODEL}").split(",")
+    if model.strip()
+]
+# Seconds between keep-alive pings (0 disables the pings, models are still preloaded)
+OLLAMA_KEEPALIVE_INTERVAL = float(os.getenv("OLLAMA_KEEPALIVE_INTERVAL", "240"))
+# Set to "false" to skip warm-up entirely (e.g. when Ollama runs elsewhere and is managed separately)
+OLLAMA_WARMUP_ENABLED = os.getenv("OLLAMA_WARMUP_ENABLED", "true").lower() not in ("0", "false", "no")
+
+
+def _model_matches(name: str, model: str) -> bool:
+    """Check whether an Ollama model name (e.g. "llava:latest") refers to a configured model."""
+    if name == model:
+        return True
+    return ":" not in model and name.split(":", 1)[0] == model
+
+
+class ModelManager:
+    """Preloads Ollama models on every host and keeps them loaded between requests."""
+
+    def __init__(self, models: List[str], keep_alive: str = OLLAMA_KEEP_ALIVE,
+                 interval: float = OLLAMA_KEEPALIVE_INTERVAL, api_urls: List[str] = OLLAMA_API_URLS):
+        """
+        Initialize the manager.
+
+        Args:
+            models: Names of the Ollama models to keep warm
+            keep_alive: Ollama keep_alive duration sent with each ping
+            interval: Seconds between keep-alive pings
+            api_urls: Base URLs of the Ollama hosts (the hosts of the Ollama pool)
+        """
+        self.models = models
+        self.keep_alive = keep_alive
+        self.interval = interval
+        self.api_urls = api_urls
+        # model -> host -> state, updated by the keep-alive loop and read by residency()
+        self.status: Dict[str, Dict[str, Dict[str, Any]]] = {
+            model: {url: {"warmed": False, "lastWarmed": None, "error": None, "loaded": None,
+                          "expiresAt": None, "sizeVram": None, "checkedAt": None} for url in api_urls}
+            for model in models
+        }
+        self._task: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            # Loading a large model from disk can take a while
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(300.0, connect=5.0))
+        return self._client
+
+    async def warm_model(self, model: str, url: str) -> bool:
+        """
+        Load a model (or refresh its keep-alive timer) on one host without generating any tokens.
+
+        Args:
+            model: The Ollama model name
+            url: Base URL of the Ollama host
+
+        Returns:
+            True if Ollama accepted the request
+        """
+        try:
+            # A generate request without a prompt only loads the model
+            response = await self._get_client().post(
+                f"{url}/generate",
+                json={"model": model, "keep_alive": self.keep_alive}
+            )
+            if response.status_code != 200:
+                raise Exception(f"status code {response.status_code} - {response.text}")
+            self.status[model][url].update(warmed=True, lastWarmed=datetime.now().isoformat(), error=None)
+            return True
+        except Exception as e:
+            logger.warning("Failed to warm model %s on %s: %s", model, url, e)
+            self.status[model][url].update(error=str(e))
+            return False
+
+    async def warm_all(self) -> None:
+        """Warm all configured models on every host concurrently."""
+        await asyncio.gather(*(self.warm_model(model, url) for model in self.models for url in self.api_urls))
+
+    async def check_host(self, url: str) -> None:
+        """Record which configured models one host has loaded, as reported by its /api/ps."""
+        checked_at = datetime.now().isoformat()
+        try:
+            response = await self._get_client().get(f"{url}/ps", timeout=2.0)
+            response.raise_for_status()
+            running = response.json().get("models", [])
+        except Exception as e:
+            for model in self.models:
+                self.status[model][url].update(loaded=None, checkedAt=checked_at,
+                                               error=f"Ollama unreachable: {str(e)}")
+            return
+        for model in self.models:
+            loaded = next((m for m in running if _model_matches(m.get("name", ""), model)), None)
+            self.status[model][url].update(
+                loaded=loaded is not None, checkedAt=checked_at,
+                expiresAt=loaded.get("expires_at") if loaded else None,
+                sizeVram=loaded.get("size_vram") if loaded else None,
+            )
+
+    async def refresh(self) -> None:
+        """Ping every model on every host, then record what each host has loaded."""
+        await self.warm_all()
+        await asyncio.gather(*(self.check_host(url) for url in self.api_urls))
+
+    async def _run(self) -> None:
+        logger.info("Preloading models %s on %s (keep_alive=%s)", self.models, self.api_urls, self.keep_alive)
+        await self.refresh()
+        while self.interval > 0:
+            await asyncio.sleep(self.interval)
+            await self.refresh()
+
+    def start(self) -> None:
+        """Start preloading and the periodic keep-alive pings in the background."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the keep-alive pings and close the HTTP client."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def residency(self) -> Dict[str, Any]:
+        """
+        Report which configured models are loaded, as last checked by the keep-alive loop.
+
+        Does no I/O, so health checks do not depend on Ollama's latency.
+
+        Returns:
+            A mapping of model name to {"warmed", "loaded", "hosts"}: warmed and loaded are true
+            when they hold on every host (loaded is None until every host has been checked),
+            and hosts holds the details per host (from Ollama's /api/ps)
+        """
+        report = {}
+        for model in self.models:
+            hosts = {url: dict(state) for url, state in self.status[model].items()}
+            loaded = [state["loaded"] for state in hosts.values()]
+            report[model] = {
+                "warmed": all(state["warmed"] for state in hosts.values()),
+                "loaded": None if None in loaded else all(loaded),
+                "hosts": hosts,
+            }
+        return report
+
+
+# Shared manager for the backend process
+model_manager = ModelManager(OLLAMA_WARM_MODELS)
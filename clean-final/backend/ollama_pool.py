@@ -0,0 +1,305 @@
+"""
+Ollama host pool with adaptive timeouts and hedged requests for the Pocket AI e-commerce agent.
+Requests go to the host of OLLAMA_API_URLS with the fewest requests in flight. The
+latencies of recent successful requests (from the first send, so a hedged request counts
+its wait for the stalled host too) are kept per model and endpoint: a request times
+out after OLLAMA_TIMEOUT_MULTIPLIER times their 99th percentile (within OLLAMA_TIMEOUT_MIN
+and OLLAMA_TIMEOUT_MAX), and a request still unanswered after their 95th percentile is
+hedged, i.e. sent again to another host, and whichever answers first is used while the
+other is cancelled. Hedges therefore cost about 5% extra requests and cut the tail that
+a stalled or overloaded host would otherwise cause.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+from metrics import OLLAMA_HEDGES, OLLAMA_TIMEOUTS, OLLAMA_TIMEOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated Ollama API base URLs serving the same models (default: OLLAMA_API_URL)
+OLLAMA_API_URLS = [
+    url.strip().rstrip("/")
+    for url in os.getenv("OLLAMA_API_URLS", os.getenv("OLLAMA_API_URL", "http://localhost:11434/api")).split(",")
+    if url.strip()
+]
+# A request times out after this multiple of the p99 latency of its model and endpoint
+OLLAMA_TIMEOUT_MULTIPLIER = float(os.getenv("OLLAMA_TIMEOUT_MULTIPLIER", "3"))
+# Bounds of the adaptive timeout in seconds; the maximum also applies until enough latencies are known
+OLLAMA_TIMEOUT_MIN = float(os.getenv("OLLAMA_TIMEOUT_MIN", "10"))
+OLLAMA_TIMEOUT_MAX = float(os.getenv("OLLAMA_TIMEOUT_MAX", "300"))
+# Set to "false" to never send hedged requests (they need at least two hosts)
+OLLAMA_HEDGE_ENABLED = os.getenv("OLLAMA_HEDGE_ENABLED", "true").lower() not in ("0", "false", "no")
+# Latency percentile after which an unanswered request is hedged
+OLLAMA_HEDGE_PERCENTILE = float(os.getenv("OLLAMA_HEDGE_PERCENTILE", "95"))
+
+# Recent latencies kept per model and endpoint
+LATENCY_WINDOW = 256
+# Latencies needed before timeouts and hedge delays adapt
+MIN_SAMPLES = 20
+# Shortest hedge delay; hedging sooner mostly duplicates requests that were about to finish
+MIN_HEDGE_DELAY = 0.05
+# Seconds a host that refused a connection is only used when no other host is available
+HOST_RETRY_INTERVAL = 10.0
+
+
+class OllamaTimeout(Exception):
+    """Raised when no host answered within the adaptive timeout."""
+
+
+class LatencyTracker:
+    """Sliding windows of request latencies per (model, endpoint)."""
+
+    def __init__(self, window: int = LATENCY_WINDOW, min_samples: int = MIN_SAMPLES,
+                 multiplier: float = OLLAMA_TIMEOUT_MULTIPLIER, min_timeout: float = OLLAMA_TIMEOUT_MIN,
+                 max_timeout: float = OLLAMA_TIMEOUT_MAX, hedge_percentile: float = OLLAMA_HEDGE_PERCENTILE):
+        """
+        Args:
+            window: Latencies kept per model and endpoint
+            min_samples: Latencies needed before the timeout adapts and hedging starts
+            multiplier: Timeout as a multiple of the p99 latency
+            min_timeout: Lower bound of the timeout in seconds
+            max_timeout: Upper bound of the timeout, used until min_samples latencies are known
+            hedge_percentile: Latency percentile used as the hedge delay
+        """
+        self.window = window
+        self.min_samples = min_samples
+        self.multiplier = multiplier
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.hedge_percentile = hedge_percentile
+        self._lock = threading.Lock()
+        self._samples: Dict[Tuple[str, str], Deque[float]] = {}
+        # (p99, hedge percentile) per key, recomputed after each new sample
+        self._percentiles: Dict[Tuple[str, str], Tuple[float, float]] = {}
+
+    def record(self, model: str, endpoint: str, seconds: float) -> None:
+        """Add the latency of a finished (or timed out) request."""
+        key = (model, endpoint)
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+            if len(samples) >= self.min_samples:
+                p99, hedge = np.percentile(np.fromiter(samples, dtype=np.float64, count=len(samples)),
+                                           (99, self.hedge_percentile))
+                self._percentiles[key] = (float(p99), float(hedge))
+        OLLAMA_TIMEOUT_SECONDS.labels(model, endpoint).set(self.timeout(model, endpoint))
+
+    def timeout(self, model: str, endpoint: str) -> float:
+        """Seconds a request may take before it is abandoned."""
+        percentiles = self._percentiles.get((model, endpoint))
+        if percentiles is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, percentiles[0] * self.multiplier))
+
+    def hedge_delay(self, model: str, endpoint: str) -> Optional[float]:
+        """Seconds after which a request is hedged, or None until enough latencies are known."""
+        percentiles = self._percentiles.get((model, endpoint))
+        if percentiles is None:
+            return None
+        return max(MIN_HEDGE_DELAY, percentiles[1])
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Current timeout, hedge delay and sample count per model and endpoint (for /api/health)."""
+        with self._lock:
+            keys = list(self._samples)
+            counts = {key: len(self._samples[key]) for key in keys}
+        delays = {key: self.hedge_delay(*key) for key in keys}
+        return {
+            f"{model}/{endpoint}": {"samples": counts[(model, endpoint)],
+                                    "timeout": round(self.timeout(model, endpoint), 3),
+                                    "hedgeDelay": None if delays[(model, endpoint)] is None
+                                    else round(delays[(model, endpoint)], 3)}
+            for model, endpoint in keys
+        }
+
+
+class OllamaPool:
+    """Ollama hosts serving the same models, picked by fewest requests in flight."""
+
+    def __init__(self, urls: List[str] = OLLAMA_API_URLS, hedge_enabled: bool = OLLAMA_HEDGE_ENABLED,
+                 tracker: Optional[LatencyTracker] = None):
+        """
+        Args:
+            urls: Ollama API base URLs (ending in /api)
+            hedge_enabled: Whether slow requests are hedged to another host
+            tracker: Latency statistics used for timeouts and hedge delays
+        """
+        self.urls = urls
+        self.hedge_enabled = hedge_enabled and len(urls) > 1
+        self.tracker = tracker or LatencyTracker()
+        self._in_flight = {url: 0 for url in urls}
+        self._failed_at = {url: -HOST_RETRY_INTERVAL for url in urls}
+        self._next = 0
+
+    def hosts(self) -> List[str]:
+        """Hosts in order of preference: reachable before recently failed, then fewest in flight."""
+        now = time.monotonic()
+        # Rotate the start so that idle hosts share the load
+        self._next = (self._next + 1) % len(self.urls)
+        rotated = self.urls[self._next:] + self.urls[:self._next]
+        return sorted(rotated, key=lambda url: (now - self._failed_at[url] < HOST_RETRY_INTERVAL, self._in_flight[url]))
+
+    def acquire(self, url: str) -> None:
+        """Count a request started on a host (pair with release)."""
+        self._in_flight[url] += 1
+
+    def release(self, url: str, failed: bool = False) -> None:
+        """Count a request finished on a host; failed marks it as refusing connections."""
+        self._in_flight[url] -= 1
+        if failed:
+            self._failed_at[url] = time.monotonic()
+
+    async def _post_to(self, client: httpx.AsyncClient, url: str, endpoint: str, payload: Dict[str, Any],
+                       timeout: float) -> httpx.Response:
+        self.acquire(url)
+        failed = False
+        try:
+            return await client.post(f"{url}/{endpoint}", json=payload,
+                                     timeout=httpx.Timeout(timeout, connect=min(timeout, 10.0)))
+        except httpx.TransportError:
+            failed = True
+            raise
+        finally:
+            self.release(url, failed)
+
+    async def post(self, client: httpx.AsyncClient, endpoint: str, payload: Dict[str, Any]) -> httpx.Response:
+        """
+        Send a non-streaming request, hedged to a second host when it is slow.
+
+        Args:
+            client: The HTTP client to send with
+            endpoint: Ollama endpoint ("chat", "generate" or "embed")
+            payload: Request JSON, including "model"
+
+        Returns:
+            The first successful (2xx/4xx) response, or the last response when every host
+            answered with a server error
+
+        Raises:
+            OllamaTimeout: No host answered within the adaptive timeout
+            httpx.TransportError: Every attempted host failed to connect
+        """
+        model = payload.get("model", "")
+        timeout = self.tracker.timeout(model, endpoint)
+        hedge_delay = self.tracker.hedge_delay(model, endpoint) if self.hedge_enabled else None
+        hosts = self.hosts()
+        started = time.perf_counter()
+        deadline = started + timeout
+        hedge_at = started + hedge_delay if hedge_delay is not None else None
+        attempts: Dict[asyncio.Task, str] = {}
+
+        def send(url: str) -> None:
+            attempts[asyncio.create_task(self._post_to(client, url, endpoint, payload, timeout))] = url
+
+        send(hosts[0])
+        hedged = False
+        result: Optional[httpx.Response] = None
+        error: Optional[BaseException] = None
+        try:
+            while True:
+                pending = {task for task in attempts if not task.done()}
+                now = time.perf_counter()
+                if len(attempts) == 1 and len(hosts) > 1:
+                    if not pending:
+                        # The first host failed: fail over to the next one right away
+                        OLLAMA_HEDGES.labels(model, endpoint, "failover").inc()
+                        send(hosts[1])
+                        continue
+                    if hedge_at is not None and now >= hedge_at:
+                        hedged = True
+                        OLLAMA_HEDGES.labels(model, endpoint, "sent").inc()
+                        send(hosts[1])
+                        continue
+                if not pending or now >= deadline:
+                    break
+                wake = min(deadline, hedge_at) if hedge_at is not None and len(attempts) == 1 else deadline
+                done, _ = await asyncio.wait(pending, timeout=max(0.0, wake - now),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    result = response
+                    if response.status_code < 500:
+                        # The latency of the request as a whole, from the first send: a hedged request
+                        # counts at least as long as its abandoned primary ran, so the percentiles keep
+                        # seeing the tail that hedging hides from the caller
+                        self.tracker.record(model, endpoint, time.perf_counter() - started)
+                        if hedged:
+                            OLLAMA_HEDGES.labels(model, endpoint, "won" if attempts[task] != hosts[0] else "lost").inc()
+                        return response
+            if result is not None:
+                return result
+            if error is not None and not any(not task.done() for task in attempts):
+                raise error
+            # Count the timeout as a latency sample so that the percentiles do not only see fast requests
+            self.tracker.record(model, endpoint, timeout)
+            OLLAMA_TIMEOUTS.labels(model, endpoint).inc()
+            raise OllamaTimeout(f"Ollama {endpoint} for {model} timed out after {timeout:.1f}s")
+        finally:
+            for task in attempts:
+                if not task.done():
+                    # Closing the connection makes Ollama stop generating for the abandoned request
+                    task.cancel()
+
+    @asynccontextmanager
+    async def stream(self, client: httpx.AsyncClient, endpoint: str,
+                     payload: Dict[str, Any]) -> AsyncIterator[httpx.Response]:
+        """
+        Open a streaming request on the preferred host.
+
+        Streams are not hedged. Ollama sends the response headers with the first token,
+        so the adaptive timeout of "<endpoint>_stream" bounds the time to the first token
+        and every later gap between chunks.
+
+        Args:
+            client: The HTTP client to send with
+            endpoint: Ollama endpoint ("chat" or "generate")
+            payload: Request JSON, including "model" and "stream": true
+
+        Yields:
+            The streaming response
+
+        Raises:
+            OllamaTimeout: The host sent nothing within the timeout
+        """
+        model = payload.get("model", "")
+        key = f"{endpoint}_stream"
+        timeout = self.tracker.timeout(model, key)
+        url = self.hosts()[0]
+        self.acquire(url)
+        failed = False
+        start = time.perf_counter()
+        try:
+            async with client.stream("POST", f"{url}/{endpoint}", json=payload,
+                                     timeout=httpx.Timeout(timeout, connect=min(timeout, 10.0))) as response:
+                if response.status_code == 200:
+                    self.tracker.record(model, key, time.perf_counter() - start)
+                yield response
+        except httpx.ReadTimeout:
+            self.tracker.record(model, key, timeout)
+            OLLAMA_TIMEOUTS.labels(model, key).inc()
+            raise OllamaTimeout(f"Ollama {endpoint} stream for {model} sent nothing for {timeout:.1f}s")
+        except httpx.TransportError:
+            failed = True
+            raise
+        finally:
+            self.release(url, failed)
+
+
+# Shared pool for the backend process
+ollama_pool = OllamaPool()
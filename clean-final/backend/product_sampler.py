@@ -0,0 +1,182 @@
+"""
+Random product sampling for the Pocket AI e-commerce agent.
+Fallback recommendations draw a few products from the catalog. The sampler keeps the
+catalog rows of each category (computed once per catalog snapshot) so k products are
+drawn in O(k) time, optionally spread over distinct categories (stratified) and weighted
+by popularity, i.e. how often products were actually recommended or matched.
+"""
+
+import os
+import time
+import bisect
+import random
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from catalog import Catalog, register_index
+
+# Popularity-weighted tables are rebuilt at most this often (seconds) after new recommendations
+POPULARITY_REFRESH_INTERVAL = float(os.getenv("POPULARITY_REFRESH_INTERVAL", "30"))
+
+
+class ProductPopularity:
+    """Thread-safe counts of how often each product ID was recommended or matched (per process)."""
+
+    def __init__(self):
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def record(self, product_ids: Iterable[int]) -> None:
+        """Count one recommendation for each product ID."""
+        with self._lock:
+            self._counts.update(product_ids)
+            self.version += 1
+
+    def snapshot(self) -> Tuple[int, Dict[int, int]]:
+        """The current version and a copy of the counts."""
+        with self._lock:
+            return self.version, dict(self._counts)
+
+
+# Survives catalog reloads; counts of products no longer in the catalog are ignored
+popularity = ProductPopularity()
+
+
+class ProductSampler:
+    """Draws random catalog rows without replacement, optionally stratified and popularity-weighted."""
+
+    def __init__(self, catalog: Catalog):
+        """
+        Precompute the category groups of a catalog snapshot.
+
+        Args:
+            catalog: The catalog snapshot
+        """
+        self.catalog = catalog
+        self.size = len(catalog.products)
+        self.categories = list(catalog.by_category)
+        self.category_rows = [catalog.by_category[category].rows for category in self.categories]
+        self.category_of_row = catalog.products.category_codes
+        self.category_index = [self.categories.index(name) for name in catalog.products.categories]
+        self._weights_version: Optional[int] = None
+        self._weights_built = 0.0
+        self._weights_lock = threading.Lock()
+        # Per category: (popular rows, cumulative counts)
+        self._popular: List[Tuple[List[int], List[int]]] = []
+        # For the whole catalog: ((popular rows, cumulative counts), catalog row -> its position)
+        self._popular_all: Tuple[Tuple[List[int], List[int]], Dict[int, int]] = (([], []), {})
+
+    def _refresh_weights(self) -> None:
+        """Rebuild the popular-row tables when popularity changed (throttled)."""
+        if popularity.version == self._weights_version:
+            return
+        if self._weights_version is not None and time.monotonic() - self._weights_built < POPULARITY_REFRESH_INTERVAL:
+            return
+        with self._weights_lock:
+            version, counts = popularity.snapshot()
+            per_category: List[Tuple[List[int], List[int]]] = [([], []) for _ in self.categories]
+            all_rows, all_cumulative = [], []
+            for product_id, count in sorted(counts.items()):
+                row = self.catalog.products.row_of(product_id)
+                if row is None:
+                    continue
+                rows, cumulative = per_category[self.category_index[self.category_of_row.item(row)]]
+                rows.append(row)
+                cumulative.append((cumulative[-1] if cumulative else 0) + count)
+                all_rows.append(row)
+                all_cumulative.append((all_cumulative[-1] if all_cumulative else 0) + count)
+            positions = {row: position for position, row in enumerate(all_rows)}
+            self._popular, self._popular_all = per_category, ((all_rows, all_cumulative), positions)
+            self._weights_version, self._weights_built = version, time.monotonic()
+
+    @staticmethod
+    def _draw(rows, popular: Optional[Tuple[List[int], List[int]]], excluded: Sequence[int] = ()) -> int:
+        """
+        Draw one row; with popularity each row has weight 1 + its recommendation count.
+
+        The weighted draw is a mixture: a uniform row with probability n / (n + hits),
+        otherwise a popular row proportional to its count (binary search over the counts).
+        The popular rows at the (ascending) positions in excluded are left out of the
+        second part, so rows already drawn only keep their uniform weight.
+        """
+        count = len(rows)
+        if popular and popular[1]:
+            popular_rows, cumulative = popular
+            starts = [cumulative[position - 1] if position else 0 for position in excluded]
+            weights = [cumulative[position] - start for position, start in zip(excluded, starts)]
+            hit = random.randrange(count + cumulative[-1] - sum(weights))
+            if hit >= count:
+                hit -= count
+                # Step over the count ranges of the excluded rows, lowest first
+                for start, weight in zip(starts, weights):
+                    if hit < start:
+                        break
+                    hit += weight
+                return popular_rows[bisect.bisect_right(cumulative, hit)]
+        return int(rows[random.randrange(count)])
+
+    def sample(self, count: int, stratified: bool = True, weighted: bool = False) -> List[int]:
+        """
+        Draw distinct catalog rows.
+
+        Args:
+            count: Number of rows (capped at the catalog size)
+            stratified: Take each of the first rows from a different category, chosen at random
+            weighted: Prefer products that were recommended more often
+
+        Returns:
+            The catalog rows, in random order
+        """
+        count = max(0, min(count, self.size))
+        if weighted:
+            self._refresh_weights()
+        if count * 2 > self.size:
+            # Most of the catalog: a shuffle is cheaper than rejection sampling
+            rows = list(range(self.size))
+            random.shuffle(rows)
+            return rows[:count]
+
+        selected: List[int] = []
+        seen = set()
+        popular, positions = self._popular_all if weighted else (None, {})
+        # Positions of the selected popular rows, which are excluded from further weighted draws
+        excluded: List[int] = []
+        if stratified and self.categories:
+            for index in random.sample(range(len(self.categories)), min(count, len(self.categories))):
+                row = self._draw(self.category_rows[index], self._popular[index] if weighted else None)
+                selected.append(row)
+                seen.add(row)
+                if row in positions:
+                    bisect.insort(excluded, positions[row])
+        # Rejection sampling; popular draws never repeat a selected row and uniform draws hit one
+        # with p <= 1/2 (at most half of the catalog is taken), so each draw succeeds with p >= 1/2
+        everything = range(self.size)
+        while len(selected) < count:
+            row = self._draw(everything, popular, excluded)
+            if row not in seen:
+                selected.append(row)
+                seen.add(row)
+                if row in positions:
+                    bisect.insort(excluded, positions[row])
+        return selected
+
+
+@register_index("product_sampler")
+def build_product_sampler(catalog: Catalog) -> ProductSampler:
+    """Build the random product sampler for a catalog snapshot."""
+    return ProductSampler(catalog)
+
+
+def get_product_sampler(catalog: Catalog) -> ProductSampler:
+    """
+    Get the product sampler for a catalog snapshot, built once per snapshot.
+
+    Args:
+        catalog: The current catalog snapshot
+
+    Returns:
+        A ProductSampler for the catalog
+    """
+    return catalog.index("product_sampler")
@@ -0,0 +1,470 @@
+"""
+Faceted product search for the Pocket AI e-commerce agent.
+This module answers /api/products queries (category, type, tag and price filters,
+sorting, cursor pagination and facet counts) from indexes precomputed once per
+catalog snapshot: one bitmap per category, type and tag, prefix bitmaps at price
+quantiles, and the catalog rows in each sort order.
+"""
+
+import json
+import base64
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import instrument
+from catalog import Catalog, register_index
+from product_table import ProductTable, ProductView
+
+logger = logging.getLogger(__name__)
+
+# Sort orders accepted by search(); a leading "-" sorts descending. Ties are broken by product ID.
+SORT_FIELDS = ("id", "price", "name")
+SORTS = SORT_FIELDS + tuple(f"-{field}" for field in SORT_FIELDS)
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+# Number of price quantiles with a prefix bitmap; a price range costs two bitmap
+# operations plus the rows of at most two partial quantiles
+PRICE_BUCKETS = 64
+
+# Below this fraction of the catalog, matches are listed as rows instead of being scanned in sort order
+SPARSE_FRACTION = 1 / 64
+
+FACETS = ("category", "type", "tags")
+
+# Bit counts are summed as int32 (twice as fast as int64) while a bitmap row cannot exceed it
+if hasattr(np, "bitwise_count"):
+    def _popcount(words: np.ndarray, axis: Optional[int] = None) -> Any:
+        counts = np.bitwise_count(words)
+        return counts.sum(axis=axis, dtype=np.int32 if words.shape[-1] < 2**25 else np.int64)
+else:
+    _POPCOUNT_TABLE = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+    def _popcount(words: np.ndarray, axis: Optional[int] = None) -> Any:
+        counts = _POPCOUNT_TABLE[words.view(np.uint8)]
+        dtype = np.int32 if words.shape[-1] < 2**25 else np.int64
+        if axis is None:
+            return counts.sum(dtype=dtype)
+        return counts.reshape(words.shape[0], -1).sum(axis=1, dtype=dtype)
+
+
+def _bitmap(mask: np.ndarray, words: int) -> np.ndarray:
+    """Pack a boolean row mask into 64-bit words (bit r of the bitmap is row r)."""
+    packed = np.packbits(mask, bitorder="little")
+    padded = np.zeros(words * 8, dtype=np.uint8)
+    padded[:len(packed)] = packed
+    return padded.view(np.uint64)
+
+
+def _set_rows(bitmap: np.ndarray, rows: np.ndarray) -> None:
+    """Set the bits of the given rows in place."""
+    rows = rows.astype(np.uint64)
+    np.bitwise_or.at(bitmap, (rows >> np.uint64(6)).astype(np.intp), np.uint64(1) << (rows & np.uint64(63)))
+
+
+def _test_rows(bitmap: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Boolean mask of the rows whose bit is set."""
+    rows = rows.astype(np.uint64)
+    return ((bitmap[(rows >> np.uint64(6)).astype(np.intp)] >> (rows & np.uint64(63))) & np.uint64(1)).astype(bool)
+
+
+def _bitmap_rows(bitmap: np.ndarray) -> np.ndarray:
+    """Rows whose bit is set, in no particular order (cost grows with the number of set bits)."""
+    index = np.flatnonzero(bitmap)
+    words = bitmap[index]
+    parts = []
+    while len(index):
+        # Peel off the lowest set bit of every remaining word; a power of two converts to float exactly
+        lowest = words & (~words + np.uint64(1))
+        parts.append(index * 64 + np.log2(lowest.astype(np.float64)).astype(np.int64))
+        words = words ^ lowest
+        remaining = words != 0
+        index, words = index[remaining], words[remaining]
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+
+def encode_cursor(sort: str, key: Any, product_id: int) -> str:
+    """Encode the position after a product as an opaque cursor (stays valid across catalog reloads)."""
+    raw = json.dumps({"s": sort, "k": key, "i": product_id}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[Any, int]:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed or belongs to another sort order
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        key, product_id = data["k"], int(data["i"])
+        cursor_sort = data["s"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("Invalid cursor") from e
+    if cursor_sort != sort:
+        raise ValueError(f"Cursor was issued for sort '{cursor_sort}', not '{sort}'")
+    return key, product_id
+
+
+class ProductSearchIndex:
+    """Bitmap and sort-order indexes answering faceted product queries."""
+
+    def __init__(self, table: ProductTable, arrays: Optional[Dict[str, np.ndarray]] = None):
+        """
+        Build the indexes for a product table, or wrap prebuilt ones.
+
+        Args:
+            table: The product table
+            arrays: Index arrays from snapshot_arrays() (e.g. mapped from a catalog snapshot)
+        """
+        self.table = table
+        self.size = len(table)
+        self.words = (self.size + 63) // 64
+        self.values = {"category": table.categories, "type": table.types, "tags": table.tags}
+        self.codes = {facet: {value: code for code, value in enumerate(values)}
+                      for facet, values in self.values.items()}
+        if arrays is None:
+            arrays = self._build()
+        self.bitmaps = {facet: arrays[f"{facet}_bitmaps"].reshape(-1, self.words) for facet in FACETS}
+        self.counts = {facet: arrays[f"{facet}_counts"] for facet in FACETS}
+        self.price_prefix = arrays["price_prefix"].reshape(-1, self.words)
+        self.orders = {field: arrays[f"{field}_order"] for field in SORT_FIELDS}
+        self.ranks = {field: arrays[f"{field}_rank"] for field in SORT_FIELDS}
+
+    def _build(self) -> Dict[str, np.ndarray]:
+        table, size, words = self.table, self.size, self.words
+        arrays: Dict[str, np.ndarray] = {}
+
+        tag_rows = np.repeat(np.arange(size, dtype=np.int64), np.diff(table.tag_offsets))
+        sources = {"category": (table.category_codes, None), "type": (table.type_codes, None),
+                   "tags": (table.tag_codes, tag_rows)}
+        for facet, (codes, rows) in sources.items():
+            bitmaps = np.zeros((len(self.values[facet]), words), dtype=np.uint64)
+            for code in range(len(self.values[facet])):
+                if rows is None:
+                    bitmaps[code] = _bitmap(codes == code, words)
+                else:
+                    mask = np.zeros(size, dtype=bool)
+                    mask[rows[codes == code]] = True
+                    bitmaps[code] = _bitmap(mask, words)
+            arrays[f"{facet}_bitmaps"] = bitmaps.reshape(-1)
+            arrays[f"{facet}_counts"] = _popcount(bitmaps, axis=1) if len(bitmaps) else np.zeros(0, dtype=np.int64)
+
+        row_dtype = np.int32 if size < 2**31 else np.int64
+        names = table.names
+        orders = {
+            "id": np.argsort(table.ids, kind="stable"),
+            "price": np.lexsort((table.ids, table.prices)),
+            "name": np.array(sorted(range(size), key=lambda row: (names.encoded(row), table.product_id(row))),
+                             dtype=np.int64),
+        }
+        for field, order in orders.items():
+            rank = np.empty(size, dtype=row_dtype)
+            rank[order] = np.arange(size, dtype=row_dtype)
+            arrays[f"{field}_order"] = order.astype(row_dtype)
+            arrays[f"{field}_rank"] = rank
+
+        # Prefix bitmap k holds the rows whose price rank is below bucket boundary k
+        boundaries = self._price_boundaries()
+        prefix = np.zeros((len(boundaries), words), dtype=np.uint64)
+        price_rank = arrays["price_rank"]
+        for k, boundary in enumerate(boundaries):
+            prefix[k] = _bitmap(price_rank < boundary, words)
+        arrays["price_prefix"] = prefix.reshape(-1)
+        return arrays
+
+    def _price_boundaries(self) -> List[int]:
+        return [self.size * k // PRICE_BUCKETS for k in range(PRICE_BUCKETS + 1)]
+
+    def snapshot_arrays(self) -> Dict[str, np.ndarray]:
+        """The index arrays, for storing in a catalog snapshot."""
+        arrays = {f"{facet}_bitmaps": self.bitmaps[facet].reshape(-1) for facet in FACETS}
+        arrays.update({f"{facet}_counts": self.counts[facet] for facet in FACETS})
+        arrays["price_prefix"] = self.price_prefix.reshape(-1)
+        arrays.update({f"{field}_order": self.orders[field] for field in SORT_FIELDS})
+        arrays.update({f"{field}_rank": self.ranks[field] for field in SORT_FIELDS})
+        return arrays
+
+    # Filtering
+
+    def _facet_bitmap(self, facet: str, values: Iterable[str]) -> np.ndarray:
+        """Rows having any of the values (unknown values match nothing)."""
+        codes = [self.codes[facet][value] for value in values if value in self.codes[facet]]
+        if not codes:
+            return np.zeros(self.words, dtype=np.uint64)
+        return np.bitwise_or.reduce(self.bitmaps[facet][codes], axis=0)
+
+    def _sort_key(self, field: str, row: int) -> Tuple[Any, int]:
+        table = self.table
+        if field == "price":
+            return table.price(row), table.product_id(row)
+        if field == "name":
+            return table.names.encoded(row), table.product_id(row)
+        return table.product_id(row), table.product_id(row)
+
+    def _cursor_key(self, field: str, row: int) -> Any:
+        if field == "price":
+            return self.table.price(row)
+        if field == "name":
+            return self.table.names[row]
+        return self.table.product_id(row)
+
+    def _lower_bound(self, field: str, key: Tuple[Any, int], strict: bool = False) -> int:
+        """First position in the ascending sort order whose (key, id) is >= key (> key if strict)."""
+        order = self.orders[field]
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            candidate = self._sort_key(field, order.item(middle))
+            if candidate < key or (strict and candidate == key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _price_bound(self, price: float, upper: bool) -> int:
+        order, prices = self.orders["price"], self.table.prices
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            value = prices.item(order.item(middle))
+            if value < price or (upper and value == price):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _price_positions(self, min_price: Optional[float], max_price: Optional[float]) -> Tuple[int, int]:
+        """Span of the price sort order priced within [min_price, max_price]."""
+        start = 0 if min_price is None else self._price_bound(min_price, upper=False)
+        end = self.size if max_price is None else self._price_bound(max_price, upper=True)
+        return start, max(start, end)
+
+    def _price_bitmap(self, start: int, end: int) -> np.ndarray:
+        """Rows in a span of the price sort order, from the quantile prefix bitmaps."""
+        if end <= start:
+            return np.zeros(self.words, dtype=np.uint64)
+        boundaries = self._price_boundaries()
+        first = next(k for k, boundary in enumerate(boundaries) if boundary >= start)
+        last = max(k for k, boundary in enumerate(boundaries) if boundary <= end)
+        order = self.orders["price"]
+        if first >= last:
+            bitmap = np.zeros(self.words, dtype=np.uint64)
+            _set_rows(bitmap, order[start:end])
+            return bitmap
+        # Whole quantiles from the prefix bitmaps, the partial ones at both ends row by row
+        bitmap = self.price_prefix[last] & ~self.price_prefix[first]
+        if start < boundaries[first]:
+            _set_rows(bitmap, order[start:boundaries[first]])
+        if boundaries[last] < end:
+            _set_rows(bitmap, order[boundaries[last]:end])
+        return bitmap
+
+    def match(self, categories: Iterable[str] = (), types: Iterable[str] = (), tags: Iterable[str] = (),
+              min_price: Optional[float] = None, max_price: Optional[float] = None) -> Optional[np.ndarray]:
+        """
+        Bitmap of the rows matching all filters.
+
+        Categories and types match any of the given values; tags must all be present.
+
+        Returns:
+            The bitmap, or None when no filter is given (every row matches)
+        """
+        price_span = None
+        if min_price is not None or max_price is not None:
+            price_span = self._price_positions(min_price, max_price)
+        return self._match(categories, types, tags, price_span)
+
+    def _match(self, categories: Iterable[str], types: Iterable[str], tags: Iterable[str],
+               price_span: Optional[Tuple[int, int]]) -> Optional[np.ndarray]:
+        bitmap: Optional[np.ndarray] = None
+
+        def combine(other: np.ndarray) -> None:
+            nonlocal bitmap
+            bitmap = other if bitmap is None else bitmap & other
+
+        categories = [value.strip().lower() for value in categories if value.strip()]
+        types = [value.strip().lower() for value in types if value.strip()]
+        tags = [value.strip() for value in tags if value.strip()]
+        if categories:
+            combine(self._facet_bitmap("category", categories))
+        if types:
+            combine(self._facet_bitmap("type", types))
+        for tag in tags:
+            combine(self._facet_bitmap("tags", [tag]))
+        if price_span is not None:
+            combine(self._price_bitmap(*price_span))
+        return bitmap
+
+    # Results
+
+    def _facet_counts(self, bitmap: Optional[np.ndarray], rows: Optional[np.ndarray]) -> Dict[str, Dict[str, int]]:
+        table = self.table
+        facets = {}
+        for facet in FACETS:
+            if bitmap is None:
+                counts = self.counts[facet]
+            elif rows is not None:
+                if facet == "tags":
+                    # Positions of every matching row's tags in the flat tag column
+                    starts = table.tag_offsets[rows]
+                    lengths = table.tag_offsets[rows + 1] - starts
+                    block_starts = np.cumsum(lengths) - lengths
+                    positions = np.repeat(starts - block_starts, lengths) + np.arange(lengths.sum())
+                    codes = table.tag_codes[positions]
+                else:
+                    codes = (table.category_codes if facet == "category" else table.type_codes)[rows]
+                counts = np.bincount(codes, minlength=len(self.values[facet]))
+            else:
+                counts = _popcount(self.bitmaps[facet] & bitmap, axis=1)
+            facets[facet] = {value: int(count) for value, count in zip(self.values[facet], counts.tolist()) if count}
+        return facets
+
+    def _price_range(self, bitmap: Optional[np.ndarray], rows: Optional[np.ndarray],
+                     price_span: Tuple[int, int]) -> Optional[Dict[str, float]]:
+        prices = self.table.prices
+        if rows is not None:
+            if not len(rows):
+                return None
+            selected = prices[rows]
+            return {"min": float(selected.min()), "max": float(selected.max())}
+        order = self.orders["price"]
+        if bitmap is None:
+            return {"min": prices.item(order.item(0)), "max": prices.item(order.item(-1))}
+        # Matches cannot lie outside the price filter's span of the price order
+        lowest = next(self._scan(bitmap, order, price_span[0], 1, ascending=True), None)
+        highest = next(self._scan(bitmap, order, price_span[1], 1, ascending=False), None)
+        return {"min": prices.item(lowest), "max": prices.item(highest)}
+
+    def _scan(self, bitmap: Optional[np.ndarray], order: np.ndarray, position: int, limit: int, ascending: bool):
+        """Yield up to `limit` matching rows walking the sort order from a position, in growing chunks."""
+        chunk = max(64, limit * 4)
+        found = 0
+        while found < limit and (position < self.size if ascending else position > 0):
+            if ascending:
+                rows = order[position:position + chunk]
+                position += chunk
+            else:
+                rows = order[max(0, position - chunk):position][::-1]
+                position -= chunk
+            if bitmap is not None:
+                rows = rows[_test_rows(bitmap, rows)]
+            for row in rows[:limit - found].tolist():
+                yield row
+            found += min(len(rows), limit - found)
+            chunk *= 2
+
+    @instrument("product_search")
+    def search(self, categories: Iterable[str] = (), types: Iterable[str] = (), tags: Iterable[str] = (),
+               min_price: Optional[float] = None, max_price: Optional[float] = None, sort: str = "id",
+               limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Filter, sort and paginate the catalog.
+
+        Args:
+            categories: Categories to include (any of)
+            types: Product types to include (any of)
+            tags: Tags every product must have
+            min_price: Lowest price to include
+            max_price: Highest price to include
+            sort: One of SORTS
+            limit: Page size (1-MAX_PAGE_SIZE)
+            cursor: nextCursor of the previous page
+
+        Returns:
+            A dictionary with the page of products, the total number of matches, facet
+            counts over all matches and the cursor of the next page (None on the last page)
+
+        Raises:
+            ValueError: For an unknown sort order or an invalid cursor
+        """
+        if sort not in SORTS:
+            raise ValueError(f"Unknown sort '{sort}', expected one of {', '.join(SORTS)}")
+        limit = max(1, min(MAX_PAGE_SIZE, int(limit)))
+        ascending = not sort.startswith("-")
+        field = sort.lstrip("-")
+        order, rank = self.orders[field], self.ranks[field]
+
+        # Positions (in the ascending order) of the page bounds
+        start, end = 0, self.size
+        if cursor:
+            key, product_id = decode_cursor(cursor, sort)
+            if field == "name":
+                key = str(key).encode("utf-8")
+            if ascending:
+                start = self._lower_bound(field, (key, product_id), strict=True)
+            else:
+                end = self._lower_bound(field, (key, product_id))
+
+        price_span = (0, self.size)
+        price_filtered = min_price is not None or max_price is not None
+        if price_filtered:
+            price_span = self._price_positions(min_price, max_price)
+            if field == "price":
+                start, end = max(start, price_span[0]), min(end, price_span[1])
+        bitmap = self._match(categories, types, tags, price_span if price_filtered else None)
+        total = self.size if bitmap is None else int(_popcount(bitmap))
+        rows = _bitmap_rows(bitmap) if bitmap is not None and total <= self.size * SPARSE_FRACTION else None
+
+        if rows is not None:
+            # Few matches: rank them directly instead of walking the sort order
+            positions = rank[rows]
+            keep = (positions >= start) & (positions < end)
+            candidates, positions = rows[keep], positions[keep]
+            if len(candidates) > limit + 1:
+                pick = (np.argpartition(positions, limit) if ascending
+                        else np.argpartition(-positions, limit))[:limit + 1]
+                candidates, positions = candidates[pick], positions[pick]
+            sequence = np.argsort(positions if ascending else -positions, kind="stable")
+            page_rows = candidates[sequence].tolist()
+        else:
+            page_rows = list(self._scan(bitmap, order, start if ascending else end, limit + 1, ascending))
+
+        has_more = len(page_rows) > limit
+        page_rows = page_rows[:limit]
+        next_cursor = None
+        if has_more and page_rows:
+            last = page_rows[-1]
+            next_cursor = encode_cursor(sort, self._cursor_key(field, last), self.table.product_id(last))
+
+        facets: Dict[str, Any] = self._facet_counts(bitmap, rows)
+        facets["price"] = self._price_range(bitmap, rows, price_span) if total else None
+        return {
+            "products": [ProductView(self.table, row) for row in page_rows],
+            "total": total,
+            "facets": facets,
+            "nextCursor": next_cursor,
+        }
+
+
+def dump_product_search(catalog: Catalog, index: ProductSearchIndex) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """Store the search indexes in a catalog snapshot."""
+    return index.snapshot_arrays(), {}
+
+
+def restore_product_search(catalog: Catalog, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]) -> ProductSearchIndex:
+    """Wrap search indexes mapped from a catalog snapshot."""
+    return ProductSearchIndex(catalog.products, arrays)
+
+
+@register_index("product_search", dump=dump_product_search, restore=restore_product_search)
+def build_product_search(catalog: Catalog) -> ProductSearchIndex:
+    """Build the faceted search indexes for a catalog snapshot."""
+    return ProductSearchIndex(catalog.products)
+
+
+def get_product_search(catalog: Catalog) -> ProductSearchIndex:
+    """
+    Get the search indexes for a catalog snapshot, built once per snapshot.
+
+    Args:
+        catalog: The current catalog snapshot
+
+    Returns:
+        A ProductSearchIndex for the catalog
+    """
+    return catalog.index("product_search")
@@ -0,0 +1,412 @@
+"""
+Compact product storage for the Pocket AI e-commerce agent.
+This module keeps the catalog as columns (struct-of-arrays) instead of one dictionary
+per product: names and images live in a single UTF-8 heap with offsets, categories,
+types and tags are small integer codes into shared vocabularies, and IDs and prices
+are NumPy arrays. Products are exposed as lightweight read-only Mapping views, so
+code written against product dictionaries keeps working.
+"""
+
+from array import array
+from collections.abc import Mapping, Sequence
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Keys of a product, in the order of the original product dictionaries
+PRODUCT_FIELDS = ("id", "name", "category", "type", "tags", "price", "image")
+
+
+def _code_dtype(vocabulary_size: int) -> np.dtype:
+    """Smallest unsigned integer type that can hold codes for a vocabulary."""
+    if vocabulary_size <= 0xFF:
+        return np.dtype(np.uint8)
+    if vocabulary_size <= 0xFFFF:
+        return np.dtype(np.uint16)
+    return np.dtype(np.uint32)
+
+
+class StringColumn:
+    """A column of strings stored as one UTF-8 heap plus row offsets."""
+
+    __slots__ = ("heap", "offsets", "base")
+
+    def __init__(self, heap: Any, offsets: np.ndarray, base: int = 0):
+        """
+        Wrap an encoded heap.
+
+        Args:
+            heap: Concatenated UTF-8 encoded values (bytes, or a memory map holding them)
+            offsets: Start of each value in the heap, followed by the heap length
+            base: Position of the heap within `heap` (non-zero for memory-mapped snapshots)
+        """
+        self.heap = heap
+        self.offsets = offsets
+        self.base = base
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        offsets, base = self.offsets, self.base
+        return self.heap[base + offsets.item(row):base + offsets.item(row + 1)].decode("utf-8")
+
+    def encoded(self, row: int) -> bytes:
+        """The UTF-8 bytes of a value, without decoding."""
+        offsets, base = self.offsets, self.base
+        return self.heap[base + offsets.item(row):base + offsets.item(row + 1)]
+
+    def heap_array(self) -> np.ndarray:
+        """The heap bytes as a uint8 array (for writing snapshots)."""
+        return np.frombuffer(self.heap, dtype=np.uint8, count=self.offsets.item(-1), offset=self.base)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the heap and the offsets."""
+        return self.offsets.item(-1) + self.offsets.nbytes
+
+
+class ProductTable(Sequence):
+    """An immutable, column-oriented product catalog that behaves like a list of products."""
+
+    def __init__(self, ids: np.ndarray, names: StringColumn, images: StringColumn,
+                 category_codes: np.ndarray, categories: Tuple[str, ...],
+                 type_codes: np.ndarray, types: Tuple[str, ...],
+                 tag_codes: np.ndarray, tag_offsets: np.ndarray, tags: Tuple[str, ...],
+                 prices: np.ndarray, id_base: Optional[int] = None,
+                 sorted_ids: Optional[np.ndarray] = None, sorted_rows: Optional[np.ndarray] = None):
+        """
+        Wrap prebuilt columns; use ProductTable.from_products or ProductTableBuilder to create one.
+
+        Args:
+            ids: Product IDs (int64), one per row
+            names: Product names
+            images: Product image file names
+            category_codes: Index into `categories` per row
+            categories: Category vocabulary
+            type_codes: Index into `types` per row
+            types: Type vocabulary
+            tag_codes: Indexes into `tags` for all rows, concatenated
+            tag_offsets: Start of each row's tags in `tag_codes`, followed by its length
+            tags: Tag vocabulary
+            prices: Product prices (float64)
+            id_base: First ID when IDs are a contiguous ascending range (precomputed ID lookup)
+            sorted_ids: Sorted IDs for binary search (precomputed ID lookup)
+            sorted_rows: Row of each sorted ID (precomputed ID lookup)
+        """
+        self.ids = ids
+        self.names = names
+        self.images = images
+        self.category_codes = category_codes
+        self.categories = categories
+        self.type_codes = type_codes
+        self.types = types
+        self.tag_codes = tag_codes
+        self.tag_offsets = tag_offsets
+        self.tags = tags
+        self.prices = prices
+        for column in (ids, category_codes, type_codes, tag_codes, tag_offsets, prices, names.offsets, images.offsets):
+            column.flags.writeable = False
+
+        # ID lookup: direct arithmetic when IDs are a contiguous ascending range,
+        # otherwise a binary search over the sorted IDs
+        self._id_base: Optional[int] = id_base
+        self._sorted_ids: Optional[np.ndarray] = sorted_ids
+        self._sorted_rows: Optional[np.ndarray] = sorted_rows
+        if id_base is None and sorted_ids is None:
+            if len(ids) and int(ids[-1]) - int(ids[0]) == len(ids) - 1 and bool(np.all(np.diff(ids) == 1)):
+                self._id_base = int(ids[0])
+            else:
+                self._sorted_rows = np.argsort(ids, kind="stable")
+                self._sorted_ids = ids[self._sorted_rows]
+
+        self._getters = {
+            "id": self.product_id,
+            "name": self.names.__getitem__,
+            "category": self.category,
+            "type": self.product_type,
+            "tags": self.product_tags,
+            "price": self.price,
+            "image": self.images.__getitem__,
+        }
+
+    @classmethod
+    def from_products(cls, products: Iterable[Dict[str, Any]]) -> "ProductTable":
+        """
+        Build a table from product dictionaries.
+
+        Args:
+            products: Products in the backend/products.py dictionary format
+
+        Returns:
+            The product table
+        """
+        builder = ProductTableBuilder()
+        for product in products:
+            builder.append(product)
+        return builder.build()
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Any, prefix: str = "products.") -> "ProductTable":
+        """
+        Map a table stored with snapshot_arrays() without copying its columns.
+
+        Args:
+            snapshot: A catalog_snapshot.SnapshotFile
+            prefix: Name prefix of the table's arrays
+
+        Returns:
+            The product table, backed by the snapshot mapping
+        """
+        meta = snapshot.header["products"]
+        array = lambda name: snapshot.array(prefix + name)
+        names_heap, names_base = snapshot.heap(prefix + "name_heap")
+        images_heap, images_base = snapshot.heap(prefix + "image_heap")
+        return cls(
+            ids=array("ids"),
+            names=StringColumn(names_heap, array("name_offsets"), names_base),
+            images=StringColumn(images_heap, array("image_offsets"), images_base),
+            category_codes=array("category_codes"), categories=tuple(meta["categories"]),
+            type_codes=array("type_codes"), types=tuple(meta["types"]),
+            tag_codes=array("tag_codes"), tag_offsets=array("tag_offsets"), tags=tuple(meta["tags"]),
+            prices=array("prices"),
+            id_base=meta["id_base"],
+            sorted_ids=array("sorted_ids") if prefix + "sorted_ids" in snapshot else None,
+            sorted_rows=array("sorted_rows") if prefix + "sorted_rows" in snapshot else None,
+        )
+
+    def snapshot_arrays(self) -> Dict[str, np.ndarray]:
+        """The columns (and the ID lookup) as named arrays for a snapshot file."""
+        arrays = {
+            "ids": self.ids, "prices": self.prices,
+            "name_heap": self.names.heap_array(), "name_offsets": self.names.offsets,
+            "image_heap": self.images.heap_array(), "image_offsets": self.images.offsets,
+            "category_codes": self.category_codes, "type_codes": self.type_codes,
+            "tag_codes": self.tag_codes, "tag_offsets": self.tag_offsets,
+        }
+        if self._sorted_ids is not None:
+            arrays.update(sorted_ids=self._sorted_ids, sorted_rows=self._sorted_rows)
+        return arrays
+
+    def snapshot_meta(self) -> Dict[str, Any]:
+        """The vocabularies and ID lookup settings for a snapshot header."""
+        return {"categories": list(self.categories), "types": list(self.types), "tags": list(self.tags),
+                "id_base": self._id_base}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return ProductSelection(self, np.arange(len(self))[row])
+        row = int(row)
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("product table index out of range")
+        return ProductView(self, row)
+
+    def __iter__(self) -> Iterator["ProductView"]:
+        for row in range(len(self)):
+            yield ProductView(self, row)
+
+    def __repr__(self) -> str:
+        return f"<ProductTable {len(self)} products>"
+
+    def row_of(self, product_id: Any) -> Optional[int]:
+        """
+        Find the row of a product ID.
+
+        Args:
+            product_id: The product ID
+
+        Returns:
+            The row number, or None if the ID is not in the catalog
+        """
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            return None
+        if self._id_base is not None:
+            row = product_id - self._id_base
+            return row if 0 <= row < len(self) else None
+        position = int(np.searchsorted(self._sorted_ids, product_id))
+        if position < len(self._sorted_ids) and int(self._sorted_ids[position]) == product_id:
+            return int(self._sorted_rows[position])
+        return None
+
+    def get(self, product_id: Any) -> Optional["ProductView"]:
+        """Get a product by ID."""
+        row = self.row_of(product_id)
+        return None if row is None else ProductView(self, row)
+
+    def select(self, rows: np.ndarray) -> "ProductSelection":
+        """Get the products at the given rows, in that order."""
+        return ProductSelection(self, rows)
+
+    def rows_by_category(self) -> Dict[str, np.ndarray]:
+        """Row numbers of each category's products, in catalog order."""
+        order = np.argsort(self.category_codes, kind="stable")
+        counts = np.bincount(self.category_codes, minlength=len(self.categories))
+        groups = np.split(order, np.cumsum(counts)[:-1])
+        return {category: rows for category, rows in zip(self.categories, groups) if len(rows)}
+
+    # Field accessors by row
+
+    def product_id(self, row: int) -> int:
+        return self.ids.item(row)
+
+    def category(self, row: int) -> str:
+        return self.categories[self.category_codes.item(row)]
+
+    def product_type(self, row: int) -> str:
+        return self.types[self.type_codes.item(row)]
+
+    def product_tags(self, row: int) -> List[str]:
+        offsets = self.tag_offsets
+        tags = self.tags
+        return [tags[code] for code in self.tag_codes[offsets.item(row):offsets.item(row + 1)].tolist()]
+
+    def price(self, row: int) -> float:
+        return self.prices.item(row)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory used by the columns and vocabularies."""
+        arrays = (self.ids, self.category_codes, self.type_codes, self.tag_codes, self.tag_offsets, self.prices)
+        vocabulary = sum(len(value) + 49 for value in self.categories + self.types + self.tags)
+        lookup = 0 if self._sorted_ids is None else self._sorted_ids.nbytes + self._sorted_rows.nbytes
+        return sum(a.nbytes for a in arrays) + self.names.nbytes + self.images.nbytes + vocabulary + lookup
+
+
+class ProductView(Mapping):
+    """Read-only view of one product row; reads like the product dictionary it replaces."""
+
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table: ProductTable, row: int):
+        self._table = table
+        self._row = row
+
+    def __getitem__(self, key: str) -> Any:
+        getter = self._table._getters.get(key)
+        if getter is None:
+            raise KeyError(key)
+        return getter(self._row)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._table._getters
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(PRODUCT_FIELDS)
+
+    def __len__(self) -> int:
+        return len(PRODUCT_FIELDS)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ProductView) and self._table is other._table:
+            return self._row == other._row
+        return super().__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+    @property
+    def row(self) -> int:
+        """The product's row in its table."""
+        return self._row
+
+
+class ProductSelection(Sequence):
+    """A list-like subset of a product table (e.g. one category), stored as row numbers."""
+
+    __slots__ = ("table", "rows")
+
+    def __init__(self, table: ProductTable, rows: np.ndarray):
+        self.table = table
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ProductSelection(self.table, self.rows[index])
+        return ProductView(self.table, int(self.rows[index]))
+
+    def __iter__(self) -> Iterator[ProductView]:
+        table = self.table
+        for row in self.rows.tolist():
+            yield ProductView(table, row)
+
+    def __repr__(self) -> str:
+        return f"<ProductSelection {len(self)} products>"
+
+
+class ProductTableBuilder:
+    """Accumulates products row by row into compact buffers, then builds a ProductTable."""
+
+    def __init__(self):
+        self._ids = array("q")
+        self._prices = array("d")
+        self._names = bytearray()
+        self._name_offsets = array("q", [0])
+        self._images = bytearray()
+        self._image_offsets = array("q", [0])
+        self._category_codes = array("I")
+        self._type_codes = array("I")
+        self._tag_codes = array("I")
+        self._tag_offsets = array("q", [0])
+        self._categories: Dict[str, int] = {}
+        self._types: Dict[str, int] = {}
+        self._tags: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @staticmethod
+    def _code(vocabulary: Dict[str, int], value: str) -> int:
+        code = vocabulary.get(value)
+        if code is None:
+            code = vocabulary[value] = len(vocabulary)
+        return code
+
+    def append(self, product: Dict[str, Any]) -> None:
+        """
+        Add a product.
+
+        Args:
+            product: A product dictionary with the PRODUCT_FIELDS keys
+        """
+        self._ids.append(int(product["id"]))
+        self._prices.append(float(product["price"]))
+        self._names += str(product["name"]).encode("utf-8")
+        self._name_offsets.append(len(self._names))
+        self._images += str(product.get("image") or "").encode("utf-8")
+        self._image_offsets.append(len(self._images))
+        self._category_codes.append(self._code(self._categories, product["category"]))
+        self._type_codes.append(self._code(self._types, product["type"]))
+        for tag in product["tags"]:
+            self._tag_codes.append(self._code(self._tags, tag))
+        self._tag_offsets.append(len(self._tag_codes))
+
+    def build(self) -> ProductTable:
+        """Convert the buffers to the final NumPy columns."""
+        def codes(buffer: array, vocabulary: Dict[str, int]) -> np.ndarray:
+            return np.frombuffer(buffer, dtype=np.uint32).astype(_code_dtype(len(vocabulary)))
+
+        return ProductTable(
+            ids=np.frombuffer(self._ids, dtype=np.int64).copy(),
+            names=StringColumn(bytes(self._names), np.frombuffer(self._name_offsets, dtype=np.int64).copy()),
+            images=StringColumn(bytes(self._images), np.frombuffer(self._image_offsets, dtype=np.int64).copy()),
+            category_codes=codes(self._category_codes, self._categories),
+            categories=tuple(self._categories),
+            type_codes=codes(self._type_codes, self._types),
+            types=tuple(self._types),
+            tag_codes=codes(self._tag_codes, self._tags),
+            tag_offsets=np.frombuffer(self._tag_offsets, dtype=np.int64).copy(),
+            tags=tuple(self._tags),
+            prices=np.frombuffer(self._prices, dtype=np.float64).copy(),
+        )
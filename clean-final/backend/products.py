@@ -1,10 +1,27 @@
 """
 Product catalog for the Pocket AI e-commerce agent.
 This module contains the product database used for recommendations and searches.
+The built-in products are used unless CATALOG_PATH points to a catalog file.
+Products are stored column-wise and returned as read-only, dictionary-like views.
 """
 
+import os
+from typing import Any
+
+from catalog import Catalog, CatalogStore, format_product_summary
+from product_table import ProductTable
+from product_search import get_product_search
+from product_sampler import get_product_sampler, popularity
+
+# Catalog file (.jsonl, .json, .csv or SQLite); the built-in products are used when unset
+CATALOG_PATH = os.getenv("CATALOG_PATH") or None
+# Seconds between checks for catalog file changes (0 disables hot reload by file watch)
+CATALOG_WATCH_INTERVAL = float(os.getenv("CATALOG_WATCH_INTERVAL", "2"))
+# Shared catalog snapshot written by the launcher (start.py); workers map it instead of loading CATALOG_PATH
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH") or None
+
 # Product database - directly converted from JavaScript version
-products = [
+DEFAULT_PRODUCTS = [
     # Clothing - T-shirts
     {"id": 1, "name": "Sports T-Shirt (Breathable)", "category": "clothing", "type": "t-shirt", 
      "tags": ["sports", "running", "gym", "breathable"], "price": 29.99, "image": "sport-tshirt-1.jpg"},
@@ -127,17 +144,35 @@ products = [
 ]
 
 
+# Holds the active catalog snapshot and hot-reloads it
+catalog_store = CatalogStore(CATALOG_PATH, DEFAULT_PRODUCTS, CATALOG_WATCH_INTERVAL, CATALOG_SNAPSHOT_PATH)
+
+
+def get_catalog() -> Catalog:
+    """Get the active catalog snapshot (use one snapshot per request for consistent results)."""
+    return catalog_store.current
+
+
+def get_products() -> ProductTable:
+    """Get the products of the active catalog (a read-only sequence of product views)."""
+    return catalog_store.current.products
+
+
+def __getattr__(name: str) -> Any:
+    # Keep "products.products" working; it always refers to the active catalog
+    if name == "products":
+        return get_products()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def get_product_by_id(product_id):
     """Get a product by its ID."""
-    for product in products:
-        if product["id"] == product_id:
-            return product
-    return None
+    return get_catalog().get(product_id)
 
 
 def get_products_by_category(category):
     """Get all products in a specific category."""
-    return [product for product in products if product["category"] == category]
+    return list(get_catalog().by_category.get(category, []))
 
 
 def get_products_by_search(query):
@@ -145,7 +180,7 @@ def get_products_by_search(query):
     query = query.lower()
     matching_products = []
     
-    for product in products:
+    for product in get_products():
         # Check if query appears in product name, category, or type
         if (query in product["name"].lower() or 
             query in product["category"].lower() or 
@@ -160,57 +195,45 @@ def get_products_by_search(query):
     return matching_products
 
 
-def get_product_summary():
-    """Get a summary of all products for AI prompts."""
-    return "\n".join([
-        f"ID {p['id']}: {p['name']} (${p['price']}) - Category: {p['category']}, "
-        f"Type: {p['type']}, Tags: [{', '.join(p['tags'])}]" 
-        for p in products
-    ])
+def search_products(categories=(), types=(), tags=(), min_price=None, max_price=None, sort="id", limit=24,
+                    cursor=None):
+    """Filter, sort and paginate the catalog with facet counts (see ProductSearchIndex.search)."""
+    return get_product_search(get_catalog()).search(categories, types, tags, min_price, max_price, sort, limit,
+                                                    cursor)
 
 
-def get_random_products(count=3):
-    """Get a random selection of products."""
-    import random
-    
-    # Organize products by category
-    products_by_category = {}
-    for product in products:
-        category = product["category"]
-        if category not in products_by_category:
-            products_by_category[category] = []
-        products_by_category[category].append(product)
-    
-    # Get unique categories
-    categories = list(products_by_category.keys())
-    
-    # Initialize result list
-    result = []
-    
-    # Try to get one product from each category
-    shuffled_categories = list(categories)
-    random.shuffle(shuffled_categories)
-    
-    # Take up to 'count' categories
-    categories_to_use = shuffled_categories[:count]
-    
-    # Get one random product from each selected category
-    for category in categories_to_use:
-        category_products = products_by_category[category]
-        random_product = random.choice(category_products)
-        result.append(random_product)
-    
-    # If we still need more products, get random ones
-    if len(result) < count:
-        remaining = count - len(result)
-        already_selected_ids = [p["id"] for p in result]
-        
-        # Select from remaining products not already in the result
-        remaining_products = [p for p in products if p["id"] not in already_selected_ids]
-        shuffled_remaining = random.sample(remaining_products, 
-                                           min(remaining, len(remaining_products)))
-        
-        # Add remaining products
-        result.extend(shuffled_remaining)
-    
-    return result 
\ No newline at end of file
+def get_product_summary(product_list=None):
+    """Get a summary of all products (or the given subset) for AI prompts."""
+    if product_list is None:
+        # Precomputed once per catalog snapshot
+        return get_catalog().summary
+    return format_product_summary(product_list)
+
+
+def get_random_products(count=3, stratified=True, weighted=False):
+    """
+    Get a random selection of products in O(count) time.
+
+    Args:
+        count: Number of products
+        stratified: Take the first products from different categories
+        weighted: Prefer products that were recommended more often (see record_recommended_products)
+
+    Returns:
+        Distinct products in random order
+    """
+    catalog = get_catalog()
+    rows = get_product_sampler(catalog).sample(count, stratified=stratified, weighted=weighted)
+    return [catalog.products[row] for row in rows]
+
+
+def get_random_product_ids(count=3, stratified=True, weighted=False):
+    """Get the IDs of a random selection of products (see get_random_products)."""
+    catalog = get_catalog()
+    rows = get_product_sampler(catalog).sample(count, stratified=stratified, weighted=weighted)
+    return [catalog.products.product_id(row) for row in rows]
+
+
+def record_recommended_products(product_ids):
+    """Count products the model recommended; weighted random selections favour them."""
+    popularity.record(product_ids)
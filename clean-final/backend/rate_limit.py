@@ -0,0 +1,368 @@
+"""
+Rate limiting for the Pocket AI e-commerce agent.
+Requests to the routes that call Ollama draw tokens from two token buckets, one per
+session (the X-Session-Id header or sessionId query parameter) and one per client IP.
+Buckets refill continuously up to a burst size, and each route has its own cost, so
+one image analysis takes as much capacity as several chat messages; a batch of
+recommendations is charged per query by its route once the body is parsed. A request is only
+admitted when both buckets hold enough tokens; otherwise it is answered with 429 and a
+Retry-After header. Buckets live in process memory, or in a shared SQLite file when the
+backend runs several workers (RATE_LIMIT_SQLITE_PATH).
+"""
+
+import os
+import json
+import math
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from metrics import RATE_LIMITED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Set to "false" to disable rate limiting
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() not in ("0", "false", "no")
+# Sustained tokens per minute and burst size of each session's bucket
+RATE_LIMIT_SESSION_PER_MINUTE = float(os.getenv("RATE_LIMIT_SESSION_PER_MINUTE", "20"))
+RATE_LIMIT_SESSION_BURST = float(os.getenv("RATE_LIMIT_SESSION_BURST", "20"))
+# Sustained tokens per minute and burst size of each client IP's bucket (shared by its sessions)
+RATE_LIMIT_CLIENT_PER_MINUTE = float(os.getenv("RATE_LIMIT_CLIENT_PER_MINUTE", "60"))
+RATE_LIMIT_CLIENT_BURST = float(os.getenv("RATE_LIMIT_CLIENT_BURST", "60"))
+# Tokens per request by route (per query for /api/recommend/batch); routes not listed are not limited
+RATE_LIMIT_COSTS = os.getenv(
+    "RATE_LIMIT_COSTS",
+    "/api/chat=1,/api/chat/ws=1,/api/recommend=1,/api/recommend/batch=1,/api/image-search=5,/api/product-match=5"
+)
+# Shared SQLite file holding the buckets of all workers (unset: buckets are kept in memory)
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", "")
+# Peers whose X-Forwarded-For header is trusted (the frontend forwards the browser's address)
+RATE_LIMIT_TRUSTED_PROXIES = os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "127.0.0.1,::1")
+
+# Routes charged per item by their handler (the middleware cannot see the request body)
+PER_ITEM_ROUTES = frozenset({"/api/recommend/batch"})
+# Buckets kept in memory before idle (full) ones are dropped
+MAX_MEMORY_BUCKETS = 100_000
+# Seconds between deletions of idle buckets from the SQLite store
+SQLITE_PRUNE_INTERVAL = 60.0
+
+
+def parse_costs(value: str) -> Dict[str, float]:
+    """Parse "route=cost,route=cost" into a dictionary."""
+    costs = {}
+    for item in value.split(","):
+        route, _, cost = item.partition("=")
+        if route.strip() and cost.strip():
+            costs[route.strip()] = float(cost)
+    return costs
+
+
+class Bucket:
+    """Refill rate and capacity of one kind of bucket."""
+
+    __slots__ = ("kind", "rate", "burst")
+
+    def __init__(self, kind: str, per_minute: float, burst: float):
+        """
+        Args:
+            kind: Name of the bucket kind ("session" or "client"), used in keys and metrics
+            per_minute: Tokens added per minute
+            burst: Maximum tokens held (a full bucket admits this many tokens at once)
+        """
+        self.kind = kind
+        self.rate = per_minute / 60.0
+        self.burst = burst
+
+    def refill(self, tokens: float, updated: float, now: float) -> float:
+        """Tokens held at now, given the tokens held at updated."""
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    @property
+    def fill_time(self) -> float:
+        """Seconds an empty bucket needs to fill up; idle buckets are full after this."""
+        return self.burst / self.rate if self.rate > 0 else math.inf
+
+    def wait(self, tokens: float, cost: float) -> float:
+        """Seconds until a bucket holding tokens can pay cost."""
+        if cost > self.burst or self.rate <= 0:
+            return math.inf
+        return (cost - tokens) / self.rate
+
+
+def _take(buckets: List[Tuple[str, Bucket]], cost: float, now: float,
+          states: List[Optional[Tuple[float, float]]]) -> Tuple[float, Optional[str], List[float]]:
+    """
+    Charge cost to every bucket, or to none of them.
+
+    Returns:
+        (seconds to wait, 0 when admitted; kind of the bucket that refused, or None;
+         tokens left in each bucket)
+    """
+    levels = [bucket.burst if state is None else bucket.refill(state[0], state[1], now)
+              for (_, bucket), state in zip(buckets, states)]
+    wait, refused = 0.0, None
+    for (_, bucket), tokens in zip(buckets, levels):
+        if tokens < cost:
+            bucket_wait = bucket.wait(tokens, cost)
+            if bucket_wait > wait:
+                wait, refused = bucket_wait, bucket.kind
+    if refused is not None:
+        return wait, refused, levels
+    return 0.0, None, [tokens - cost for tokens in levels]
+
+
+class MemoryStore:
+    """Token buckets of one process."""
+
+    blocking = False
+
+    def __init__(self, max_buckets: int = MAX_MEMORY_BUCKETS):
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        self._states: Dict[str, Tuple[float, float]] = {}
+
+    def take(self, buckets: List[Tuple[str, Bucket]], cost: float) -> Tuple[float, Optional[str]]:
+        """
+        Charge cost to the keyed buckets if all of them can pay it.
+
+        Args:
+            buckets: (key, Bucket) pairs
+            cost: Tokens to take from each bucket
+
+        Returns:
+            (seconds until the request could be admitted, 0 when it was; kind of the
+             bucket that refused it, or None)
+        """
+        now = time.monotonic()
+        with self._lock:
+            states = [self._states.get(key) for key, _ in buckets]
+            wait, refused, levels = _take(buckets, cost, now, states)
+            if refused is None:
+                if len(self._states) >= self.max_buckets:
+                    self._prune(now, max(bucket.fill_time for _, bucket in buckets))
+                for (key, _), tokens in zip(buckets, levels):
+                    self._states[key] = (tokens, now)
+            return wait, refused
+
+    def _prune(self, now: float, full_after: float) -> None:
+        # A bucket idle long enough to be full again behaves exactly like a missing one
+        idle = [key for key, (_, updated) in self._states.items() if now - updated >= full_after]
+        for key in idle:
+            del self._states[key]
+        if len(self._states) >= self.max_buckets:
+            # Still too many active clients: forget the least recently charged half
+            for key, _ in sorted(self._states.items(), key=lambda item: item[1][1])[:len(self._states) // 2]:
+                del self._states[key]
+
+
+class SQLiteStore:
+    """Token buckets shared by the worker processes through a SQLite file."""
+
+    blocking = True
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Database file, created if needed
+        """
+        self.path = path
+        self._local = threading.local()
+        self._last_prune = 0.0
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit mode; transactions are started explicitly with BEGIN IMMEDIATE
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def take(self, buckets: List[Tuple[str, Bucket]], cost: float) -> Tuple[float, Optional[str]]:
+        """Charge cost to the keyed buckets if all of them can pay it (see MemoryStore.take)."""
+        connection = self._connection()
+        # Wall-clock time, since the buckets are shared between processes
+        now = time.time()
+        keys = [key for key, _ in buckets]
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = dict((key, (tokens, updated)) for key, tokens, updated in connection.execute(
+                "SELECT key, tokens, updated FROM rate_limits WHERE key IN (%s)" % ",".join("?" * len(keys)), keys
+            ))
+            wait, refused, levels = _take(buckets, cost, now, [rows.get(key) for key in keys])
+            if refused is None:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO rate_limits (key, tokens, updated) VALUES (?, ?, ?)",
+                    [(key, tokens, now) for key, tokens in zip(keys, levels)]
+                )
+            full_after = max(bucket.fill_time for _, bucket in buckets)
+            if now - self._last_prune >= SQLITE_PRUNE_INTERVAL and full_after < math.inf:
+                self._last_prune = now
+                connection.execute("DELETE FROM rate_limits WHERE updated < ?", (now - full_after,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return wait, refused
+
+
+class RateLimiter:
+    """Admits or refuses requests by route cost, session and client."""
+
+    def __init__(self, enabled: bool = RATE_LIMIT_ENABLED, costs: str = RATE_LIMIT_COSTS,
+                 sqlite_path: str = RATE_LIMIT_SQLITE_PATH, trusted_proxies: str = RATE_LIMIT_TRUSTED_PROXIES):
+        """
+        Args:
+            enabled: Whether requests are limited at all
+            costs: Tokens per request by route, as "route=cost,..."
+            sqlite_path: Shared SQLite store, or "" for an in-process store
+            trusted_proxies: Comma-separated peer addresses whose X-Forwarded-For is used
+        """
+        self.enabled = enabled
+        self.costs = parse_costs(costs)
+        self.sqlite_path = sqlite_path
+        self.trusted_proxies = {address.strip() for address in trusted_proxies.split(",") if address.strip()}
+        self.session_bucket = Bucket("session", RATE_LIMIT_SESSION_PER_MINUTE, RATE_LIMIT_SESSION_BURST)
+        self.client_bucket = Bucket("client", RATE_LIMIT_CLIENT_PER_MINUTE, RATE_LIMIT_CLIENT_BURST)
+        self._store = None
+
+    @property
+    def store(self):
+        # Opened on first use, in the worker process
+        if self._store is None:
+            self._store = SQLiteStore(self.sqlite_path) if self.sqlite_path else MemoryStore()
+        return self._store
+
+    def client_address(self, peer: Optional[str], forwarded_for: Optional[str]) -> str:
+        """
+        The address of the client a request came from.
+
+        Args:
+            peer: Address of the connected peer
+            forwarded_for: The X-Forwarded-For header, if any
+
+        Returns:
+            The peer itself, or when it is a trusted proxy the closest forwarded address
+            that is not a trusted proxy
+        """
+        address = peer or "unknown"
+        if forwarded_for and address in self.trusted_proxies:
+            for hop in reversed(forwarded_for.split(",")):
+                address = hop.strip() or address
+                if address not in self.trusted_proxies:
+                    break
+        return address
+
+    def max_items(self, route: str, session_id: Optional[str] = None) -> Optional[int]:
+        """
+        The most items a single request to a per-item route can ever be admitted with.
+
+        Args:
+            route: The route path
+            session_id: Session ID, if the request carries one
+
+        Returns:
+            The largest item count whose cost fits in the buckets, or None when unlimited
+        """
+        cost = self.costs.get(route, 0)
+        if not self.enabled or cost <= 0:
+            return None
+        burst = self.client_bucket.burst
+        if session_id:
+            burst = min(burst, self.session_bucket.burst)
+        return int(burst // cost)
+
+    async def acquire(self, route: str, client: str, session_id: Optional[str] = None, items: int = 1) -> float:
+        """
+        Charge a request to its session and client buckets.
+
+        Args:
+            route: The route path, which determines the cost
+            client: Client address
+            session_id: Session ID, if the request carries one
+            items: Number of items the request carries (queries of a batch); the cost is per item
+
+        Returns:
+            0 when the request is admitted, else seconds until it could be
+        """
+        cost = self.costs.get(route, 0) * items
+        if not self.enabled or cost <= 0:
+            return 0.0
+        buckets = [(f"client:{client}", self.client_bucket)]
+        if session_id:
+            buckets.append((f"session:{session_id}", self.session_bucket))
+        store = self.store
+        try:
+            if store.blocking:
+                wait, refused = await asyncio.get_running_loop().run_in_executor(None, store.take, buckets, cost)
+            else:
+                wait, refused = store.take(buckets, cost)
+        except Exception as e:
+            # Never turn a store failure into an outage; admit the request
+            logger.warning("Rate limit store error, admitting the request: %s", e)
+            return 0.0
+        if refused is not None:
+            RATE_LIMITED_REQUESTS.labels(route, refused).inc()
+            logger.info("Rate limited %s for %s (session %s), retry in %.1fs", route, client, session_id, wait)
+        return wait
+
+
+def retry_after_header(wait: float) -> str:
+    """Format a wait time as a Retry-After value (whole seconds, at least 1)."""
+    return str(max(1, math.ceil(min(wait, 86400.0))))
+
+
+class RateLimitMiddleware:
+    """ASGI middleware answering requests over their rate limit with 429 and Retry-After."""
+
+    def __init__(self, app, limiter: Optional[RateLimiter] = None):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        limiter = self.limiter or rate_limiter
+        if (scope["type"] not in ("http", "websocket") or scope.get("method") == "OPTIONS"
+                or scope["path"] in PER_ITEM_ROUTES):
+            await self.app(scope, receive, send)
+            return
+
+        headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        session_id = headers.get("x-session-id")
+        if not session_id:
+            # WebSocket clients pass the session in the query string
+            for part in scope.get("query_string", b"").decode("latin-1").split("&"):
+                name, _, value = part.partition("=")
+                if name == "sessionId" and value:
+                    session_id = value
+                    break
+        peer = scope["client"][0] if scope.get("client") else None
+        client = limiter.client_address(peer, headers.get("x-forwarded-for"))
+        wait = await limiter.acquire(scope["path"], client, session_id)
+        if wait <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        retry_after = retry_after_header(wait)
+        if scope["type"] == "websocket":
+            # Refuse the handshake (clients see HTTP 403)
+            await receive()
+            await send({"type": "websocket.close", "code": 1008, "reason": f"Rate limited, retry in {retry_after}s"})
+            return
+        body = json.dumps({"detail": f"Too many requests, retry in {retry_after} seconds"}).encode("utf-8")
+        await send({"type": "http.response.start", "status": 429, "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            (b"retry-after", retry_after.encode("latin-1")),
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+
+# Shared limiter for the backend process
+rate_limiter = RateLimiter()
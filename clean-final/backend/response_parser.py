@@ -0,0 +1,331 @@
+"""
+Response parsing for the Pocket AI e-commerce agent.
+This module extracts product IDs, product names and relevance scores from
+AI-generated recommendation text in a single pass over the response.
+"""
+
+import re
+import json
+import logging
+from typing import Any, List, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from metrics import instrument
+from catalog import Catalog, register_index
+from product_table import ProductTable
+
+logger = logging.getLogger(__name__)
+
+# Markers the prompts ask the model to emit
+ID_PATTERN = r"product\s+id:\s*(?P<id>\d+)"
+SCORE_PATTERN = r"relevance\s+score:\s*(?P<score>\d+)\s*/\s*100"
+
+
+def _build_trie_pattern(names: Iterable[str]) -> str:
+    """
+    Build a regex that matches any of the given names through a character trie.
+
+    A plain alternation ("a|b|c...") makes the regex engine try every name at every
+    position of the text. Nesting the alternatives along shared prefixes means each
+    position only walks as deep as the longest matching prefix, so the cost of a scan
+    no longer grows with the size of the catalog.
+
+    Args:
+        names: The literal strings to match
+
+    Returns:
+        A regex pattern string (without surrounding group)
+    """
+    trie: Dict[str, dict] = {}
+    for name in names:
+        if not name:
+            continue
+        node = trie
+        for char in name:
+            node = node.setdefault(char, {})
+        node[""] = {}  # End-of-name marker
+
+    def to_pattern(node: Dict[str, dict]) -> str:
+        is_terminal = "" in node
+        branches = []
+        for char in sorted(key for key in node if key):
+            branches.append(re.escape(char) + to_pattern(node[char]))
+
+        if not branches:
+            return ""
+        if len(branches) == 1:
+            body = branches[0]
+            if is_terminal:
+                # Greedy optional group prefers the longest name
+                return f"(?:{body})?"
+            return body
+        body = "(?:" + "|".join(branches) + ")"
+        if is_terminal:
+            return body + "?"
+        return body
+
+    return to_pattern(trie)
+
+
+class ParsedResponse:
+    """Result of parsing an AI recommendation response."""
+
+    __slots__ = ("product_ids", "named_ids", "relevance_scores", "reasons")
+
+    def __init__(self):
+        self.product_ids: List[int] = []         # IDs given explicitly as "Product ID: X"
+        self.named_ids: List[int] = []           # IDs found through exact product names
+        self.relevance_scores: Dict[int, int] = {}
+        self.reasons: Dict[int, str] = {}        # Per-product explanations (structured output only)
+
+    def ranked_ids(self, limit: Optional[int] = 3) -> List[int]:
+        """
+        Get product IDs ordered by confidence: explicit IDs first, then name mentions.
+
+        Args:
+            limit: Maximum number of IDs to return (None for all)
+
+        Returns:
+            A list of unique, valid product IDs
+        """
+        ranked = list(self.product_ids)
+        seen = set(ranked)
+        for product_id in self.named_ids:
+            if product_id not in seen:
+                seen.add(product_id)
+                ranked.append(product_id)
+        return ranked if limit is None else ranked[:limit]
+
+
+class CatalogIds:
+    """Product ID membership backed by a product table's ID lookup (no per-worker set)."""
+
+    __slots__ = ("table",)
+
+    def __init__(self, table: ProductTable):
+        self.table = table
+
+    def __contains__(self, product_id: object) -> bool:
+        return self.table.row_of(product_id) is not None
+
+
+class NameIndex:
+    """Exact product name lookup by binary search over the rows of a table sorted by name."""
+
+    __slots__ = ("table", "rows")
+
+    def __init__(self, table: ProductTable, rows: np.ndarray):
+        """
+        Wrap a name-sorted row order.
+
+        Args:
+            table: The product table
+            rows: Rows sorted by UTF-8 name, keeping only the first row of duplicate names
+        """
+        self.table = table
+        self.rows = rows
+
+    def get(self, name: str, default: Optional[int] = None) -> Optional[int]:
+        """Get the ID of the product with exactly this name."""
+        names = self.table.names
+        target = name.encode("utf-8")
+        low, high = 0, len(self.rows)
+        while low < high:
+            middle = (low + high) // 2
+            if names.encoded(self.rows.item(middle)) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.rows):
+            row = self.rows.item(low)
+            if names.encoded(row) == target:
+                return self.table.product_id(row)
+        return default
+
+
+class ResponseParser:
+    """Single-pass extractor for product references in AI recommendation text."""
+
+    def __init__(self, catalog: List[Dict]):
+        """
+        Precompile the lookup structures for a catalog.
+
+        Args:
+            catalog: List of product dictionaries with at least "id" and "name"
+        """
+        self.valid_ids = frozenset(product["id"] for product in catalog)
+        self.id_by_name: Dict[str, int] = {}
+        for product in catalog:
+            # Keep the first product for duplicate names, like the catalog scan did
+            self.id_by_name.setdefault(product["name"], product["id"])
+
+        parts = [f"(?i:{SCORE_PATTERN})", f"(?i:{ID_PATTERN})"]
+        name_pattern = _build_trie_pattern(self.id_by_name)
+        if name_pattern:
+            parts.append(f"(?P<name>{name_pattern})")
+        self.pattern = re.compile("|".join(parts))
+
+    @classmethod
+    def from_lookups(cls, valid_ids: Any, id_by_name: Any, pattern: str) -> "ResponseParser":
+        """
+        Create a parser from prebuilt lookups, e.g. ones mapped from a shared catalog snapshot.
+
+        Args:
+            valid_ids: Container of the catalog's product IDs
+            id_by_name: Object whose get(name) returns the product ID for an exact name
+            pattern: The combined extraction regex, as built by __init__
+
+        Returns:
+            The parser
+        """
+        parser = cls.__new__(cls)
+        parser.valid_ids = valid_ids
+        parser.id_by_name = id_by_name
+        parser.pattern = re.compile(pattern)
+        return parser
+
+    @instrument("response_parse")
+    def parse(self, text: str) -> ParsedResponse:
+        """
+        Extract product IDs, named products and relevance scores in one pass.
+
+        A relevance score is attributed to the next "Product ID" that follows it,
+        matching the "Relevance Score ... Product ID" layout requested in the prompts.
+
+        Args:
+            text: The AI-generated response text
+
+        Returns:
+            A ParsedResponse with the extracted references
+        """
+        result = ParsedResponse()
+        if not text:
+            return result
+
+        seen_ids = set()
+        seen_named = set()
+        pending_score: Optional[int] = None
+
+        for match in self.pattern.finditer(text):
+            kind = match.lastgroup
+            if kind == "score":
+                if pending_score is None:
+                    pending_score = int(match.group("score"))
+            elif kind == "id":
+                product_id = int(match.group("id"))
+                if pending_score is not None:
+                    result.relevance_scores.setdefault(product_id, pending_score)
+                    pending_score = None
+                if product_id in self.valid_ids and product_id not in seen_ids:
+                    seen_ids.add(product_id)
+                    result.product_ids.append(product_id)
+            elif kind == "name":
+                product_id = self.id_by_name.get(match.group("name"))
+                if product_id is not None and product_id not in seen_named:
+                    seen_named.add(product_id)
+                    result.named_ids.append(product_id)
+
+        return result
+
+    @instrument("response_parse_structured")
+    def parse_structured(self, raw_json: str) -> ParsedResponse:
+        """
+        Parse and validate a schema-constrained JSON recommendation response.
+
+        Accepts either {"recommendations": [...]} or a bare list of
+        {"id", "score", "reason"} objects. Entries with unknown IDs, duplicate IDs
+        or malformed fields are dropped; scores are clamped to 1-100.
+
+        Args:
+            raw_json: The JSON text returned by the model
+
+        Returns:
+            A ParsedResponse with the validated recommendations
+        """
+        result = ParsedResponse()
+        try:
+            data = json.loads(raw_json)
+        except (TypeError, ValueError):
+            logger.warning("Structured recommendation response is not valid JSON")
+            return result
+
+        entries: Any = data.get("recommendations", []) if isinstance(data, dict) else data
+        if not isinstance(entries, list):
+            logger.warning("Structured recommendation response has no recommendation list")
+            return result
+
+        dropped = 0
+        for entry in entries:
+            if not isinstance(entry, dict):
+                dropped += 1
+                continue
+            try:
+                product_id = int(entry.get("id"))
+            except (TypeError, ValueError):
+                dropped += 1
+                continue
+            if product_id not in self.valid_ids or product_id in result.relevance_scores:
+                dropped += 1
+                continue
+
+            try:
+                score = min(100, max(1, int(entry.get("score", 100))))
+            except (TypeError, ValueError):
+                score = 100
+            result.product_ids.append(product_id)
+            result.relevance_scores[product_id] = score
+            result.reasons[product_id] = str(entry.get("reason") or "").strip()
+
+        if dropped:
+            logger.warning("Dropped %s invalid entries from structured recommendations", dropped)
+        return result
+
+    def recommended_ids(self, model_output: str, structured: bool = False, limit: Optional[int] = 3) -> List[int]:
+        """
+        The ranked product IDs named by a recommendation.
+
+        Args:
+            model_output: Markdown recommendation, or JSON when structured
+            structured: Whether model_output is schema-constrained JSON
+            limit: Maximum number of IDs (None for all)
+
+        Returns:
+            Catalog product IDs, best first
+        """
+        parsed = self.parse_structured(model_output) if structured else self.parse(model_output)
+        return parsed.ranked_ids(limit=limit)
+
+
+def dump_response_parser(catalog: Catalog, parser: ResponseParser) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """Store a parser in a catalog snapshot: its regex, plus the catalog rows sorted by name."""
+    names = catalog.products.names
+    rows = sorted(range(len(catalog.products)), key=names.encoded)
+    # Keep the first product for duplicate names, like __init__ does
+    unique_rows = [row for i, row in enumerate(rows) if i == 0 or names.encoded(row) != names.encoded(rows[i - 1])]
+    return {"name_rows": np.array(unique_rows, dtype=np.int64)}, {"pattern": parser.pattern.pattern}
+
+
+def restore_response_parser(catalog: Catalog, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]) -> ResponseParser:
+    """Recreate a parser from a catalog snapshot without scanning the catalog."""
+    return ResponseParser.from_lookups(CatalogIds(catalog.products), NameIndex(catalog.products, arrays["name_rows"]),
+                                       meta["pattern"])
+
+
+@register_index("response_parser", dump=dump_response_parser, restore=restore_response_parser)
+def build_response_parser(catalog: Catalog) -> ResponseParser:
+    """Build the response parser for a catalog snapshot."""
+    return ResponseParser(catalog.products)
+
+
+def get_response_parser(catalog: Catalog) -> ResponseParser:
+    """
+    Get the parser for a catalog snapshot, built once per snapshot.
+
+    Args:
+        catalog: The current catalog snapshot
+
+    Returns:
+        A ResponseParser for the catalog
+    """
+    return catalog.index("response_parser")
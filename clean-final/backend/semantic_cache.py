@@ -0,0 +1,407 @@
+"""
+Semantic response cache for the Pocket AI e-commerce agent.
+Queries are normalized and embedded with Ollama's embedding model. A new query reuses
+the cached response of the most similar earlier query when their cosine similarity
+reaches SEMANTIC_CACHE_THRESHOLD, so "running shoes for men" can be answered with the
+response to "men's running shoes" without another generation. Each namespace keeps its
+embeddings in one preallocated NumPy matrix, searched with a single matrix-vector
+product, and holds at most SEMANTIC_CACHE_MAX_ENTRIES entries (least recently used
+entries are replaced). A sample of hits is re-generated in the background and compared
+to count false hits.
+"""
+
+import os
+import re
+import time
+import random
+import asyncio
+import inspect
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ai_utils import embed_texts
+from metrics import SEMANTIC_CACHE_LOOKUPS, SEMANTIC_CACHE_SIMILARITY, SEMANTIC_CACHE_AUDITS, SEMANTIC_CACHE_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+# Set to "false" to disable the semantic cache
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+# Minimum cosine similarity between query embeddings for a cache hit
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+# Entries per namespace; memory is about max entries x (embedding size x 4 bytes + response size)
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2048"))
+# Seconds an entry stays valid (0 keeps entries until they are replaced or invalidated)
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+# Fraction of similarity hits that are re-generated in the background to detect false hits
+SEMANTIC_CACHE_AUDIT_RATE = float(os.getenv("SEMANTIC_CACHE_AUDIT_RATE", "0.02"))
+
+# Seconds the cache is bypassed after the embedding model failed (e.g. it is not pulled)
+EMBEDDING_RETRY_INTERVAL = 60.0
+# Minimum similarity between a cached and a re-generated chat reply for the audit to agree
+REPLY_AGREEMENT_SIMILARITY = 0.8
+
+_POSSESSIVE = re.compile(r"['’]s\b")
+_NON_WORD = re.compile(r"[^\w\s]+")
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase a query, drop possessives and punctuation and collapse whitespace."""
+    text = _POSSESSIVE.sub("s", text.lower())
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+class SemanticCache:
+    """Bounded cache of responses keyed by normalized query text and its embedding."""
+
+    def __init__(self, namespace: str, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD, ttl: float = SEMANTIC_CACHE_TTL):
+        """
+        Args:
+            namespace: Name of the cache, used as the metrics label
+            max_entries: Maximum number of cached responses
+            threshold: Minimum cosine similarity for a hit
+            ttl: Seconds an entry stays valid (0 for no expiry)
+        """
+        self.namespace = namespace
+        self.max_entries = max(1, max_entries)
+        self.threshold = threshold
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._slots: Dict[str, int] = {}
+        self._keys: List[Optional[str]] = [None] * self.max_entries
+        self._values: List[Any] = [None] * self.max_entries
+        # Unit-length embeddings, allocated on the first insert once the dimension is known
+        self._vectors: Optional[np.ndarray] = None
+        self._live = np.zeros(self.max_entries, dtype=bool)
+        self._generations = np.zeros(self.max_entries, dtype=np.int64)
+        self._expires = np.zeros(self.max_entries, dtype=np.float64)
+        self._last_used = np.zeros(self.max_entries, dtype=np.float64)
+        self._used = 0  # Slots ever filled; only these are searched
+        self._entries = SEMANTIC_CACHE_ENTRIES.labels(namespace)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._live))
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the embedding matrix and bookkeeping arrays."""
+        arrays = (self._live, self._generations, self._expires, self._last_used)
+        return sum(array.nbytes for array in arrays) + (self._vectors.nbytes if self._vectors is not None else 0)
+
+    def _valid(self, slots, generation: int, now: float):
+        return self._live[slots] & (self._generations[slots] == generation) & (self._expires[slots] > now)
+
+    def get(self, key: str, generation: int) -> Any:
+        """
+        Look up a normalized query exactly.
+
+        Args:
+            key: The normalized query
+            generation: Entries stored under another generation (catalog version) are ignored
+
+        Returns:
+            The cached response, or None
+        """
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None or not self._valid(slot, generation, time.time()):
+                return None
+            self._last_used[slot] = time.monotonic()
+            return self._values[slot]
+
+    def nearest(self, vector: np.ndarray, generation: int) -> Tuple[Any, Optional[float]]:
+        """
+        Find the most similar cached query.
+
+        Args:
+            vector: Unit-length embedding of the normalized query
+            generation: Entries stored under another generation are ignored
+
+        Returns:
+            (cached response if the similarity reaches the threshold else None,
+             similarity of the nearest valid entry or None when there is none)
+        """
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0] or not self._used:
+                return None, None
+            used = slice(0, self._used)
+            valid = self._valid(used, generation, time.time())
+            if not valid.any():
+                return None, None
+            scores = np.where(valid, self._vectors[used] @ vector, -np.inf)
+            slot = int(np.argmax(scores))
+            similarity = float(scores[slot])
+            if similarity < self.threshold:
+                return None, similarity
+            self._last_used[slot] = time.monotonic()
+            return self._values[slot], similarity
+
+    def put(self, key: str, vector: np.ndarray, value: Any, generation: int) -> None:
+        """
+        Cache a response, replacing an expired, stale or else the least recently used entry when full.
+
+        Args:
+            key: The normalized query
+            vector: Unit-length embedding of the normalized query
+            value: The response to cache
+            generation: Generation (catalog version) the response was produced for
+        """
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                # First insert, or the embedding model changed: start over
+                self._clear()
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._free_slot(generation)
+                if self._keys[slot] is not None:
+                    self._slots.pop(self._keys[slot], None)
+                self._slots[key] = slot
+            now = time.time()
+            self._keys[slot] = key
+            self._values[slot] = value
+            self._vectors[slot] = vector
+            self._live[slot] = True
+            self._generations[slot] = generation
+            self._expires[slot] = now + self.ttl if self.ttl > 0 else np.inf
+            self._last_used[slot] = time.monotonic()
+            self._entries.set(len(self))
+
+    def _free_slot(self, generation: int) -> int:
+        if self._used < self.max_entries:
+            self._used += 1
+            return self._used - 1
+        reusable = np.flatnonzero(~self._valid(slice(None), generation, time.time()))
+        if reusable.size:
+            return int(reusable[0])
+        return int(np.argmin(self._last_used))
+
+    def _clear(self) -> None:
+        self._slots.clear()
+        self._keys = [None] * self.max_entries
+        self._values = [None] * self.max_entries
+        self._live[:] = False
+        self._used = 0
+        self._entries.set(0)
+
+    def invalidate(self, generation: int) -> int:
+        """
+        Drop entries stored for generations older than the given one.
+
+        Returns:
+            The number of entries dropped
+        """
+        with self._lock:
+            stale = np.flatnonzero(self._live & (self._generations < generation))
+            for slot in stale:
+                self._slots.pop(self._keys[slot], None)
+                self._keys[slot] = None
+                self._values[slot] = None
+            self._live[stale] = False
+            self._entries.set(len(self))
+            return int(stale.size)
+
+
+_caches: Dict[str, SemanticCache] = {}
+_caches_lock = threading.Lock()
+# Lookups waiting for a model call, so identical concurrent queries share one generation
+_in_flight: Dict[Tuple[str, str, int], asyncio.Future] = {}
+# Background audits, referenced until they finish
+_audits: set = set()
+_embedding_unavailable_until = 0.0
+
+
+def recommendation_namespace(structured: bool) -> str:
+    """The cache namespace of recommendations in markdown or structured output mode."""
+    return "recommend:structured" if structured else "recommend:markdown"
+
+
+def get_cache(namespace: str) -> SemanticCache:
+    """Get (or create) the cache of a namespace."""
+    cache = _caches.get(namespace)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.setdefault(namespace, SemanticCache(namespace))
+    return cache
+
+
+def invalidate(prefix: str, generation: int) -> None:
+    """
+    Drop entries of older generations from every namespace starting with a prefix.
+
+    Args:
+        prefix: Namespace prefix, e.g. "recommend"
+        generation: The current generation (catalog version)
+    """
+    for namespace, cache in list(_caches.items()):
+        if namespace.startswith(prefix):
+            dropped = cache.invalidate(generation)
+            if dropped:
+                logger.info("Dropped %s %s cache entries older than generation %s", dropped, namespace, generation)
+
+
+async def embed_query(text: str) -> np.ndarray:
+    """Embed a normalized query as a unit-length float32 vector."""
+    vector = np.asarray((await embed_texts([text]))[0], dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else vector
+
+
+def agree_by_embedding(threshold: float = REPLY_AGREEMENT_SIMILARITY) -> Callable[[str, str], Awaitable[bool]]:
+    """An audit comparison for free-text replies: the two replies must have similar embeddings."""
+    async def agree(cached: str, fresh: str) -> bool:
+        vectors = np.asarray(await embed_texts([cached, fresh]), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return float(vectors[0] @ vectors[1]) >= threshold
+    return agree
+
+
+async def cached_response(
+    namespace: str,
+    query: str,
+    generate: Callable[[], Awaitable[Any]],
+    generation: int = 0,
+    is_cacheable: Callable[[Any], bool] = lambda value: value is not None,
+    agree: Optional[Callable[[Any, Any], Any]] = None
+) -> Tuple[Any, str]:
+    """
+    Answer a query from the cache, or generate and cache the response.
+
+    Args:
+        namespace: Cache namespace; responses are only shared within a namespace
+        query: The user's query
+        generate: Produces the response on a miss
+        generation: Responses are only reused within one generation (pass the catalog version
+            when the response depends on the catalog)
+        is_cacheable: Whether a generated response may be cached (e.g. not an error reply)
+        agree: Compares a cached and a re-generated response for the false-hit audit
+            (sync or async); without it hits are not audited
+
+    Returns:
+        (response, cache result: "exact", "hit", "coalesced", "miss" or "bypass")
+    """
+    global _embedding_unavailable_until
+    if not SEMANTIC_CACHE_ENABLED:
+        return await generate(), "bypass"
+
+    cache = get_cache(namespace)
+    key = normalize_query(query)
+    value = cache.get(key, generation)
+    if value is not None:
+        SEMANTIC_CACHE_LOOKUPS.labels(namespace, "exact").inc()
+        return value, "exact"
+
+    flight = (namespace, key, generation)
+    leader = _in_flight.get(flight)
+    if leader is not None:
+        value = await asyncio.shield(leader)
+        if value is not None:
+            SEMANTIC_CACHE_LOOKUPS.labels(namespace, "coalesced").inc()
+            return value, "coalesced"
+
+    if time.monotonic() < _embedding_unavailable_until:
+        SEMANTIC_CACHE_LOOKUPS.labels(namespace, "bypass").inc()
+        return await generate(), "bypass"
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight.setdefault(flight, future)
+    value = None
+    try:
+        try:
+            vector = await embed_query(key)
+        except Exception as e:
+            logger.warning("Semantic cache bypassed for %ss, embedding failed: %s", EMBEDDING_RETRY_INTERVAL, e)
+            _embedding_unavailable_until = time.monotonic() + EMBEDDING_RETRY_INTERVAL
+            SEMANTIC_CACHE_LOOKUPS.labels(namespace, "bypass").inc()
+            value = await generate()
+            return value, "bypass"
+
+        value, similarity = cache.nearest(vector, generation)
+        if similarity is not None:
+            SEMANTIC_CACHE_SIMILARITY.labels(namespace).observe(similarity)
+        if value is not None:
+            SEMANTIC_CACHE_LOOKUPS.labels(namespace, "hit").inc()
+            logger.debug("Semantic cache hit in %s for %r (similarity %.3f)", namespace, key, similarity)
+            if agree is not None and random.random() < SEMANTIC_CACHE_AUDIT_RATE:
+                task = asyncio.ensure_future(_audit(cache, key, vector, value, generate, generation,
+                                                    is_cacheable, agree))
+                _audits.add(task)
+                task.add_done_callback(_audits.discard)
+            return value, "hit"
+
+        SEMANTIC_CACHE_LOOKUPS.labels(namespace, "miss").inc()
+        value = await generate()
+        if is_cacheable(value):
+            cache.put(key, vector, value, generation)
+        return value, "miss"
+    finally:
+        if _in_flight.get(flight) is future:
+            del _in_flight[flight]
+        # Waiting lookups for the same query take the response, or generate themselves if it is unusable
+        future.set_result(value if value is not None and is_cacheable(value) else None)
+
+
+async def _audit(cache: SemanticCache, key: str, vector: np.ndarray, cached: Any,
+                 generate: Callable[[], Awaitable[Any]], generation: int,
+                 is_cacheable: Callable[[Any], bool], agree: Callable[[Any, Any], Any]) -> None:
+    """Re-generate a cached response and record whether the hit was a false hit."""
+    try:
+        fresh = await generate()
+        if not is_cacheable(fresh):
+            return
+        same = agree(cached, fresh)
+        if inspect.isawaitable(same):
+            same = await same
+    except Exception as e:
+        logger.warning("Semantic cache audit failed in %s: %s", cache.namespace, e)
+        return
+    SEMANTIC_CACHE_AUDITS.labels(cache.namespace, "agree" if same else "false_hit").inc()
+    if not same:
+        # The query gets its own entry, so it no longer reuses the neighbour's response
+        logger.info("Semantic cache false hit in %s for %r", cache.namespace, key)
+        cache.put(key, vector, fresh, generation)
+
+
+async def warm(
+    namespace: str,
+    query: str,
+    generate: Callable[[], Awaitable[Any]],
+    generation: int = 0,
+    is_cacheable: Callable[[Any], bool] = lambda value: value is not None
+) -> str:
+    """
+    Generate and cache the response to a query unless the cache already answers it.
+
+    Unlike cached_response, this is not counted in the lookup metrics.
+
+    Args:
+        namespace: Cache namespace
+        query: The query to precompute
+        generate: Produces the response
+        generation: Generation (catalog version) the response is produced for
+        is_cacheable: Whether the generated response may be cached
+
+    Returns:
+        "warmed" if a new response was cached, "cached" if the cache already answers the
+        query, "skipped" if the response cannot be cached (or the cache is disabled)
+
+    Raises:
+        Exception: If the query cannot be embedded
+    """
+    key = normalize_query(query)
+    if not SEMANTIC_CACHE_ENABLED or not key:
+        return "skipped"
+    cache = get_cache(namespace)
+    if cache.get(key, generation) is not None:
+        return "cached"
+    vector = await embed_query(key)
+    if cache.nearest(vector, generation)[0] is not None:
+        return "cached"
+    value = await generate()
+    if not is_cacheable(value):
+        return "skipped"
+    cache.put(key, vector, value, generation)
+    return "warmed"
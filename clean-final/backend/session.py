@@ -1,14 +1,38 @@
 """
 Session management for the Pocket AI e-commerce agent.
-This module handles user sessions and chat history.
+This module handles user sessions and chat history. Sessions live in process memory,
+or in a shared SQLite file when the backend runs several workers (SESSION_SQLITE_PATH),
+so a conversation continues whichever worker serves its next request.
 """
 
+import os
+import time
 import uuid
+import asyncio
+import sqlite3
+import logging
+import threading
 from typing import Dict, List, Tuple, Any, Optional
 
+from metrics import instrument
 
-# In-memory session storage
-sessions = {}
+logger = logging.getLogger(__name__)
+
+# Shared SQLite file holding the sessions of all workers (unset: sessions are kept in process memory)
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "")
+# Seconds an idle session is kept in the SQLite store (0 keeps sessions forever)
+SESSION_TTL = float(os.getenv("SESSION_TTL", "604800"))
+
+# Seconds between deletions of idle sessions from the SQLite store
+SQLITE_PRUNE_INTERVAL = 600.0
+
+SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You are Pocket AI, a helpful shopping assistant for an e-commerce website. "
+               "You help users find products, answer questions about shopping, and provide "
+               "recommendations. Be concise, friendly, and helpful. If asked about products, "
+               "focus on those that would be found in our store catalog."
+}
 
 
 def generate_session_id() -> str:
@@ -16,60 +40,177 @@ def generate_session_id() -> str:
     return str(uuid.uuid4())
 
 
-def get_session(session_id: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+class MemoryStore:
+    """Sessions kept in the memory of one process."""
+
+    blocking = False
+
+    def __init__(self):
+        self.sessions: Dict[str, Dict[str, Any]] = {}
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """The session's data, or None if there is no such session."""
+        return self.sessions.get(session_id)
+
+    def create(self, session_id: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Store a new session with its initial messages."""
+        session = self.sessions[session_id] = {"messages": messages}
+        return session
+
+    def append(self, session_id: str, messages: List[Dict[str, str]]) -> None:
+        """Add messages to an existing session's history."""
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session["messages"].extend(messages)
+
+
+class SQLiteStore:
+    """Sessions shared by the worker processes through a SQLite file."""
+
+    blocking = True
+
+    def __init__(self, path: str, ttl: float = SESSION_TTL):
+        """
+        Args:
+            path: Database file, created if needed
+            ttl: Seconds an idle session is kept (0 for no expiry)
+        """
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._last_prune = 0.0
+        connection = self._connection()
+        connection.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, updated REAL NOT NULL)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS session_messages ("
+            "id INTEGER PRIMARY KEY, session_id TEXT NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS session_messages_session ON session_messages (session_id, id)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit mode; transactions are started explicitly with BEGIN IMMEDIATE
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """The session's data (a copy), or None if there is no such session."""
+        connection = self._connection()
+        if connection.execute("SELECT 1 FROM sessions WHERE id = ?", (session_id,)).fetchone() is None:
+            return None
+        rows = connection.execute(
+            "SELECT role, content FROM session_messages WHERE session_id = ? ORDER BY id", (session_id,)
+        )
+        return {"messages": [{"role": role, "content": content} for role, content in rows]}
+
+    def create(self, session_id: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Store a new session with its initial messages."""
+        self._write(session_id, messages, create=True)
+        return {"messages": list(messages)}
+
+    def append(self, session_id: str, messages: List[Dict[str, str]]) -> None:
+        """Add messages to an existing session's history."""
+        self._write(session_id, messages, create=False)
+
+    def _write(self, session_id: str, messages: List[Dict[str, str]], create: bool) -> None:
+        connection = self._connection()
+        # Wall-clock time, since the sessions are shared between processes
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if create:
+                connection.execute("INSERT INTO sessions (id, updated) VALUES (?, ?)", (session_id, now))
+                exists = True
+            else:
+                exists = connection.execute("UPDATE sessions SET updated = ? WHERE id = ?",
+                                            (now, session_id)).rowcount > 0
+            if exists:
+                connection.executemany(
+                    "INSERT INTO session_messages (session_id, role, content) VALUES (?, ?, ?)",
+                    [(session_id, message["role"], message["content"]) for message in messages]
+                )
+            if self.ttl > 0 and now - self._last_prune >= SQLITE_PRUNE_INTERVAL:
+                self._last_prune = now
+                expired = now - self.ttl
+                connection.execute("DELETE FROM session_messages WHERE session_id IN "
+                                   "(SELECT id FROM sessions WHERE updated < ?)", (expired,))
+                connection.execute("DELETE FROM sessions WHERE updated < ?", (expired,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The session store of this process, opened on first use (in the worker process)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SQLiteStore(SESSION_SQLITE_PATH) if SESSION_SQLITE_PATH else MemoryStore()
+        return _store
+
+
+async def _run(method, *args):
+    """Call a store method, off the event loop when the store blocks."""
+    store = get_store()
+    if store.blocking:
+        return await asyncio.get_running_loop().run_in_executor(None, getattr(store, method), *args)
+    return getattr(store, method)(*args)
+
+
+@instrument("session_get")
+async def get_session(session_id: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
     """
     Get or create a session.
-    
+
     Args:
         session_id: Optional session ID. If None or invalid, a new session is created.
-        
+
     Returns:
         A tuple of (session_id, session_data)
     """
-    if not session_id or session_id not in sessions:
+    session = await _run("load", session_id) if session_id else None
+    if session is None:
         # Create new session
         session_id = generate_session_id()
-        sessions[session_id] = {
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "You are Pocket AI, a helpful shopping assistant for an e-commerce website. "
-                               "You help users find products, answer questions about shopping, and provide "
-                               "recommendations. Be concise, friendly, and helpful. If asked about products, "
-                               "focus on those that would be found in our store catalog."
-                }
-            ]
-        }
-    
-    return session_id, sessions[session_id]
-
-
-def add_message_to_session(session_id: str, role: str, content: str) -> None:
+        session = await _run("create", session_id, [dict(SYSTEM_MESSAGE)])
+
+    return session_id, session
+
+
+@instrument("session_add_message")
+async def add_message_to_session(session_id: str, role: str, content: str) -> None:
     """
     Add a message to a session's chat history.
-    
+
     Args:
         session_id: The session ID
         role: Message role (user, assistant, system)
         content: Message content
     """
-    if session_id in sessions:
-        sessions[session_id]["messages"].append({
-            "role": role,
-            "content": content
-        })
+    await _run("append", session_id, [{"role": role, "content": content}])
 
 
-def get_session_messages(session_id: str) -> List[Dict[str, str]]:
+@instrument("session_get_messages")
+async def get_session_messages(session_id: str) -> List[Dict[str, str]]:
     """
     Get all messages from a session.
-    
+
     Args:
         session_id: The session ID
-        
+
     Returns:
         A list of message objects with role and content
     """
-    if session_id in sessions:
-        return sessions[session_id]["messages"]
-    return [] 
\ No newline at end of file
+    session = await _run("load", session_id)
+    if session is not None:
+        return session["messages"]
+    return []
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark of the product catalog representation.
+Compares, at several catalog sizes:
+    dicts     the previous list of product dicts with its ID and category indexes
+    columnar  the columnar ProductTable built in each worker
+    mapped    the columnar catalog mapped read-only from a shared snapshot file (start.py)
+
+Several worker processes load the catalog one after another and then stay alive
+together. Memory is each worker's growth in proportional set size (PSS), which splits
+pages shared between processes among them, so the total shows what N workers really cost.
+
+Usage: python benchmarks/bench_catalog_memory.py [--sizes 100000 1000000] [--workers 2]
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+
+from catalog_fixtures import iter_catalog
+
+LAYOUTS = ["dicts", "columnar", "mapped"]
+
+
+def memory_mb() -> dict:
+    """Proportional and private memory of this process in MB (Linux /proc)."""
+    usage = {"pss": 0.0, "private": 0.0}
+    try:
+        with open("/proc/self/smaps_rollup", "r") as rollup:
+            for line in rollup:
+                if line.startswith("Pss:"):
+                    usage["pss"] = int(line.split()[1]) / 1024
+                elif line.startswith(("Private_Clean:", "Private_Dirty:")):
+                    usage["private"] += int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return usage
+
+
+def build_dicts(size: int, snapshot: str):
+    """The previous representation: product dicts plus the ID and category indexes."""
+    products = list(iter_catalog(size))
+    by_id = {product["id"]: product for product in products}
+    by_category = {}
+    for product in products:
+        by_category.setdefault(product["category"], []).append(product)
+    return products, by_id.get
+
+
+def build_columnar(size: int, snapshot: str):
+    """The columnar catalog snapshot built in-process by backend/products.py."""
+    from catalog import Catalog
+    catalog = Catalog(iter_catalog(size))
+    return catalog.products, catalog.get
+
+
+def map_snapshot(size: int, snapshot: str):
+    """The columnar catalog mapped from the shared snapshot file."""
+    from catalog import Catalog
+    catalog = Catalog.from_snapshot(snapshot)
+    return catalog.products, catalog.get
+
+
+BUILDERS = {"dicts": build_dicts, "columnar": build_columnar, "mapped": map_snapshot}
+
+
+def run_child(layout: str, size: int, lookups: int, snapshot: str) -> None:
+    """Load one representation, report timings, then report memory once all workers are loaded."""
+    # Import before measuring so module memory is not counted
+    import catalog  # noqa: F401
+    gc.collect()
+    before = memory_mb()
+    started = time.perf_counter()
+    products, get = BUILDERS[layout](size, snapshot)
+    startup_seconds = time.perf_counter() - started
+
+    # Read every product once so all of the catalog is resident
+    started = time.perf_counter()
+    for product in products:
+        product["category"], product["name"], product["price"]
+    scan_ms = (time.perf_counter() - started) * 1000
+
+    ids = [random.randint(1, size) for _ in range(lookups)]
+    started = time.perf_counter()
+    for product_id in ids:
+        product = get(product_id)
+        product["price"], product["name"]
+    lookup_us = (time.perf_counter() - started) / lookups * 1e6
+
+    gc.collect()
+    print(json.dumps({"startupS": startup_seconds, "scanMs": scan_ms, "lookupUs": lookup_us}), flush=True)
+    sys.stdin.readline()
+    after = memory_mb()
+    print(json.dumps({"pssMb": after["pss"] - before["pss"], "privateMb": after["private"] - before["private"]}),
+          flush=True)
+
+
+def write_snapshot(size: int, path: str) -> None:
+    """Write the shared snapshot for a synthetic catalog (columns only, as the launcher would)."""
+    from catalog import Catalog
+    Catalog(iter_catalog(size)).save_snapshot(path)
+
+
+def run_workers(layout: str, size: int, workers: int, lookups: int, snapshot: str) -> dict:
+    """Start the workers one at a time, keep them alive together and collect their figures."""
+    command = [sys.executable, os.path.abspath(__file__), "--child", layout, "--sizes", str(size),
+               "--lookups", str(lookups), "--snapshot", snapshot]
+    processes, timings, memory = [], [], []
+    try:
+        for _ in range(workers):
+            process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+            processes.append(process)
+            timings.append(json.loads(process.stdout.readline()))
+        for process in processes:
+            process.stdin.write("\n")
+            process.stdin.flush()
+        memory = [json.loads(process.stdout.readline()) for process in processes]
+    finally:
+        for process in processes:
+            process.stdin.close()
+            process.wait()
+    return {
+        "workerMb": sum(m["pssMb"] for m in memory) / workers,
+        "totalMb": sum(m["pssMb"] for m in memory),
+        "privateMb": sum(m["privateMb"] for m in memory) / workers,
+        "startupS": sum(t["startupS"] for t in timings) / workers,
+        "lookupUs": sum(t["lookupUs"] for t in timings) / workers,
+        "scanMs": sum(t["scanMs"] for t in timings) / workers,
+    }
+
+
+def main():
+    """Measure each layout and size and print the comparison table."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100_000, 1_000_000], help="Catalog sizes")
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes holding the catalog at once")
+    parser.add_argument("--lookups", type=int, default=100_000, help="Random get-by-ID calls to time")
+    parser.add_argument("--layouts", nargs="+", default=LAYOUTS, choices=LAYOUTS)
+    parser.add_argument("--child", choices=LAYOUTS, help=argparse.SUPPRESS)
+    parser.add_argument("--write-snapshot", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--snapshot", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.write_snapshot:
+        write_snapshot(args.sizes[0], args.snapshot)
+        return 0
+    if args.child:
+        run_child(args.child, args.sizes[0], args.lookups, args.snapshot)
+        return 0
+
+    print(f"{args.workers} workers per layout; memory is PSS growth per worker and for all workers\n")
+    print(f"{'products':>9} {'layout':<9} {'worker MB':>10} {'total MB':>9} {'private MB':>11} {'startup s':>10} "
+          f"{'get us':>7} {'scan ms':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            snapshot = os.path.join(tmp, f"catalog-{size}.snapshot")
+            if "mapped" in args.layouts:
+                subprocess.run([sys.executable, os.path.abspath(__file__), "--write-snapshot",
+                                "--sizes", str(size), "--snapshot", snapshot], check=True)
+            for layout in args.layouts:
+                r = run_workers(layout, size, args.workers, args.lookups, snapshot)
+                print(f"{size:>9} {layout:<9} {r['workerMb']:>10.1f} {r['totalMb']:>9.1f} {r['privateMb']:>11.1f} "
+                      f"{r['startupS']:>10.2f} {r['lookupUs']:>7.2f} {r['scanMs']:>8.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Lookup benchmark of the color-histogram prefilter.
+Builds ColorIndex instances over synthetic catalogs with random color signatures and
+times the vectorized nearest-color search, plus the histogram of a 32x32 thumbnail
+(the decoding itself needs Pillow and is not measured), reporting the memory held by
+the signature matrix.
+
+Usage: python benchmarks/bench_color_prefilter.py [--products 1000 10000 100000]
+"""
+
+import sys
+import time
+import argparse
+import statistics
+
+import numpy as np
+
+from catalog_fixtures import BACKEND_DIR, iter_catalog  # noqa: F401 (puts the backend on sys.path)
+
+
+def time_us(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(samples)
+
+
+def main():
+    """Build indexes of each size and print histogram and search latencies."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", nargs="+", type=int, default=[1000, 10000, 100000], help="Catalog sizes")
+    parser.add_argument("--repeat", type=int, default=200, help="Timed runs per operation")
+    args = parser.parse_args()
+
+    from color_index import ColorIndex, color_histogram, THUMBNAIL_SIZE
+
+    rng = np.random.default_rng(42)
+    thumbnails = rng.integers(0, 256, (args.repeat, THUMBNAIL_SIZE, THUMBNAIL_SIZE, 3), dtype=np.uint8)
+    signatures = iter(thumbnails)
+    histogram = time_us(lambda: color_histogram(next(signatures)), args.repeat)
+    print(f"histogram of a {THUMBNAIL_SIZE}x{THUMBNAIL_SIZE} thumbnail: {histogram:.0f} us\n")
+    print(f"{'products':>9} {'nearest us':>11} {'matrix MB':>10}")
+    for size in args.products:
+        products = list(iter_catalog(size))
+        # Sparse random histograms, like product photos dominated by a few colors
+        counts = rng.random((size, 64)).astype(np.float32) ** 8
+        matrix = np.sqrt(counts / counts.sum(axis=1, keepdims=True))
+        index = ColorIndex(products, matrix, np.ones(size, dtype=bool))
+        probe = color_histogram(thumbnails[0])
+        nearest = time_us(lambda: index.nearest(probe, 5, 0.0), args.repeat)
+        print(f"{size:>9} {nearest:>11.0f} {matrix.nbytes / 2**20:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark for product ID and relevance extraction from recommendation text.
+Compares the precompiled single-pass ResponseParser with the original
+list-scan + per-request regex approach on large synthetic catalogs.
+
+Usage: python benchmarks/bench_extraction.py [--sizes 100 1000 10000] [--iterations 200]
+"""
+
+import re
+import sys
+import time
+import argparse
+from typing import List, Dict, Any
+
+from catalog_fixtures import make_catalog, make_recommendation_text
+from response_parser import ResponseParser
+
+
+def legacy_extract(recommendation_text: str, catalog: List[Dict[str, Any]]):
+    """The extraction as it was done before ResponseParser (IDs, names, then scores)."""
+    mentioned_ids = []
+    valid_product_ids = [p["id"] for p in catalog]
+
+    id_pattern = re.compile(r"product\s+id:\s*(\d+)", re.IGNORECASE)
+    for match in id_pattern.finditer(recommendation_text):
+        product_id = int(match.group(1))
+        if product_id in valid_product_ids and product_id not in mentioned_ids:
+            mentioned_ids.append(product_id)
+
+    if len(mentioned_ids) < 3:
+        for product in catalog:
+            if product["id"] in mentioned_ids:
+                continue
+            if product["name"] in recommendation_text:
+                mentioned_ids.append(product["id"])
+                if len(mentioned_ids) >= 3:
+                    break
+
+    verified_ids = [pid for pid in mentioned_ids if pid in valid_product_ids][:3]
+
+    relevance_scores = {}
+    score_pattern = re.compile(r"Relevance Score:\s*(\d+)/100.*?Product ID:\s*(\d+)", re.DOTALL)
+    for match in score_pattern.finditer(recommendation_text):
+        relevance_scores[int(match.group(2))] = int(match.group(1))
+
+    return verified_ids, relevance_scores
+
+
+def time_per_call(func, iterations: int) -> float:
+    """Return the mean wall time of func() in microseconds."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    """Run the extraction benchmark and print a comparison table."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="Catalog sizes to benchmark")
+    parser.add_argument("--iterations", type=int, default=200, help="Calls per measurement")
+    args = parser.parse_args()
+
+    print(f"{'products':>9} {'text':>6} {'build ms':>9} {'legacy us':>10} {'parser us':>10} {'speedup':>8}")
+    print("-" * 58)
+    for size in args.sizes:
+        catalog = make_catalog(size)
+
+        start = time.perf_counter()
+        response_parser = ResponseParser(catalog)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        for with_ids in (True, False):
+            text = make_recommendation_text(catalog, with_ids=with_ids)
+
+            # Sanity check: both approaches must agree on the extracted products
+            legacy_ids, _ = legacy_extract(text, catalog)
+            parsed_ids = response_parser.parse(text).ranked_ids(limit=3)
+            if sorted(legacy_ids) != sorted(parsed_ids):
+                print(f"Mismatch at {size} products: legacy={legacy_ids} parser={parsed_ids}")
+                return 1
+
+            legacy_us = time_per_call(lambda: legacy_extract(text, catalog), args.iterations)
+            parser_us = time_per_call(lambda: response_parser.parse(text), args.iterations)
+            label = "ids" if with_ids else "names"
+            print(f"{size:>9} {label:>6} {build_ms:>9.1f} {legacy_us:>10.1f} {parser_us:>10.1f} "
+                  f"{legacy_us / parser_us:>7.1f}x")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tail latency benchmark of hedged Ollama requests.
+Serves two fake Ollama hosts in process, each stalling a fraction of its generations,
+and sends the same chat requests through OllamaPool with hedging off and on. Each run
+first sends warm-up requests so the adaptive timeout and hedge delay are known, then
+reports latency percentiles, the share of requests that were hedged and how often the
+hedge answered first.
+
+Usage: python benchmarks/bench_hedging.py [--requests 400] [--concurrency 8] [--stall-rate 0.05] [--stall-time 2]
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+import httpx
+import numpy as np
+
+from catalog_fixtures import BACKEND_DIR  # noqa: F401 (puts the backend on sys.path)
+from fake_ollama import FakeOllamaSettings, create_app
+
+HOSTS = ["http://ollama-a/api", "http://ollama-b/api"]
+
+
+def counter_value(counter, *labels) -> float:
+    return counter.labels(*labels).value
+
+
+async def run(hedge: bool, args: argparse.Namespace) -> dict:
+    """Send the warm-up and measured requests through a fresh pool and collect latencies."""
+    from ollama_pool import OllamaPool, LatencyTracker
+    from metrics import OLLAMA_HEDGES
+
+    mounts = {}
+    for i, url in enumerate(HOSTS):
+        settings = FakeOllamaSettings(latency=args.latency, token_rate=0, tokens=20, parallel=64, seed=i,
+                                      stall_rate=args.stall_rate, stall_time=args.stall_time)
+        mounts[url.rsplit("/", 1)[0].replace("http", "all", 1)] = httpx.ASGITransport(app=create_app(settings))
+    pool = OllamaPool(HOSTS, hedge_enabled=hedge, tracker=LatencyTracker())
+    model = "hedged" if hedge else "plain"
+    payload = {"model": model, "messages": [{"role": "user", "content": "running shoes"}], "stream": False}
+    before = {outcome: counter_value(OLLAMA_HEDGES, model, "chat", outcome) for outcome in ("sent", "won")}
+    latencies = []
+
+    async with httpx.AsyncClient(mounts=mounts) as client:
+        async def send(count: int, record: bool):
+            for _ in range(count):
+                started = time.perf_counter()
+                response = await pool.post(client, "chat", payload)
+                response.raise_for_status()
+                if record:
+                    latencies.append(time.perf_counter() - started)
+
+        per_client = args.requests // args.concurrency
+        await asyncio.gather(*(send(args.warmup // args.concurrency, False) for _ in range(args.concurrency)))
+        for outcome in before:
+            before[outcome] = counter_value(OLLAMA_HEDGES, model, "chat", outcome)
+        await asyncio.gather(*(send(per_client, True) for _ in range(args.concurrency)))
+
+    sent = counter_value(OLLAMA_HEDGES, model, "chat", "sent") - before["sent"]
+    won = counter_value(OLLAMA_HEDGES, model, "chat", "won") - before["won"]
+    p50, p95, p99 = np.percentile(latencies, (50, 95, 99))
+    return {"p50": p50, "p95": p95, "p99": p99, "max": max(latencies), "mean": statistics.mean(latencies),
+            "hedged": sent / len(latencies), "won": won / sent if sent else 0.0,
+            "delay": pool.tracker.hedge_delay(model, "chat"), "timeout": pool.tracker.timeout(model, "chat")}
+
+
+def main():
+    """Run the request mix with hedging off and on and print the latency distribution."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400, help="Measured requests per run")
+    parser.add_argument("--warmup", type=int, default=80, help="Requests before measuring")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--latency", type=float, default=0.1, help="Normal seconds per generation")
+    parser.add_argument("--stall-rate", type=float, default=0.05, help="Fraction of generations that stall")
+    parser.add_argument("--stall-time", type=float, default=2.0, help="Extra seconds of a stalled generation")
+    args = parser.parse_args()
+
+    print(f"2 hosts, {args.latency * 1000:.0f} ms per generation, {args.stall_rate:.0%} stall for "
+          f"+{args.stall_time:.1f}s; {args.requests} requests from {args.concurrency} clients\n")
+    print(f"{'hedging':<8} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'max ms':>7} {'mean ms':>8} "
+          f"{'hedged':>7} {'won':>5} {'delay ms':>9}")
+    for hedge in (False, True):
+        r = asyncio.run(run(hedge, args))
+        delay = f"{r['delay'] * 1000:.0f}" if hedge and r["delay"] else "-"
+        print(f"{'on' if hedge else 'off':<8} {r['p50'] * 1000:>7.0f} {r['p95'] * 1000:>7.0f} {r['p99'] * 1000:>7.0f} "
+              f"{r['max'] * 1000:>7.0f} {r['mean'] * 1000:>8.0f} {r['hedged']:>7.1%} {r['won']:>5.0%} {delay:>9}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
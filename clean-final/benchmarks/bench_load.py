@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for the Pocket AI backend and frontend.
+Starts the fake Ollama server, the backend and the frontend as subprocesses, drives
+the API and frontend routes with concurrent clients and reports throughput,
+p50/p95/p99 latency, errors and server memory per scenario.
+
+Usage:
+    python benchmarks/bench_load.py [--concurrency 8] [--requests 100] [--scenarios chat recommend]
+    python benchmarks/bench_load.py --output results.json
+    python benchmarks/bench_load.py --baseline results.json --max-regression 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import Any, Callable, Dict, List
+
+import httpx
+
+from catalog_fixtures import ROOT_DIR, BACKEND_DIR
+from start import wait_for_ready, find_available_port
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FRONTEND_DIR = os.path.join(ROOT_DIR, "frontend")
+
+QUERIES = ["comfortable running shoes", "wireless headphones for the gym", "a gift for a book lover",
+           "waterproof jacket for hiking", "smart watch with heart rate monitor"]
+
+
+def make_png(width: int = 64, height: int = 64) -> bytes:
+    """Build a small solid-colour PNG without any imaging library."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    row = b"\x00" + b"\x20\x60\xc0" * width
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(row * height))
+            + chunk(b"IEND", b""))
+
+
+IMAGE = make_png()
+
+
+def _query(i: int) -> str:
+    return QUERIES[i % len(QUERIES)]
+
+
+# Scenario name -> (service, method, path, request kwargs builder)
+SCENARIOS: Dict[str, tuple] = {
+    "chat": ("backend", "POST", "/api/chat",
+             lambda i: {"json": {"message": _query(i)}}),
+    "recommend": ("backend", "POST", "/api/recommend",
+                  lambda i: {"json": {"query": _query(i)}}),
+    "recommend-structured": ("backend", "POST", "/api/recommend",
+                             lambda i: {"json": {"query": _query(i), "structured": True}}),
+    "image-search": ("backend", "POST", "/api/image-search",
+                     lambda i: {"files": {"image": ("bench.png", IMAGE, "image/png")}}),
+    "product-match": ("backend", "POST", "/api/product-match",
+                      lambda i: {"files": {"image": ("bench.png", IMAGE, "image/png")}}),
+    "frontend-home": ("frontend", "GET", "/", lambda i: {}),
+    "frontend-chat": ("frontend", "POST", "/send-message",
+                      lambda i: {"data": {"message": _query(i)}}),
+    "frontend-recommend": ("frontend", "POST", "/get-recommendations",
+                           lambda i: {"data": {"query": _query(i)}}),
+    "frontend-match": ("frontend", "POST", "/match-product",
+                       lambda i: {"files": {"image": ("bench.png", IMAGE, "image/png")}}),
+}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def rss_mb(pid: int) -> Dict[str, float]:
+    """Current and peak resident memory of a process in MB (Linux /proc)."""
+    usage = {"rss": 0.0, "peak": 0.0}
+    try:
+        with open(f"/proc/{pid}/status", "r") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    usage["rss"] = int(line.split()[1]) / 1024
+                elif line.startswith("VmHWM:"):
+                    usage["peak"] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return usage
+
+
+def is_error(service: str, response: httpx.Response) -> bool:
+    if response.status_code >= 400:
+        return True
+    # Frontend form routes report backend failures in the body with a 200 status
+    if service == "frontend" and response.headers.get("content-type", "").startswith("application/json"):
+        return response.json().get("success") is False
+    return False
+
+
+async def run_scenario(base_url: str, service: str, method: str, path: str,
+                       build: Callable[[int], Dict[str, Any]], total: int, concurrency: int,
+                       timeout: float) -> Dict[str, Any]:
+    """
+    Send `total` requests with `concurrency` concurrent clients.
+
+    Returns:
+        Request count, errors, throughput and latency percentiles in milliseconds
+    """
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+        async def worker():
+            nonlocal next_index, errors
+            while next_index < total:
+                i = next_index
+                next_index += 1
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, **build(i))
+                    failed = is_error(service, response)
+                except httpx.HTTPError:
+                    failed = True
+                latencies.append((time.perf_counter() - start) * 1000)
+                errors += failed
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "throughput": total / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1] if latencies else 0.0,
+    }
+
+
+def start_server(args: List[str], cwd: str, env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(args, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            max_regression: float) -> List[str]:
+    """List the scenarios whose p95 or throughput regressed beyond the allowed fraction."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if before["p95"] and result["p95"] > before["p95"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {before['p95']:.1f} -> {result['p95']:.1f} ms")
+        if before["throughput"] and result["throughput"] < before["throughput"] * (1 - max_regression):
+            regressions.append(f"{name}: throughput {before['throughput']:.1f} -> {result['throughput']:.1f} req/s")
+    return regressions
+
+
+def main():
+    """Start the servers, run the scenarios and print the results table."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed requests per scenario")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake Ollama time to first token")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="Fake Ollama tokens per second")
+    parser.add_argument("--tokens", type=int, default=60, help="Fake Ollama completion tokens")
+    parser.add_argument("--parallel", type=int, default=4, help="Fake Ollama parallel requests")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="Compare against a previous --output file")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed p95/throughput regression against the baseline (fraction)")
+    args = parser.parse_args()
+
+    ollama_port = find_available_port(11500)
+    backend_port = find_available_port(14000)
+    frontend_port = find_available_port(13000)
+    trace_dir = tempfile.mkdtemp(prefix="pocket-ai-bench-")
+
+    env = dict(os.environ)
+    env.update({
+        "OLLAMA_API_URL": f"http://127.0.0.1:{ollama_port}/api",
+        "BACKEND_API_URL": f"http://127.0.0.1:{backend_port}/api",
+        "TRACE_EXPORT_PATH": os.path.join(trace_dir, "traces.jsonl"),
+        # All bench clients share one address; measure capacity, not the rate limiter
+        "RATE_LIMIT_ENABLED": "false",
+        # The scenarios replay a few fixed queries; measure the model path, not semantic cache hits
+        "SEMANTIC_CACHE_ENABLED": "false",
+        # Every upload is the same image, so all but the first would be near-duplicate hits
+        "IMAGE_HASH_ENABLED": "false",
+        # Make the ollama CLI fallbacks fail fast so the API path is measured
+        "PATH": os.path.dirname(sys.executable),
+    })
+    uvicorn = [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--log-level", "warning"]
+
+    processes = {
+        "ollama": start_server([sys.executable, os.path.join(BENCH_DIR, "fake_ollama.py"),
+                                "--port", str(ollama_port), "--latency", str(args.latency),
+                                "--token-rate", str(args.token_rate), "--tokens", str(args.tokens),
+                                "--parallel", str(args.parallel)], BENCH_DIR, env),
+        "backend": start_server(uvicorn + ["--port", str(backend_port)], BACKEND_DIR, env),
+        "frontend": start_server(uvicorn + ["--port", str(frontend_port)], FRONTEND_DIR, env),
+    }
+    base_urls = {"backend": f"http://127.0.0.1:{backend_port}", "frontend": f"http://127.0.0.1:{frontend_port}"}
+
+    try:
+        ready = (wait_for_ready(f"http://127.0.0.1:{ollama_port}/api/tags", processes["ollama"])
+                 and wait_for_ready(f"{base_urls['backend']}/api/health", processes["backend"])
+                 and wait_for_ready(f"{base_urls['frontend']}/static/css/styles.css", processes["frontend"]))
+        if not ready:
+            print("Servers failed to start", file=sys.stderr)
+            return 1
+
+        results: Dict[str, Dict[str, Any]] = {}
+        print(f"{'scenario':<22} {'reqs':>5} {'errors':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+              f"{'p99 ms':>9} {'backend MB':>11} {'frontend MB':>12}")
+        for name in args.scenarios:
+            service, method, path, build = SCENARIOS[name]
+            if args.warmup:
+                asyncio.run(run_scenario(base_urls[service], service, method, path, build,
+                                         args.warmup, min(args.warmup, args.concurrency), args.timeout))
+            result = asyncio.run(run_scenario(base_urls[service], service, method, path, build,
+                                              args.requests, args.concurrency, args.timeout))
+            result["memory"] = {proc: rss_mb(processes[proc].pid) for proc in ("backend", "frontend")}
+            results[name] = result
+            print(f"{name:<22} {result['requests']:>5} {result['errors']:>6} {result['throughput']:>8.1f} "
+                  f"{result['p50']:>9.1f} {result['p95']:>9.1f} {result['p99']:>9.1f} "
+                  f"{result['memory']['backend']['rss']:>11.1f} {result['memory']['frontend']['rss']:>12.1f}")
+
+        peak = {proc: rss_mb(processes[proc].pid)["peak"] for proc in ("backend", "frontend")}
+        print(f"\nPeak RSS: backend {peak['backend']:.1f} MB, frontend {peak['frontend']:.1f} MB")
+
+        if args.output:
+            with open(args.output, "w") as output:
+                json.dump({"settings": vars(args), "results": results}, output, indent=2)
+
+        if args.baseline:
+            with open(args.baseline) as baseline_file:
+                baseline = json.load(baseline_file)["results"]
+            regressions = compare(results, baseline, args.max_regression)
+            if regressions:
+                print("\nRegressions against baseline:")
+                for line in regressions:
+                    print(f"  {line}")
+                return 1
+            print("\nNo regressions against baseline.")
+        return 0
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
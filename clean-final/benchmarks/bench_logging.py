@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the per-request logging overhead of /api/recommend.
+Each logging mode runs in its own process (logging is configured once per process)
+against a mocked Ollama. Modes are interleaved over several rounds and the median
+mean-request time is compared with logging disabled.
+
+Modes:
+    off                  logging disabled
+    text-sync            classic basicConfig file handler, every payload logged
+    json-queue           structured JSON through the queue handler, payloads sampled (default rates)
+    json-queue-unsampled structured JSON through the queue handler, every payload logged
+
+Usage: python benchmarks/bench_logging.py [--requests 1000] [--rounds 5] [--modes off json-queue]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+MODES = ["off", "text-sync", "json-queue", "json-queue-unsampled"]
+
+
+def run_child(mode: str, requests: int, log_file: str) -> dict:
+    """Run the benchmark for one mode inside this process and return the timings."""
+    os.environ.update({
+        "LOG_FILE": log_file,
+        "LOG_FORMAT": "json",
+        "TRACING_ENABLED": "false",
+        "OLLAMA_WARMUP_ENABLED": "false",
+        "LOG_SAMPLE_RATES": "payload=1" if mode in ("text-sync", "json-queue-unsampled") else "payload=0.01",
+    })
+
+    from catalog_fixtures import BACKEND_DIR
+    os.chdir(BACKEND_DIR)
+
+    import logging
+    import httpx
+    import ai_utils
+    import app as backend_app
+    from log_config import shutdown_logging, TEXT_FORMAT
+
+    if mode == "off":
+        shutdown_logging()
+        logging.disable(logging.CRITICAL)
+    elif mode == "text-sync":
+        shutdown_logging()
+        logging.basicConfig(level=logging.INFO, filename=log_file, format=TEXT_FORMAT, force=True)
+
+    recommendation = "".join(
+        f"## Product {i}\nRelevance Score: {90 - i}/100\nProduct ID: {i}\n" + "A detailed explanation. " * 60
+        for i in range(1, 4)
+    )
+
+    def ollama(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"message": {"content": recommendation}, "eval_count": 400,
+                                         "prompt_eval_count": 1200, "total_duration": 1000})
+
+    ai_utils._http_client = httpx.AsyncClient(transport=httpx.MockTransport(ollama))
+
+    async def drive() -> float:
+        transport = httpx.ASGITransport(app=backend_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for _ in range(20):
+                await client.post("/api/recommend", json={"query": "running shoes"})
+            start = time.perf_counter()
+            for _ in range(requests):
+                await client.post("/api/recommend", json={"query": "running shoes"})
+            return time.perf_counter() - start
+
+    elapsed = asyncio.run(drive())
+    drain_start = time.perf_counter()
+    shutdown_logging()
+    logging.shutdown()
+    drain = time.perf_counter() - drain_start
+    return {"mode": mode, "perRequestUs": elapsed / requests * 1e6, "drainMs": drain * 1000,
+            "logBytes": os.path.getsize(log_file) if os.path.exists(log_file) else 0}
+
+
+def main():
+    """Run each mode in a subprocess and print the comparison table."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000, help="Timed requests per run")
+    parser.add_argument("--rounds", type=int, default=5, help="Runs per mode (the median is reported)")
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--log-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.requests, args.log_file)))
+        return 0
+
+    runs = {mode: [] for mode in args.modes}
+    with tempfile.TemporaryDirectory() as tmp:
+        # Interleave the modes so background noise affects them equally
+        for round_number in range(args.rounds):
+            for mode in args.modes:
+                log_file = os.path.join(tmp, f"{mode}-{round_number}.log")
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", mode, "--requests", str(args.requests),
+                     "--log-file", log_file],
+                    capture_output=True, text=True, check=True
+                )
+                runs[mode].append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    results = []
+    for mode, mode_runs in runs.items():
+        results.append({
+            "mode": mode,
+            "perRequestUs": statistics.median(run["perRequestUs"] for run in mode_runs),
+            "drainMs": statistics.median(run["drainMs"] for run in mode_runs),
+            "logBytes": statistics.median(run["logBytes"] for run in mode_runs),
+        })
+
+    baseline = next((r["perRequestUs"] for r in results if r["mode"] == "off"), None)
+    print(f"{args.requests} /api/recommend requests x {args.rounds} rounds per mode (mocked Ollama, in-process ASGI)\n")
+    print(f"{'mode':<22} {'us/request':>11} {'overhead':>9} {'drain ms':>9} {'log KB':>9}")
+    for result in results:
+        overhead = (f"{(result['perRequestUs'] / baseline - 1) * 100:>8.1f}%" if baseline else f"{'-':>9}")
+        print(f"{result['mode']:<22} {result['perRequestUs']:>11.1f} {overhead} "
+              f"{result['drainMs']:>9.1f} {result['logBytes'] / 1024:>9.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark of the faceted /api/products search.
+Builds the search indexes for synthetic catalogs and times typical queries (first page,
+facets and total included) directly against ProductSearchIndex, without HTTP overhead.
+
+Usage: python benchmarks/bench_product_search.py [--sizes 100000 1000000] [--repeat 200]
+"""
+
+import sys
+import time
+import argparse
+import statistics
+
+from catalog_fixtures import iter_catalog
+
+QUERIES = {
+    "all": {},
+    "category": {"categories": ["electronics"]},
+    "category+tag": {"categories": ["electronics"], "tags": ["wireless"]},
+    "two tags": {"tags": ["outdoor", "travel"]},
+    "price range": {"min_price": 50, "max_price": 120},
+    "combined": {"categories": ["clothing", "footwear"], "tags": ["sports"], "min_price": 20, "max_price": 200},
+    "sparse": {"categories": ["books"], "types": ["fiction"], "tags": ["reading", "music"], "max_price": 40},
+    "sort price": {"categories": ["home"], "sort": "-price"},
+    "sort name": {"tags": ["casual"], "sort": "name"},
+}
+
+
+def time_query(index, query: dict, repeat: int) -> dict:
+    """Time the first page of a query and a page reached through its cursor."""
+    result = index.search(**query)
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        index.search(**query)
+        samples.append((time.perf_counter() - started) * 1e6)
+    cursor_samples = []
+    if result["nextCursor"]:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            index.search(cursor=result["nextCursor"], **query)
+            cursor_samples.append((time.perf_counter() - started) * 1e6)
+    return {
+        "total": result["total"],
+        "p50": statistics.median(samples),
+        "p95": sorted(samples)[int(len(samples) * 0.95) - 1],
+        "cursor": statistics.median(cursor_samples) if cursor_samples else None,
+    }
+
+
+def main():
+    """Build the indexes for each size and print per-query latencies."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100_000, 1_000_000], help="Catalog sizes")
+    parser.add_argument("--repeat", type=int, default=200, help="Timed runs per query")
+    args = parser.parse_args()
+
+    from catalog import Catalog
+    from product_search import ProductSearchIndex
+
+    print(f"{'products':>9} {'query':<13} {'matches':>8} {'p50 us':>8} {'p95 us':>8} {'page 2 us':>10}")
+    for size in args.sizes:
+        catalog = Catalog(iter_catalog(size))
+        started = time.perf_counter()
+        index = ProductSearchIndex(catalog.products)
+        build_seconds = time.perf_counter() - started
+        for name, query in QUERIES.items():
+            r = time_query(index, query, args.repeat)
+            cursor = f"{r['cursor']:>10.0f}" if r["cursor"] is not None else f"{'-':>10}"
+            print(f"{size:>9} {name:<13} {r['total']:>8} {r['p50']:>8.0f} {r['p95']:>8.0f} {cursor}")
+        index_mb = sum(array.nbytes for array in index.snapshot_arrays().values()) / 2**20
+        print(f"{size:>9} index build {build_seconds:.1f} s, {index_mb:.1f} MB\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Prefill benchmark of the prompt layouts against a prefix-caching Ollama stand-in.
+Sends a sequence of recommendation and image-match prompts to the fake Ollama server
+(in process, with simulated prompt evaluation and prefix caching) twice: in the legacy
+layout, where the query came before the catalog, and in the layout of backend/prompts.py,
+where the instructions and catalog form a stable prefix. Reports evaluated prompt tokens,
+simulated prefill time and request latency per layout.
+
+Usage: python benchmarks/bench_prompt_cache.py [--products 200] [--queries 20] [--prefill-rate 4000] [--prefix-cache 4]
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from typing import Callable, Dict, List
+
+import httpx
+
+from catalog_fixtures import iter_catalog
+from fake_ollama import FakeOllamaSettings, create_app
+
+QUERIES = ["comfortable running shoes", "wireless headphones for the gym", "a gift for a book lover",
+           "waterproof jacket for hiking", "smart watch with heart rate monitor", "a lamp for my desk",
+           "vintage leather wallet", "kitchen kettle", "yoga mat for travel", "noise cancelling earbuds"]
+DESCRIPTIONS = ["The image shows a pair of blue running shoes with a white sole.",
+                "The image shows black over-ear headphones on a desk.",
+                "The image shows a brown leather backpack with brass buckles."]
+
+
+def legacy_recommendation(query: str, catalog: str) -> List[Dict[str, str]]:
+    """The recommendation prompt as it was laid out before prompts.py: query, then catalog."""
+    from prompts import RECOMMENDATION_PROMPT
+    return [
+        {"role": "system", "content": RECOMMENDATION_PROMPT.instructions},
+        {"role": "user", "content": f'I\'m looking for: "{query}".\n\n'
+                                    f"Here is our EXACT product catalog with IDs, names, and details:\n{catalog}\n\n"
+                                    "Based on my request, recommend ONLY products that are HIGHLY RELEVANT ..."},
+    ]
+
+
+def legacy_image_match(description: str, catalog: str) -> List[Dict[str, str]]:
+    """The image-match prompt as it was laid out before prompts.py: description, then catalog."""
+    return [
+        {"role": "system", "content": "You are Pocket AI, a product matching specialist for an e-commerce platform."},
+        {"role": "user", "content": f'Based on this description of an image: "{description}"\n\n'
+                                    f"Here are the available products in our catalog:\n{catalog}\n\n"
+                                    "Find exactly 3 products from our catalog that best match ..."},
+    ]
+
+
+def stable_recommendation(query: str, catalog: str) -> List[Dict[str, str]]:
+    from prompts import RECOMMENDATION_PROMPT
+    return RECOMMENDATION_PROMPT.messages(catalog, query=query)
+
+
+def stable_image_match(description: str, catalog: str) -> List[Dict[str, str]]:
+    # The prefiltered shortlist varies per upload, so it goes after the description
+    from prompts import IMAGE_MATCH_PROMPT, IMAGE_MATCH_CANDIDATES
+    shortlist = IMAGE_MATCH_CANDIDATES.format(products="\n".join(
+        f"- Product ID: {product_id} - Candidate {product_id}" for product_id in (3, 7, 12)
+    ))
+    return IMAGE_MATCH_PROMPT.messages(catalog, description=description, candidates=shortlist)
+
+
+LAYOUTS: Dict[str, Dict[str, Callable]] = {
+    "legacy": {"recommend": legacy_recommendation, "image": legacy_image_match},
+    "stable prefix": {"recommend": stable_recommendation, "image": stable_image_match},
+}
+
+
+async def run_layout(layout: Dict[str, Callable], catalog: str, args: argparse.Namespace) -> dict:
+    """Send the request sequence in one layout to a fresh fake server and collect its prefill stats."""
+    settings = FakeOllamaSettings(latency=0.0, token_rate=0, tokens=20, parallel=1,
+                                  prefill_rate=args.prefill_rate, prefix_cache=args.prefix_cache)
+    transport = httpx.ASGITransport(app=create_app(settings))
+    evaluated, prefill, latencies = 0, 0.0, []
+    async with httpx.AsyncClient(transport=transport, base_url="http://fake-ollama") as client:
+        for i in range(args.queries):
+            # Mostly recommendations, with an image match every fourth request
+            if i % 4 == 3:
+                messages = layout["image"](DESCRIPTIONS[i % len(DESCRIPTIONS)], catalog)
+            else:
+                messages = layout["recommend"](QUERIES[i % len(QUERIES)], catalog)
+            started = time.perf_counter()
+            response = await client.post("/api/chat", json={"model": "bench", "messages": messages, "stream": False})
+            latencies.append(time.perf_counter() - started)
+            stats = response.json()
+            evaluated += stats["prompt_eval_count"]
+            prefill += stats["prompt_eval_duration"] / 1e9
+    return {"evaluated": evaluated, "prefill": prefill, "p50": statistics.median(latencies),
+            "mean": statistics.mean(latencies)}
+
+
+def main():
+    """Run the request sequence in each layout and print the prefill savings."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=200, help="Products in the catalog summary")
+    parser.add_argument("--queries", type=int, default=20, help="Requests per layout")
+    parser.add_argument("--prefill-rate", type=float, default=4000.0, help="Simulated prompt tokens per second")
+    parser.add_argument("--prefix-cache", type=int, default=4, help="Prompts the simulated server keeps cached")
+    args = parser.parse_args()
+
+    from catalog import Catalog
+    catalog = Catalog(iter_catalog(args.products)).summary
+    print(f"catalog summary: {args.products} products, ~{len(catalog) // 4} tokens; "
+          f"{args.queries} requests at {args.prefill_rate:.0f} prompt tokens/s, {args.prefix_cache} cached prompt(s)\n")
+    print(f"{'layout':<14} {'evaluated tokens':>17} {'prefill s':>10} {'p50 ms':>8} {'mean ms':>8}")
+    results = {}
+    for name, layout in LAYOUTS.items():
+        results[name] = r = asyncio.run(run_layout(layout, catalog, args))
+        print(f"{name:<14} {r['evaluated']:>17} {r['prefill']:>10.2f} {r['p50'] * 1000:>8.0f} {r['mean'] * 1000:>8.0f}")
+    legacy, stable = results["legacy"], results["stable prefix"]
+    print(f"\nprefill time saved: {1 - stable['prefill'] / legacy['prefill']:.0%}, "
+          f"mean latency saved: {1 - stable['mean'] / legacy['mean']:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Lookup benchmark of the semantic response cache.
+Fills SemanticCache instances with random unit-length embeddings and times the exact
+lookup, the vectorized nearest-neighbour search and inserts into a full cache (which
+evicts), reporting the memory held by the embedding matrix.
+
+Usage: python benchmarks/bench_semantic_cache.py [--entries 1024 2048 8192 32768] [--dim 768]
+"""
+
+import sys
+import time
+import argparse
+import statistics
+
+import numpy as np
+
+from catalog_fixtures import BACKEND_DIR  # noqa: F401 (puts the backend on sys.path)
+
+
+def unit_vectors(count: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    vectors = rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def time_us(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(samples)
+
+
+def main():
+    """Fill caches of each size and print lookup and insert latencies."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", nargs="+", type=int, default=[1024, 2048, 8192, 32768], help="Cache sizes")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension (nomic-embed-text: 768)")
+    parser.add_argument("--repeat", type=int, default=200, help="Timed runs per operation")
+    args = parser.parse_args()
+
+    from semantic_cache import SemanticCache
+
+    rng = np.random.default_rng(42)
+    print(f"{'entries':>8} {'exact us':>9} {'nearest us':>11} {'insert us':>10} {'matrix MB':>10}")
+    for size in args.entries:
+        cache = SemanticCache("bench", max_entries=size, threshold=0.9, ttl=0)
+        vectors = unit_vectors(size, args.dim, rng)
+        for i, vector in enumerate(vectors):
+            cache.put(f"query {i}", vector, f"response {i}", 1)
+        probe = unit_vectors(1, args.dim, rng)[0]
+        exact = time_us(lambda: cache.get(f"query {size // 2}", 1), args.repeat)
+        nearest = time_us(lambda: cache.nearest(probe, 1), args.repeat)
+        extra = unit_vectors(args.repeat, args.dim, rng)
+        counter = iter(range(args.repeat))
+        insert = time_us(lambda: cache.put(f"new {next(counter)}", extra[0], "new", 1), args.repeat)
+        print(f"{size:>8} {exact:>9.1f} {nearest:>11.0f} {insert:>10.0f} {cache.nbytes / 2**20:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Synthetic catalog generation for the Pocket AI benchmarks.
+Builds product lists shaped like backend/products.py at arbitrary sizes.
+"""
+
+import os
+import sys
+import random
+from typing import Iterator, List, Dict, Any
+
+# Make the backend modules importable from the benchmark scripts
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT_DIR, "backend")
+for path in (ROOT_DIR, BACKEND_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+CATEGORIES = {
+    "clothing": ["t-shirt", "shirt", "jacket", "pants", "dress"],
+    "electronics": ["audio", "watch", "camera", "computer", "television"],
+    "accessories": ["bag", "wallet", "belt", "sunglasses"],
+    "footwear": ["shoes", "boots", "sandals"],
+    "fitness": ["equipment", "apparel", "nutrition"],
+    "books": ["fiction", "non-fiction", "education"],
+    "home": ["kitchen", "decor", "furniture"],
+}
+ADJECTIVES = ["Wireless", "Premium", "Classic", "Smart", "Lightweight", "Waterproof", "Compact",
+              "Vintage", "Ergonomic", "Portable", "Organic", "Deluxe", "Ultra", "Eco"]
+NOUNS = ["Headphones", "Runner", "Backpack", "Watch", "Speaker", "Jacket", "Mat", "Camera",
+         "Shirt", "Boots", "Lamp", "Novel", "Kettle", "Tracker", "Bottle", "Chair"]
+TAGS = ["sports", "running", "gym", "casual", "formal", "wireless", "audio", "smart", "travel",
+        "outdoor", "kitchen", "reading", "fitness", "cotton", "leather", "gaming", "music", "office"]
+
+
+def iter_catalog(size: int, seed: int = 42) -> Iterator[Dict[str, Any]]:
+    """
+    Generate synthetic products with unique names one at a time.
+
+    Args:
+        size: Number of products to generate
+        seed: Random seed for reproducible catalogs
+
+    Yields:
+        Product dictionaries in the backend/products.py format
+    """
+    rng = random.Random(seed)
+    categories = list(CATEGORIES)
+    for product_id in range(1, size + 1):
+        category = rng.choice(categories)
+        product_type = rng.choice(CATEGORIES[category])
+        name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} Model {product_id}"
+        yield {
+            "id": product_id,
+            "name": name,
+            "category": category,
+            "type": product_type,
+            "tags": rng.sample(TAGS, rng.randint(2, 4)),
+            "price": round(rng.uniform(5, 1500), 2),
+            "image": f"product-{product_id}.jpg",
+        }
+
+
+def make_catalog(size: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """
+    Generate a synthetic product catalog with unique names.
+
+    Args:
+        size: Number of products to generate
+        seed: Random seed for reproducible catalogs
+
+    Returns:
+        A list of product dictionaries in the backend/products.py format
+    """
+    return list(iter_catalog(size, seed))
+
+
+def make_recommendation_text(catalog: List[Dict[str, Any]], count: int = 3, seed: int = 7,
+                             with_ids: bool = True) -> str:
+    """
+    Generate an AI-style markdown recommendation referencing catalog products.
+
+    Args:
+        catalog: The catalog to pick products from
+        count: Number of products to mention
+        seed: Random seed for reproducible text
+        with_ids: Whether to include "Product ID:" lines (otherwise only names)
+
+    Returns:
+        Recommendation text in the layout requested by RecommendationGenerator
+    """
+    rng = random.Random(seed)
+    sections = []
+    for product in rng.sample(catalog, count):
+        section = (
+            f"## {product['name']} (${product['price']})\n\n"
+            f"### Perfect Match Because:\n"
+            f"- [Relevance Score: {rng.randint(60, 99)}/100] - It closely matches the request\n"
+            f"- It is a {product['type']} in our {product['category']} range\n"
+            f"- Customers love it for {', '.join(product['tags'])}\n"
+            f"- It offers excellent value for the price\n"
+        )
+        if with_ids:
+            section += f"\nProduct ID: {product['id']}\n"
+        sections.append(section)
+    return "Here are my top picks for you!\n\n" + "\n".join(sections)
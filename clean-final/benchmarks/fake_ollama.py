@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Stand-in Ollama server for the Pocket AI benchmarks.
+Serves /api/chat, /api/generate, /api/embeddings, /api/embed, /api/ps and /api/tags
+with configurable latency, token rate and parallelism, so the backend can be
+load tested without a GPU or real models. Optionally simulates prompt evaluation time
+and Ollama's prompt caching: only the part of a prompt after the longest prefix shared
+with a recently evaluated prompt is "evaluated" at --prefill-rate tokens per second.
+A fraction of generations (--stall-rate) can stall for --stall-time extra seconds to
+produce a latency tail.
+
+Usage: python benchmarks/fake_ollama.py [--port 11435] [--latency 0.05] [--token-rate 200]
+                                        [--prefill-rate 500 --prefix-cache 4]
+                                        [--stall-rate 0.05 --stall-time 2]
+"""
+
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import functools
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+from catalog_fixtures import BACKEND_DIR  # noqa: F401 (puts the backend on sys.path)
+from products import products
+
+FILLER_WORDS = ("this", "product", "is", "a", "great", "choice", "because", "it", "offers",
+                "excellent", "quality", "and", "comfort", "for", "everyday", "use")
+IMAGE_DESCRIPTION = ("The image shows a pair of lightweight running shoes in blue and white mesh "
+                     "with a cushioned rubber sole. They belong to the footwear category and are "
+                     "designed for sports, running and gym workouts.")
+
+
+class FakeOllamaSettings:
+    """Timing behaviour of the fake server."""
+
+    def __init__(self, latency: float = 0.05, token_rate: float = 200.0, tokens: int = 60,
+                 parallel: int = 4, load_time: float = 0.0, embedding_dim: int = 384, seed: int = 42,
+                 prefill_rate: float = 0.0, prefix_cache: int = 0, stall_rate: float = 0.0,
+                 stall_time: float = 0.0):
+        """
+        Args:
+            latency: Seconds before the first token (prompt evaluation time)
+            token_rate: Generated tokens per second (0 generates instantly)
+            tokens: Completion tokens per response
+            parallel: Requests processed at once; the rest queue like OLLAMA_NUM_PARALLEL
+            load_time: Seconds to "load" a model the first time it is used
+            embedding_dim: Length of the returned embedding vectors
+            seed: Seed for the product choices in responses
+            prefill_rate: Prompt tokens evaluated per second (0 evaluates prompts instantly)
+            prefix_cache: Recently evaluated prompts whose prefixes are reused (0 disables caching)
+            stall_rate: Fraction of generations that stall before the first token (tail latency)
+            stall_time: Extra seconds a stalled generation waits
+        """
+        self.latency = latency
+        self.token_rate = token_rate
+        self.tokens = tokens
+        self.parallel = parallel
+        self.load_time = load_time
+        self.embedding_dim = embedding_dim
+        self.seed = seed
+        self.prefill_rate = prefill_rate
+        self.prefix_cache = prefix_cache
+        self.stall_rate = stall_rate
+        self.stall_time = stall_time
+
+
+def _token_delay(settings: FakeOllamaSettings) -> float:
+    return 1.0 / settings.token_rate if settings.token_rate > 0 else 0.0
+
+
+def _prompt_tokens(text: str) -> int:
+    # Roughly four characters per token
+    return max(1, len(text) // 4)
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    """Length of the longest common prefix, by binary search over slice comparisons."""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class PromptCache:
+    """The last few evaluated prompts; a new prompt reuses its longest shared prefix with one of them."""
+
+    def __init__(self, size: int):
+        self.prompts: deque = deque(maxlen=size)
+
+    def evaluate(self, prompt: str) -> int:
+        """Record a prompt and return the number of its characters already evaluated."""
+        if self.prompts.maxlen == 0:
+            return 0
+        cached = max((_common_prefix_length(prompt, seen) for seen in self.prompts), default=0)
+        self.prompts.append(prompt)
+        return cached
+
+
+def _pad(words: List[str], count: int, rng: random.Random) -> List[str]:
+    """Pad a token list with filler words up to the configured completion length."""
+    while len(words) < count:
+        words.append(rng.choice(FILLER_WORDS))
+    return words
+
+
+def recommendation_tokens(settings: FakeOllamaSettings, rng: random.Random) -> List[str]:
+    """Markdown recommendation text with product IDs and relevance scores, split into tokens."""
+    tokens: List[str] = []
+    for product in rng.sample(products, min(3, len(products))):
+        section = (f"## {product['name']} (${product['price']})\n"
+                   f"Relevance Score: {rng.randint(70, 98)}/100\n"
+                   f"Product ID: {product['id']}\n")
+        tokens.extend(word + " " for word in section.split(" "))
+    filler = _pad([], max(0, settings.tokens - len(tokens)), rng)
+    return tokens + [word + " " for word in filler]
+
+
+def structured_tokens(rng: random.Random) -> List[str]:
+    """Schema-conforming JSON recommendations, split into tokens."""
+    payload = {"recommendations": [
+        {"id": product["id"], "score": rng.randint(70, 98), "reason": f"Matches the request ({product['type']})"}
+        for product in rng.sample(products, min(3, len(products)))
+    ]}
+    text = json.dumps(payload)
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+def description_tokens(settings: FakeOllamaSettings, rng: random.Random) -> List[str]:
+    words = IMAGE_DESCRIPTION.split(" ")
+    return [word + " " for word in _pad(words, settings.tokens, rng)]
+
+
+@functools.lru_cache(maxsize=16384)
+def _feature_vector(feature: str, dim: int) -> Tuple[float, ...]:
+    rng = random.Random(hashlib.sha256(feature.encode("utf-8")).digest())
+    return tuple(rng.gauss(0.0, 1.0) for _ in range(dim))
+
+
+def embedding(text: str, dim: int) -> List[float]:
+    """
+    Deterministic pseudo-embedding: the sum of random vectors of the text's words and
+    character trigrams, so texts sharing words ("men's running shoes", "running shoes
+    for men") get similar vectors like with a real embedding model.
+    """
+    words = text.lower().split()
+    features = words + [word[i:i + 3] for word in words for i in range(max(1, len(word) - 2))]
+    vector = [0.0] * dim
+    for feature in features:
+        for i, value in enumerate(_feature_vector(feature, dim)):
+            vector[i] += value
+    norm = sum(value * value for value in vector) ** 0.5 or 1.0
+    return [value / norm for value in vector]
+
+
+def create_app(settings: FakeOllamaSettings) -> FastAPI:
+    """Create the fake Ollama app for the given settings."""
+    app = FastAPI(title="Fake Ollama")
+    slots = asyncio.Semaphore(settings.parallel)
+    loaded: Dict[str, float] = {}
+    rng = random.Random(settings.seed)
+    prompt_cache = PromptCache(settings.prefix_cache)
+    stalls = random.Random(settings.seed + 1)
+
+    async def load(model: str) -> float:
+        if model in loaded or settings.load_time <= 0:
+            loaded.setdefault(model, time.time())
+            return 0.0
+        await asyncio.sleep(settings.load_time)
+        loaded[model] = time.time()
+        return settings.load_time
+
+    def prefill(prompt: str) -> tuple:
+        """Seconds to evaluate a prompt and the number of tokens actually evaluated."""
+        cached = prompt_cache.evaluate(prompt)
+        evaluated = _prompt_tokens(prompt[cached:]) if cached < len(prompt) else 0
+        seconds = evaluated / settings.prefill_rate if settings.prefill_rate > 0 else 0.0
+        if settings.stall_rate > 0 and stalls.random() < settings.stall_rate:
+            seconds += settings.stall_time
+        return settings.latency + seconds, evaluated
+
+    def final_stats(prompt_eval: tuple, eval_count: int, started: float, load_duration: float) -> Dict[str, Any]:
+        return {
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": prompt_eval[1],
+            "prompt_eval_duration": int(prompt_eval[0] * 1e9),
+            "eval_count": eval_count,
+            "load_duration": int(load_duration * 1e9),
+            "total_duration": int((time.perf_counter() - started) * 1e9),
+        }
+
+    def choose_tokens(body: Dict[str, Any]) -> List[str]:
+        if body.get("images"):
+            return description_tokens(settings, rng)
+        if isinstance(body.get("format"), (dict, str)):
+            return structured_tokens(rng)
+        return recommendation_tokens(settings, rng)
+
+    async def run(model: str, prompt: str, tokens: List[str], stream: bool, wrap):
+        """Generate tokens under the parallelism limit, streamed or as one response."""
+        async def generate():
+            async with slots:
+                started = time.perf_counter()
+                load_duration = await load(model)
+                prompt_eval = prefill(prompt)
+                await asyncio.sleep(prompt_eval[0])
+                delay = _token_delay(settings)
+                for token in tokens:
+                    if delay:
+                        await asyncio.sleep(delay)
+                    yield token
+                yield final_stats(prompt_eval, len(tokens), started, load_duration)
+
+        if stream:
+            async def ndjson():
+                async for item in generate():
+                    if isinstance(item, dict):
+                        yield json.dumps({"model": model, **wrap(""), **item}) + "\n"
+                    else:
+                        yield json.dumps({"model": model, **wrap(item), "done": False}) + "\n"
+            return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+        text = []
+        stats: Dict[str, Any] = {}
+        async for item in generate():
+            if isinstance(item, dict):
+                stats = item
+            else:
+                text.append(item)
+        return JSONResponse({"model": model, **wrap("".join(text)), **stats})
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        model = body.get("model", "")
+        messages = body.get("messages", [])
+        # Rendered like a chat template, so the role markers take part in prefix matching
+        prompt = "".join(f"<|{message.get('role', 'user')}|>\n{message.get('content', '')}\n" for message in messages)
+        images = [image for message in messages for image in message.get("images", [])]
+        tokens = choose_tokens({**body, "images": images})
+        return await run(model, prompt, tokens, body.get("stream", True),
+                         lambda text: {"message": {"role": "assistant", "content": text}})
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        model = body.get("model", "")
+        prompt = body.get("prompt", "")
+        if not prompt and not body.get("images"):
+            # A prompt-less request only loads the model (used for warm-up and keep-alive)
+            load_duration = await load(model)
+            return JSONResponse({"model": model, "response": "", "done": True,
+                                 "load_duration": int(load_duration * 1e9)})
+        return await run(model, prompt, choose_tokens(body), body.get("stream", True),
+                         lambda text: {"response": text})
+
+    @app.post("/api/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        async with slots:
+            await asyncio.sleep(settings.latency)
+            return {"embedding": embedding(body.get("prompt", ""), settings.embedding_dim)}
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        inputs = body.get("input", "")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        async with slots:
+            await asyncio.sleep(settings.latency)
+            return {"model": body.get("model", ""),
+                    "embeddings": [embedding(text, settings.embedding_dim) for text in inputs],
+                    "prompt_eval_count": sum(_prompt_tokens(text) for text in inputs)}
+
+    @app.get("/api/ps")
+    async def ps():
+        return {"models": [{"name": f"{model}:latest", "model": f"{model}:latest", "size_vram": 0,
+                            "expires_at": None} for model in loaded]}
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": f"{model}:latest"} for model in loaded]}
+
+    return app
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds before the first token")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="Tokens per second (0 = instant)")
+    parser.add_argument("--tokens", type=int, default=60, help="Completion tokens per response")
+    parser.add_argument("--parallel", type=int, default=4, help="Requests processed concurrently")
+    parser.add_argument("--load-time", type=float, default=0.0, help="Seconds to load a model on first use")
+    parser.add_argument("--embedding-dim", type=int, default=384)
+    parser.add_argument("--prefill-rate", type=float, default=0.0, help="Prompt tokens evaluated per second (0 = instant)")
+    parser.add_argument("--prefix-cache", type=int, default=0, help="Recent prompts whose prefixes are reused")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Fraction of generations that stall")
+    parser.add_argument("--stall-time", type=float, default=0.0, help="Extra seconds a stalled generation waits")
+    return parser.parse_args(argv)
+
+
+def main():
+    """Run the fake Ollama server."""
+    args = parse_args()
+    settings = FakeOllamaSettings(latency=args.latency, token_rate=args.token_rate, tokens=args.tokens,
+                                  parallel=args.parallel, load_time=args.load_time,
+                                  embedding_dim=args.embedding_dim, prefill_rate=args.prefill_rate,
+                                  prefix_cache=args.prefix_cache, stall_rate=args.stall_rate,
+                                  stall_time=args.stall_time)
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
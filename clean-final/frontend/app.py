@@ -4,19 +4,36 @@ This module provides a web UI using FastAPI and Jinja2 templates.
 """
 
 import os
+import sys
+import hashlib
 import logging
 import httpx
 from typing import Dict, Any, Optional
 from fastapi import FastAPI, Request, Form, UploadFile, File, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 from pathlib import Path
 
+# Make the shared modules in the project root and the backend catalog importable
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+backend_dir = os.path.join(parent_dir, "backend")
+if backend_dir not in sys.path:
+    sys.path.append(backend_dir)
+
+from tracing import TracingMiddleware, span, inject_headers
+from log_config import configure_logging
+from products import catalog_store
+from catalog import Catalog
+from compression import CachedPage, CompressedStaticFiles, MIN_COMPRESS_SIZE
+
 # Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging("frontend")
 logger = logging.getLogger(__name__)
 
 # Create the FastAPI app
@@ -31,23 +48,76 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Trace each request; the trace ID is forwarded to the backend so both services share one trace
+app.add_middleware(TracingMiddleware, service="frontend")
+
+# Compress the remaining dynamic responses; static files and cached pages arrive already encoded
+app.add_middleware(GZipMiddleware, minimum_size=MIN_COMPRESS_SIZE)
+
 # Get the current directory
 current_dir = Path(__file__).parent
 static_dir = current_dir / "static"
 templates_dir = current_dir / "templates"
 
 # Mount static files
-app.mount("/static", StaticFiles(directory=static_dir), name="static")
+app.mount("/static", CompressedStaticFiles(directory=static_dir), name="static")
 
 # Setup templates
 templates = Jinja2Templates(directory=templates_dir)
 
 # Backend API URL
 BACKEND_API_URL = os.getenv("BACKEND_API_URL", "http://localhost:4000/api")
+# Chat WebSocket the browser connects to (the backend's /api/chat/ws, or a reverse proxy in front of it);
+# set to "off" to send chat messages through /send-message only
+CHAT_WS_URL = os.getenv("CHAT_WS_URL", BACKEND_API_URL.replace("http", "ws", 1) + "/chat/ws")
 
 # API client
 client = httpx.AsyncClient(timeout=30.0)
 
+# Rendered /products page of the current catalog version, keyed by version
+products_page_cache: Dict[int, CachedPage] = {}
+
+
+def backend_headers(request: Request, session_id: str = "") -> Dict[str, str]:
+    """
+    Headers for a backend call made on behalf of a browser request.
+
+    The backend rate-limits by session and client address, so both are forwarded
+    along with the trace context.
+    """
+    peer = request.client.host if request.client else "unknown"
+    forwarded_for = request.headers.get("x-forwarded-for")
+    headers = {"X-Forwarded-For": f"{forwarded_for}, {peer}" if forwarded_for else peer}
+    if session_id:
+        headers["X-Session-Id"] = session_id
+    return inject_headers(headers)
+
+
+def rate_limited(response: httpx.Response) -> Dict[str, Any]:
+    """The error returned to the page when the backend refused a request with 429."""
+    retry_after = response.headers.get("retry-after", "a few")
+    return {"success": False, "error": f"Too many requests, please try again in {retry_after} seconds.",
+            "retryAfter": int(retry_after) if retry_after.isdigit() else None}
+
+
+@app.on_event("startup")
+async def start_catalog_reload():
+    """Pick up catalog file changes without a restart."""
+    catalog_store.on_reload(clear_products_page_cache)
+    catalog_store.start(build_indexes=False)
+
+
+def clear_products_page_cache(catalog: Catalog):
+    """Drop pages rendered from previous catalog versions."""
+    products_page_cache.clear()
+    logger.info("Catalog v%s loaded, cleared the cached products page", catalog.version)
+
+
+@app.on_event("shutdown")
+async def stop_catalog_reload():
+    """Stop watching the catalog file."""
+    catalog_store.stop()
+
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
@@ -63,7 +133,8 @@ async def chat_page(request: Request, session_id: Optional[str] = None):
     """Render the chat page."""
     return templates.TemplateResponse(
         "chat.html", 
-        {"request": request, "session_id": session_id or ""}
+        {"request": request, "session_id": session_id or "",
+         "chat_ws_url": "" if CHAT_WS_URL.lower() == "off" else CHAT_WS_URL}
     )
 
 
@@ -71,18 +142,22 @@ async def chat_page(request: Request, session_id: Optional[str] = None):
 async def send_message(request: Request, session_id: str = Form(""), message: str = Form(...)):
     """Send a message to the AI assistant and get a response."""
     try:
-        response = await client.post(
-            f"{BACKEND_API_URL}/chat",
-            json={"sessionId": session_id if session_id else None, "message": message}
-        )
+        with span("backend.chat"):
+            response = await client.post(
+                f"{BACKEND_API_URL}/chat",
+                json={"sessionId": session_id if session_id else None, "message": message},
+                headers=backend_headers(request, session_id)
+            )
         
+        if response.status_code == 429:
+            return rate_limited(response)
         if response.status_code != 200:
             return {"success": False, "error": f"API Error: {response.status_code}"}
             
         result = response.json()
         return {"success": True, "data": result}
     except Exception as e:
-        logger.error(f"Chat error: {str(e)}")
+        logger.error("Chat error: %s", e)
         return {"success": False, "error": str(e)}
 
 
@@ -99,18 +174,22 @@ async def recommend_page(request: Request, session_id: Optional[str] = None):
 async def get_recommendations(request: Request, session_id: str = Form(""), query: str = Form(...)):
     """Get product recommendations based on a query."""
     try:
-        response = await client.post(
-            f"{BACKEND_API_URL}/recommend",
-            json={"sessionId": session_id if session_id else None, "query": query}
-        )
+        with span("backend.recommend"):
+            response = await client.post(
+                f"{BACKEND_API_URL}/recommend",
+                json={"sessionId": session_id if session_id else None, "query": query},
+                headers=backend_headers(request, session_id)
+            )
         
+        if response.status_code == 429:
+            return rate_limited(response)
         if response.status_code != 200:
             return {"success": False, "error": f"API Error: {response.status_code}"}
             
         result = response.json()
         return {"success": True, "data": result}
     except Exception as e:
-        logger.error(f"Recommendation error: {str(e)}")
+        logger.error("Recommendation error: %s", e)
         return {"success": False, "error": str(e)}
 
 
@@ -123,37 +202,40 @@ async def product_matcher_page(request: Request, session_id: Optional[str] = Non
     )
 
 
+def catalog_last_modified(catalog: Catalog) -> float:
+    """When the catalog content last changed: its source file's mtime, else when it was loaded."""
+    try:
+        return os.path.getmtime(catalog.source)
+    except (OSError, TypeError):
+        return catalog.loaded_at
+
+
+def render_products_page(request: Request, catalog: Catalog) -> CachedPage:
+    """Render the catalog page for one catalog snapshot."""
+    # Products are already grouped by category once per catalog snapshot
+    body = templates.get_template("products.html").render({
+        "request": request,
+        "products_by_category": catalog.by_category,
+        "categories": sorted(catalog.by_category),
+    })
+    etag = '"%s"' % hashlib.sha1(body.encode("utf-8")).hexdigest()[:20]
+    return CachedPage(body, etag, catalog_last_modified(catalog))
+
+
 @app.get("/products", response_class=HTMLResponse)
 async def products_page(request: Request):
-    """Render the products catalog page."""
+    """Render the products catalog page (rendered once per catalog version)."""
     try:
-        # Import the products module from backend
-        sys_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        import sys
-        sys.path.append(sys_path)
-        from backend.products import products
-        
-        # Organize products by category
-        products_by_category = {}
-        for product in products:
-            category = product["category"]
-            if category not in products_by_category:
-                products_by_category[category] = []
-            products_by_category[category].append(product)
-        
-        # Sort categories alphabetically
-        sorted_categories = sorted(products_by_category.keys())
-        
-        return templates.TemplateResponse(
-            "products.html",
-            {
-                "request": request,
-                "products_by_category": products_by_category,
-                "categories": sorted_categories
-            }
-        )
+        catalog = catalog_store.current
+        # Static URLs in the page are relative, so the page does not depend on the Host header
+        page = products_page_cache.get(catalog.version)
+        if page is None:
+            page = await run_in_threadpool(render_products_page, request, catalog)
+            if catalog is catalog_store.current:
+                products_page_cache[catalog.version] = page
+        return page.response(request.headers)
     except Exception as e:
-        logger.error(f"Products page error: {str(e)}")
+        logger.error("Products page error: %s", e)
         import traceback
         logger.error(traceback.format_exc())
         return HTMLResponse(
@@ -195,15 +277,19 @@ async def match_product(
         files = {"image": (image.filename, file_contents, image.content_type)}
         
         # Send request to backend
-        logger.info(f"Sending image to backend for product matching: {image.filename}")
+        logger.debug("Sending image to backend for product matching: %s", image.filename)
         async with httpx.AsyncClient(timeout=60.0) as client:
             try:
-                response = await client.post(
-                    f"{BACKEND_API_URL}/product-match",
-                    data=form_data,
-                    files=files
-                )
+                with span("backend.product_match"):
+                    response = await client.post(
+                        f"{BACKEND_API_URL}/product-match",
+                        data=form_data,
+                        files=files,
+                        headers=backend_headers(request, session_id)
+                    )
                 
+                if response.status_code == 429:
+                    return rate_limited(response)
                 if response.status_code != 200:
                     error_detail = "Unknown error"
                     try:
@@ -212,17 +298,17 @@ async def match_product(
                             error_detail = error_data["detail"]
                     except:
                         pass
-                    logger.error(f"Backend API error: {response.status_code} - {error_detail}")
+                    logger.error("Backend API error: %s - %s", response.status_code, error_detail)
                     return {"success": False, "error": f"API Error ({response.status_code}): {error_detail}"}
                     
                 result = response.json()
-                logger.info(f"Received product match results with {len(result.get('products', []))} products")
+                logger.debug("Received product match results with %s products", len(result.get('products', [])))
                 return {"success": True, "data": result}
             except httpx.TimeoutException:
                 logger.error("Request to backend timed out")
                 return {"success": False, "error": "The request timed out. Image analysis may take longer than expected."}
     except Exception as e:
-        logger.error(f"Product matcher error: {str(e)}")
+        logger.error("Product matcher error: %s", e)
         import traceback
         logger.error(traceback.format_exc())
         return {"success": False, "error": f"Error processing image: {str(e)}"}
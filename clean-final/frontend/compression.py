@@ -0,0 +1,178 @@
+"""
+Response compression for the Pocket AI frontend.
+Static files and cached pages are compressed once and served from memory with brotli
+(when the optional brotli package is installed) or gzip, whichever the client accepts.
+"""
+
+import os
+import gzip
+import logging
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Bodies smaller than this are sent as they are; compressing them does not pay off
+MIN_COMPRESS_SIZE = 500
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+
+def supported_encodings() -> Tuple[str, ...]:
+    """Content encodings this process can produce, preferred first."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick the preferred encoding the client accepts.
+
+    Args:
+        accept_encoding: The Accept-Encoding request header
+
+    Returns:
+        "br", "gzip", or None to send the body uncompressed
+    """
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        key, _, value = params.strip().partition("=")
+        try:
+            quality = float(value) if key.strip() == "q" else 1.0
+        except ValueError:
+            quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip())
+    for encoding in supported_encodings():
+        if encoding in accepted or "*" in accepted:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compress a body with "br" or "gzip" at the highest level (bodies are compressed once and cached)."""
+    if encoding == "br":
+        return brotli.compress(body, quality=11)
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+def is_compressible(media_type: Optional[str]) -> bool:
+    """Whether responses of a media type benefit from compression."""
+    return bool(media_type) and media_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """The ETag of an encoded variant; each representation needs its own strong validator."""
+    return f'{etag[:-1]}-{encoding}"' if etag.endswith('"') else f"{etag}-{encoding}"
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header matches an ETag (weak comparison)."""
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or etag in (tag[2:] for tag in tags if tag.startswith("W/"))
+
+
+class CompressedStaticFiles(StaticFiles):
+    """StaticFiles serving compressible files pre-compressed from an in-memory cache."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (path, encoding) -> (mtime_ns, size, compressed body)
+        self._compressed: Dict[Tuple[str, str], Tuple[int, int, bytes]] = {}
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if not isinstance(response, FileResponse) or status_code != 200 or stat_result.st_size < MIN_COMPRESS_SIZE:
+            return response
+        if not is_compressible(response.media_type):
+            return response
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+        if encoding is None:
+            response.headers["vary"] = "Accept-Encoding"
+            return response
+
+        headers = {key: value for key, value in response.headers.items() if key != "content-length"}
+        headers.update({"content-encoding": encoding, "vary": "Accept-Encoding",
+                        "etag": encoded_etag(response.headers["etag"], encoding)})
+        if etag_matches(request_headers.get("if-none-match", ""), headers["etag"]):
+            return Response(status_code=304, headers={key: value for key, value in headers.items()
+                                                      if key != "content-type"})
+        return Response(self._compressed_body(str(full_path), stat_result, encoding), headers=headers)
+
+    def _compressed_body(self, path: str, stat_result: os.stat_result, encoding: str) -> bytes:
+        cached = self._compressed.get((path, encoding))
+        if cached is None or cached[:2] != (stat_result.st_mtime_ns, stat_result.st_size):
+            with open(path, "rb") as static_file:
+                body = compress(static_file.read(), encoding)
+            cached = (stat_result.st_mtime_ns, stat_result.st_size, body)
+            self._compressed[(path, encoding)] = cached
+            logger.debug("Compressed %s with %s: %s -> %s bytes", path, encoding, stat_result.st_size, len(body))
+        return cached[2]
+
+
+class CachedPage:
+    """A rendered page kept in memory with its validators and compressed variants."""
+
+    def __init__(self, body: str, etag: str, last_modified: float, media_type: str = "text/html; charset=utf-8"):
+        """
+        Args:
+            body: The rendered page
+            etag: Strong ETag of the page, quoted
+            last_modified: Modification time of the page content (Unix time)
+            media_type: Content-Type of the page
+        """
+        self.body = body.encode("utf-8")
+        self.etag = etag
+        self.last_modified = formatdate(last_modified, usegmt=True)
+        self._last_modified_second = int(last_modified)
+        self.media_type = media_type
+        self._variants: Dict[str, bytes] = {}
+
+    def encoded(self, encoding: str) -> bytes:
+        """The body compressed with an encoding (compressed on first use)."""
+        if encoding not in self._variants:
+            self._variants[encoding] = compress(self.body, encoding)
+        return self._variants[encoding]
+
+    def is_not_modified(self, request_headers: Headers) -> bool:
+        """Whether the client's cached copy is current (If-None-Match, else If-Modified-Since)."""
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            return any(etag_matches(if_none_match, etag)
+                       for etag in [self.etag] + [encoded_etag(self.etag, name) for name in supported_encodings()])
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return self._last_modified_second <= int(parsedate_to_datetime(if_modified_since).timestamp())
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def response(self, request_headers: Headers) -> Response:
+        """A 304, or the page in the best encoding the client accepts."""
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+        if len(self.body) < MIN_COMPRESS_SIZE:
+            encoding = None
+        headers = {
+            "etag": encoded_etag(self.etag, encoding) if encoding else self.etag,
+            "last-modified": self.last_modified,
+            "cache-control": "no-cache",
+            "vary": "Accept-Encoding",
+        }
+        if self.is_not_modified(request_headers):
+            return Response(status_code=304, headers=headers)
+        if encoding is None:
+            return Response(self.body, media_type=self.media_type, headers=headers)
+        headers["content-encoding"] = encoding
+        return Response(self.encoded(encoding), media_type=self.media_type, headers=headers)
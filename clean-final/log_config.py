@@ -0,0 +1,210 @@
+"""
+Logging configuration for the Pocket AI e-commerce agent.
+Sets up structured JSON (or plain text) logging once per process. Records are handed
+to a background thread through a queue, so request handlers never wait on formatting
+or disk I/O. Large payloads go to sampled ".payload" loggers and are truncated lazily.
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from typing import Any, Dict, Optional
+
+from tracing import current_trace_id
+
+# Logging configuration
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # "json" or "text"
+LOG_FILE = os.getenv("LOG_FILE")  # Write logs to this file instead of stderr
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Fraction of records kept by sampled loggers (see get_sampled_logger), e.g. "payload=0.01,app.payload=0.1";
+# a key matches a full logger name or its last component
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "payload=0.01")
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
+# Chatty third-party loggers limited to warnings (httpx logs every request at INFO)
+LOG_QUIET_LOGGERS = os.getenv("LOG_QUIET_LOGGERS", "httpx,httpcore")
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["DroppingQueueHandler"] = None
+
+
+def _parse_rates(value: str) -> Dict[str, float]:
+    rates = {}
+    for item in value.split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+class Payload:
+    """A large value that is only converted (and truncated) when the record is formatted."""
+
+    __slots__ = ("value", "max_chars")
+
+    def __init__(self, value: Any, max_chars: int = LOG_PAYLOAD_MAX_CHARS):
+        self.value = value
+        self.max_chars = max_chars
+
+    def __str__(self) -> str:
+        text = str(self.value)
+        if len(text) > self.max_chars:
+            return f"{text[:self.max_chars]}... ({len(text) - self.max_chars} more chars)"
+        return text
+
+    __repr__ = __str__
+
+
+class SampledLogger(logging.LoggerAdapter):
+    """
+    Logger that keeps only a fraction of its records (warnings and errors are always kept).
+    The decision is made before the record is created, so dropped records cost almost nothing.
+    """
+
+    def __init__(self, logger: logging.Logger, rate: float):
+        super().__init__(logger, {})
+        self.rate = rate
+
+    def isEnabledFor(self, level: int) -> bool:
+        if not self.logger.isEnabledFor(level):
+            return False
+        return level >= logging.WARNING or self.rate >= 1.0 or random.random() < self.rate
+
+    def process(self, msg, kwargs):
+        return msg, kwargs
+
+
+def get_sampled_logger(name: str) -> logging.Logger:
+    """
+    Get a logger sampled at the rate configured for it in LOG_SAMPLE_RATES.
+
+    Args:
+        name: Logger name; the rate is looked up by full name, then by its last component
+
+    Returns:
+        A SampledLogger, or the plain logger when no rate is configured
+    """
+    rates = _parse_rates(LOG_SAMPLE_RATES)
+    rate = rates.get(name, rates.get(name.rsplit(".", 1)[-1]))
+    logger = logging.getLogger(name)
+    return logger if rate is None else SampledLogger(logger, rate)
+
+
+def get_payload_logger(name: str) -> logging.Logger:
+    """Get the sampled logger used for large payloads (prompts, model output) of a module."""
+    return get_sampled_logger(f"{name}.payload")
+
+
+class ContextFilter(logging.Filter):
+    """Attaches the active trace ID (read in the logging thread, not the listener)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id()
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that defers formatting to the listener thread and drops records
+    instead of blocking when the queue is full.
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue, max_size: int = LOG_QUEUE_SIZE):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The record stays in-process, so message arguments are formatted later by the listener
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # SimpleQueue is unbounded (and much cheaper than queue.Queue), so the bound is checked here
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "trace_id", None):
+            entry["trace_id"] = record.trace_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key != "trace_id":
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(service: str, level: str = LOG_LEVEL, fmt: str = LOG_FORMAT,
+                      log_file: Optional[str] = LOG_FILE) -> None:
+    """
+    Configure the root logger for this process. Later calls are ignored.
+
+    Args:
+        service: Service name included in each JSON record (e.g. "backend")
+        level: Minimum log level
+        fmt: "json" for structured records or "text" for the classic single-line format
+        log_file: Optional file to write to instead of stderr
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    output = logging.FileHandler(log_file, encoding="utf-8") if log_file else logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter(service) if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    _queue_handler = DroppingQueueHandler(queue.SimpleQueue())
+    _queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    for name in LOG_QUIET_LOGGERS.split(","):
+        if name.strip():
+            logging.getLogger(name.strip()).setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and remove the queue handler."""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener = None
+    _queue_handler = None
@@ -5,13 +5,17 @@ with explanations about how each product relates to the image description.
 """
 
 import os
+import re
 import sys
 import json
+import time
 import base64
+import argparse
 import requests
 import subprocess
 import logging
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Dict, Any, Iterator, Optional, Set, Tuple
 
 # Make sure the current directory is in the path
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -23,18 +27,25 @@ backend_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend
 if backend_path not in sys.path:
     sys.path.insert(0, backend_path)
 
-# Import products from backend/products.py
-try:
-    from backend.products import products, get_product_by_id, get_product_summary, get_random_products
-except ImportError:
-    # Fallback import if the first attempt fails
-    sys.path.append(os.path.join(os.path.dirname(__file__), "backend"))
-    from products import products, get_product_by_id, get_product_summary, get_random_products
+# Import products from backend/products.py (the same module the backend uses, so both share one catalog)
+from products import get_products, get_product_by_id, get_product_summary, get_random_products
+
+from metrics import instrument
+from tracing import span, traced
+from log_config import configure_logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("product_matcher")
 
+# Ollama configuration (same environment variables as the backend)
+OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434/api")
+OLLAMA_VISION_MODEL = os.getenv("OLLAMA_VISION_MODEL", "llava")
+
+# Images analyzed at once in batch mode (each worker has at most one Ollama call in flight)
+PRODUCT_MATCHER_WORKERS = int(os.getenv("PRODUCT_MATCHER_WORKERS", "4"))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp")
+PRODUCT_ID_PATTERN = re.compile(r"Product ID:\s*(\d+)")
+
 # Helper function to get product features from tags
 def get_product_features(product):
     """Extract features from product tags and other attributes."""
@@ -139,7 +150,7 @@ def get_enhanced_product_summary() -> str:
     """Generate a detailed summary of all products in the catalog with enhanced attributes."""
     summary_parts = []
     
-    for product in products:
+    for product in get_products():
         # Extract additional attributes
         features = get_product_features(product)
         colors = get_product_colors(product)
@@ -163,21 +174,24 @@ def get_enhanced_product_summary() -> str:
     
     return "\n\n".join(summary_parts)
 
-def analyze_image(image_path: str) -> Optional[str]:
+@instrument("product_matcher_analyze")
+@traced("product_matcher.analyze_image")
+def analyze_image(image_path: str, fallback: bool = True) -> Optional[str]:
     """
     Analyze an image using Ollama's vision model with multiple fallback methods.
     
     Args:
         image_path: Path to the image file
+        fallback: Return a generic description when every method fails (False returns None instead)
         
     Returns:
         Image description or None if analysis fails
     """
-    logger.info(f"Analyzing image: {image_path}")
+    logger.debug("Analyzing image: %s", image_path)
     
     # Verify the image exists
     if not os.path.exists(image_path):
-        logger.error(f"Image not found: {image_path}")
+        logger.error("Image not found: %s", image_path)
         return None
     
     # Create a detailed analysis prompt
@@ -193,80 +207,93 @@ def analyze_image(image_path: str) -> Optional[str]:
 Be specific and detailed in your analysis. Focus only on what you can actually see in the image."""
     
     # Method 1: Try Ollama CLI with -i flag (most reliable for image input)
-    try:
-        logger.info("Trying image analysis with Ollama CLI...")
-        import shlex
-        escaped_prompt = shlex.quote(analysis_prompt)
-        escaped_path = shlex.quote(image_path)
+    with span("analyze_image.cli", method="cli") as attempt:
+        try:
+            logger.debug("Trying image analysis with Ollama CLI...")
+            import shlex
+            escaped_prompt = shlex.quote(analysis_prompt)
+            escaped_path = shlex.quote(image_path)
         
-        cmd = f'ollama run llava -i {escaped_path} {escaped_prompt}'
+            cmd = f'ollama run {shlex.quote(OLLAMA_VISION_MODEL)} -i {escaped_path} {escaped_prompt}'
         
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=60
-        )
+            result = subprocess.run(
+                cmd,
+                shell=True,
+                capture_output=True,
+                text=True,
+                timeout=60
+            )
         
-        if result.returncode == 0 and result.stdout.strip() and "I cannot see any images" not in result.stdout:
-            logger.info("CLI image analysis succeeded!")
-            return result.stdout.strip()
-    except Exception as e:
-        logger.warning(f"CLI image analysis failed: {str(e)}")
+            if result.returncode == 0 and result.stdout.strip() and "I cannot see any images" not in result.stdout:
+                logger.debug("CLI image analysis succeeded!")
+                return result.stdout.strip()
+        except Exception as e:
+            logger.warning("CLI image analysis failed: %s", e)
+            attempt.error = str(e)
     
     # Method 2: Try with Ollama API using base64 encoding
-    try:
-        logger.info("Trying image analysis with Ollama API...")
-        # Read and encode the image
-        with open(image_path, "rb") as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode("utf-8")
+    with span("analyze_image.api", method="api") as attempt:
+        try:
+            logger.debug("Trying image analysis with Ollama API...")
+            # Read and encode the image
+            with open(image_path, "rb") as img_file:
+                img_base64 = base64.b64encode(img_file.read()).decode("utf-8")
         
-        # Call Ollama API
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json={
-                "model": "llava",
-                "prompt": analysis_prompt,
-                "images": [img_base64],
-                "stream": False
-            },
-            timeout=60
-        )
+            # Call Ollama API
+            response = requests.post(
+                f"{OLLAMA_API_URL}/generate",
+                json={
+                    "model": OLLAMA_VISION_MODEL,
+                    "prompt": analysis_prompt,
+                    "images": [img_base64],
+                    "stream": False
+                },
+                timeout=60
+            )
         
-        if response.status_code == 200:
-            analysis = response.json().get("response", "")
-            if analysis and "I cannot see any images" not in analysis:
-                logger.info("API image analysis succeeded!")
-                return analysis
-    except Exception as e:
-        logger.warning(f"API image analysis failed: {str(e)}")
+            if response.status_code == 200:
+                analysis = response.json().get("response", "")
+                if analysis and "I cannot see any images" not in analysis:
+                    logger.debug("API image analysis succeeded!")
+                    return analysis
+        except Exception as e:
+            logger.warning("API image analysis failed: %s", e)
+            attempt.error = str(e)
     
     # Method 3: Try with direct backend integration if available
-    try:
-        logger.info("Trying image analysis with backend integration...")
-        # Check if we can import the backend module
+    with span("analyze_image.backend_integration", method="backend_integration") as attempt:
         try:
-            from backend.ai_utils import ImageAnalyzer
+            logger.debug("Trying image analysis with backend integration...")
+            # Check if we can import the backend module
+            try:
+                from backend.ai_utils import (
+                    PRODUCT_ANALYSIS_PROMPT, analyze_image_with_ollama, is_usable_image_description
+                )
             
-            # Use the ImageAnalyzer directly
-            import asyncio
-            analysis = asyncio.run(ImageAnalyzer.analyze_product_image(image_path))
+                # Call the backend's analysis directly; ImageAnalyzer would hide a failure behind a generic text
+                import asyncio
+                analysis = asyncio.run(analyze_image_with_ollama(image_path, PRODUCT_ANALYSIS_PROMPT))
             
-            if analysis and "I cannot see any images" not in analysis:
-                logger.info("Backend integration image analysis succeeded!")
-                return analysis
-        except ImportError:
-            logger.warning("Backend integration not available")
-    except Exception as e:
-        logger.warning(f"Backend integration image analysis failed: {str(e)}")
+                if is_usable_image_description(analysis) and "I cannot see any images" not in analysis:
+                    logger.debug("Backend integration image analysis succeeded!")
+                    return analysis
+            except ImportError:
+                logger.warning("Backend integration not available")
+        except Exception as e:
+            logger.warning("Backend integration image analysis failed: %s", e)
+            attempt.error = str(e)
     
     # Method 4: Fallback to a generic description
+    if not fallback:
+        logger.warning("All image analysis methods failed for %s", image_path)
+        return None
     logger.warning("All image analysis methods failed, using fallback description.")
     return """This appears to be a product image, but I couldn't analyze it in detail. 
 The image might contain an item that could be in one of our popular categories like electronics, 
 clothing, home goods, or accessories."""
 
+@instrument("product_matcher_match")
+@traced("product_matcher.get_product_recommendations")
 def get_product_recommendations(image_description: str) -> Optional[str]:
     """
     Generate detailed product recommendation based on image description.
@@ -277,7 +304,7 @@ def get_product_recommendations(image_description: str) -> Optional[str]:
     Returns:
         Detailed product recommendation with explanation
     """
-    logger.info("Generating product recommendation...")
+    logger.debug("Generating product recommendation...")
     
     # Extract key terms and categories from the image description
     description_lower = image_description.lower()
@@ -306,7 +333,7 @@ def get_product_recommendations(image_description: str) -> Optional[str]:
     
     # Remove duplicates
     key_categories = list(set(key_categories))
-    logger.info(f"Detected categories: {key_categories}")
+    logger.debug("Detected categories: %s", key_categories)
     
     # Define a scoring function to rank products by relevance to the description
     def score_product(product):
@@ -376,13 +403,12 @@ def get_product_recommendations(image_description: str) -> Optional[str]:
         return score
     
     # Score all products and rank them
+    products = get_products()
     scored_products = [(product, score_product(product)) for product in products]
     scored_products.sort(key=lambda x: x[1], reverse=True)
     
     # Log scores for debugging
-    logger.info("Product scores:")
-    for product, score in scored_products[:3]:
-        logger.info(f"{product['name']}: {score}")
+    logger.debug("Top product scores: %s", [(product["name"], score) for product, score in scored_products[:3]])
     
     # Take only the best matching product
     best_product = scored_products[0][0]
@@ -514,19 +540,172 @@ This {product_category.capitalize()} product aligns with the image description b
     
     return recommendation
 
-def main():
-    """Main function to analyze an image and provide product recommendations."""
-    # Handle command-line arguments
-    if len(sys.argv) > 1:
-        image_path = sys.argv[1]
-    else:
-        # Use default test image
-        image_path = "test_image.jpg"
-        if not os.path.exists(image_path):
-            logger.error(f"No image specified and default {image_path} not found.")
-            print(f"Usage: python {os.path.basename(__file__)} [path_to_image]")
-            return 1
-    
+def iter_image_files(paths: List[str], extensions: Tuple[str, ...] = IMAGE_EXTENSIONS) -> Iterator[str]:
+    """Yield the image files among the given files and directories (walked recursively, in sorted order)."""
+    for path in paths:
+        if os.path.isfile(path):
+            yield os.path.abspath(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(extensions):
+                    yield os.path.abspath(os.path.join(root, name))
+
+
+def file_fingerprint(path: str) -> str:
+    """Identify a file version by path, size and modification time, so edited files are matched again."""
+    stat = os.stat(path)
+    return f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def load_checkpoint(output_path: str) -> Set[str]:
+    """
+    Read the fingerprints of the images already matched successfully.
+
+    The JSONL output doubles as the checkpoint; failed images are not included, so they are retried.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as output_file:
+        for line in output_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by an interrupted run
+                continue
+            if not record.get("error") and record.get("fingerprint"):
+                done.add(record["fingerprint"])
+    return done
+
+
+def match_image(image_path: str) -> Dict[str, Any]:
+    """
+    Analyze one image and find its best matching product.
+
+    Returns:
+        A JSON-serializable result record (with "error" set when the image could not be matched)
+    """
+    start = time.perf_counter()
+    record: Dict[str, Any] = {"path": image_path}
+    try:
+        record["fingerprint"] = file_fingerprint(image_path)
+        # A generic description would be matched and checkpointed, and the image never retried
+        description = analyze_image(image_path, fallback=False)
+        if not description:
+            raise ValueError("image analysis failed")
+        recommendation = get_product_recommendations(description)
+        if not recommendation:
+            raise ValueError("no product recommendation")
+        match = PRODUCT_ID_PATTERN.search(recommendation)
+        product = get_product_by_id(int(match.group(1))) if match else None
+        record.update({
+            "productId": product["id"] if product else None,
+            "productName": product["name"] if product else None,
+            "description": description,
+            "recommendation": recommendation,
+        })
+    except Exception as e:
+        logger.warning("Matching %s failed: %s", image_path, e)
+        record["error"] = str(e)
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def format_duration(seconds: float) -> str:
+    """Format seconds as H:MM:SS."""
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def run_batch(paths: List[str], output_path: str, workers: int = PRODUCT_MATCHER_WORKERS,
+              progress_interval: float = 5.0) -> int:
+    """
+    Match every image under the given paths, appending one JSON line per image to the output.
+
+    Images already matched in a previous run (same path, size and mtime) are skipped, so an
+    interrupted run resumes where it stopped. Progress, throughput and ETA go to stderr.
+
+    Args:
+        paths: Image files and directories
+        output_path: JSONL results file (also the checkpoint)
+        workers: Images processed concurrently
+        progress_interval: Seconds between progress lines
+
+    Returns:
+        Exit code: 0 when every image was matched, 1 if any failed, 130 when interrupted
+    """
+    done = load_checkpoint(output_path)
+    pending = []
+    skipped = 0
+    for path in iter_image_files(paths):
+        try:
+            if file_fingerprint(path) in done:
+                skipped += 1
+                continue
+        except OSError:
+            pass
+        pending.append(path)
+    total = len(pending)
+    print(f"{total} images to match ({skipped} already in {output_path}), {workers} workers", file=sys.stderr)
+
+    start = time.perf_counter()
+    last_report = start
+    completed = failed = 0
+    queue = iter(pending)
+    in_flight = set()
+    interrupted = False
+
+    def report(final: bool = False):
+        elapsed = time.perf_counter() - start
+        rate = completed / elapsed if elapsed > 0 else 0.0
+        eta = format_duration((total - completed) / rate) if rate > 0 and not final else "-"
+        print(f"[{completed}/{total}] {rate:.2f} images/s, {failed} failed, "
+              f"elapsed {format_duration(elapsed)}, ETA {eta}", file=sys.stderr, flush=True)
+
+    with open(output_path, "a", encoding="utf-8") as output_file, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="matcher") as executor:
+        try:
+            while True:
+                # Keep a small window of submitted images so memory stays flat for huge directories
+                while len(in_flight) < workers * 2:
+                    path = next(queue, None)
+                    if path is None:
+                        break
+                    in_flight.add(executor.submit(match_image, path))
+                if not in_flight:
+                    break
+                finished, in_flight = wait(in_flight, timeout=progress_interval, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    record = future.result()
+                    output_file.write(json.dumps(record) + "\n")
+                    completed += 1
+                    failed += bool(record.get("error"))
+                output_file.flush()
+                if completed < total and time.perf_counter() - last_report >= progress_interval:
+                    report()
+                    last_report = time.perf_counter()
+        except KeyboardInterrupt:
+            interrupted = True
+            print("Interrupted; finishing the images in progress (run again to resume)", file=sys.stderr)
+            for future in in_flight:
+                future.cancel()
+            for future in in_flight:
+                if not future.cancelled():
+                    record = future.result()
+                    output_file.write(json.dumps(record) + "\n")
+                    completed += 1
+                    failed += bool(record.get("error"))
+            output_file.flush()
+    report(final=True)
+    if interrupted:
+        return 130
+    return 1 if failed else 0
+
+
+def match_single_image(image_path: str) -> int:
+    """Analyze one image and print the product recommendation."""
     print("\n" + "="*80)
     print(" Pocket AI - PRODUCT IMAGE ANALYZER ".center(80, "="))
     print("="*80 + "\n")
@@ -567,5 +746,27 @@ def main():
     
     return 0
 
+def main():
+    """Main function: analyze one image, or match whole directories with --batch."""
+    configure_logging("product_matcher", fmt=os.getenv("LOG_FORMAT", "text"))
+    
+    parser = argparse.ArgumentParser(description="Analyze product images and find matching catalog products.")
+    parser.add_argument("image", nargs="?", default="test_image.jpg", help="Image to analyze (single-image mode)")
+    parser.add_argument("--batch", nargs="+", metavar="PATH", help="Image files or directories to match in bulk")
+    parser.add_argument("--output", default="matches.jsonl", help="JSONL results file, also used to resume (batch mode)")
+    parser.add_argument("--workers", type=int, default=PRODUCT_MATCHER_WORKERS,
+                        help="Images processed concurrently (batch mode)")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="Seconds between progress lines")
+    args = parser.parse_args()
+    
+    if args.batch:
+        return run_batch(args.batch, args.output, max(1, args.workers), args.progress_interval)
+    
+    if not os.path.exists(args.image):
+        logger.error("Image not found: %s", args.image)
+        print(f"Usage: python {os.path.basename(__file__)} [path_to_image] | --batch DIR [DIR ...]")
+        return 1
+    return match_single_image(args.image)
+
 if __name__ == "__main__":
-    sys.exit(main()) 
\ No newline at end of file
+    sys.exit(main())
@@ -7,6 +7,8 @@ then starts the FastAPI backend server and frontend.
 
 import os
 import sys
+import argparse
+import importlib.util
 import subprocess
 import time
 import requests
@@ -14,11 +16,10 @@ import logging
 import signal
 from pathlib import Path
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from log_config import configure_logging
+
+# Configure logging (plain text by default, since this is an interactive launcher)
+configure_logging("startup", fmt=os.getenv("LOG_FORMAT", "text"))
 logger = logging.getLogger("startup")
 
 # Configuration
@@ -28,6 +29,22 @@ FRONTEND_PORT = 3000
 REQUIRED_MODELS = ["llama3.2", "llava"]
 PROCESSES = []
 
+# Launch mode: "development" (single process with --reload) or "production" (multi-worker)
+LAUNCH_MODE = os.getenv("POCKET_AI_MODE", "development")
+WORKERS = int(os.getenv("POCKET_AI_WORKERS", str(os.cpu_count() or 1)))
+READY_TIMEOUT = float(os.getenv("POCKET_AI_READY_TIMEOUT", "60"))
+SERVER_PROCESSES = []  # uvicorn supervisors that take part in rolling restarts
+
+# Shared catalog snapshot (production mode): built here once and mapped read-only by every worker
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH",
+                                  str(Path(__file__).parent / "backend" / "catalog.snapshot"))
+CATALOG_WATCH_INTERVAL = float(os.getenv("CATALOG_WATCH_INTERVAL", "2"))
+catalog_rebuild_requested = False
+# Rate limit buckets shared by the backend workers (production mode)
+RATE_LIMIT_SQLITE_PATH = str(Path(__file__).parent / "backend" / "rate_limits.db")
+# Chat sessions shared by the backend workers (production mode)
+SESSION_SQLITE_PATH = str(Path(__file__).parent / "backend" / "sessions.db")
+
 def check_command_exists(command):
     """Check if a command exists on the system."""
     try:
@@ -177,6 +194,101 @@ def find_available_port(start_port, max_tries=10):
             return port
     return None
 
+def has_module(name):
+    """Check if an optional Python module is installed."""
+    return importlib.util.find_spec(name) is not None
+
+def build_uvicorn_command(port):
+    """Build the uvicorn command line for the current launch mode."""
+    command = ["uvicorn", "app:app", "--host", "0.0.0.0", "--port", str(port)]
+    
+    if LAUNCH_MODE != "production":
+        return command + ["--reload"]
+    
+    command += ["--workers", str(WORKERS), "--no-access-log", "--timeout-graceful-shutdown", "30"]
+    # Use the faster event loop and HTTP parser when they are installed
+    if has_module("uvloop"):
+        command += ["--loop", "uvloop"]
+    else:
+        logger.warning("uvloop is not installed, using the default asyncio event loop")
+    if has_module("httptools"):
+        command += ["--http", "httptools"]
+    else:
+        logger.warning("httptools is not installed, using the default h11 HTTP parser")
+    return command
+
+def wait_for_ready(url, process=None, timeout=READY_TIMEOUT, initial_delay=0.1, max_delay=2.0):
+    """
+    Poll a URL with exponential backoff until it responds with 200.
+    
+    Args:
+        url: The readiness URL to probe
+        process: Optional subprocess serving the URL; polling stops early if it exits
+        timeout: Maximum number of seconds to wait
+        initial_delay: First delay between probes
+        max_delay: Upper bound for the delay between probes
+        
+    Returns:
+        True if the URL became ready within the timeout
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            logger.error(f"Process exited with code {process.returncode} before becoming ready")
+            return False
+        try:
+            response = requests.get(url, timeout=5)
+            if response.status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(min(delay, max(0, deadline - time.monotonic())))
+        delay = min(delay * 2, max_delay)
+    
+    logger.warning(f"{url} was not ready after {timeout:.0f}s")
+    return False
+
+def catalog_source_signature():
+    """Modification signature of the CATALOG_PATH file (None for the built-in catalog)."""
+    catalog_path = os.getenv("CATALOG_PATH")
+    if not catalog_path:
+        return None
+    try:
+        stat = (Path(__file__).parent / "backend" / catalog_path).stat()
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def build_catalog_snapshot():
+    """
+    Build the shared catalog snapshot that the server workers map instead of loading the catalog.
+    
+    The snapshot is replaced atomically; running workers notice the new file and switch to it.
+    
+    Returns:
+        True if the snapshot was written
+    """
+    logger.info(f"Building shared catalog snapshot {CATALOG_SNAPSHOT_PATH}...")
+    backend_path = Path(__file__).parent / "backend"
+    env = dict(os.environ)
+    env.pop("CATALOG_SNAPSHOT_PATH", None)
+    result = subprocess.run(
+        [sys.executable, "catalog_snapshot.py", CATALOG_SNAPSHOT_PATH],
+        cwd=backend_path,
+        env=env
+    )
+    if result.returncode != 0:
+        logger.error(f"Building the catalog snapshot failed with exit code {result.returncode}")
+        return False
+    return True
+
+def request_catalog_rebuild(signum=None, frame=None):
+    """Rebuild the shared catalog snapshot on the next main loop iteration."""
+    global catalog_rebuild_requested
+    catalog_rebuild_requested = True
+
 def start_backend():
     """Start the FastAPI backend."""
     logger.info("Starting FastAPI backend...")
@@ -193,30 +305,23 @@ def start_backend():
     # Start the backend in a subprocess
     backend_path = Path(__file__).parent / "backend"
     backend_process = subprocess.Popen(
-        ["uvicorn", "app:app", "--host", "0.0.0.0", "--port", str(port), "--reload"],
+        build_uvicorn_command(port),
         cwd=backend_path,
         stdout=sys.stdout,
         stderr=sys.stderr
     )
     PROCESSES.append(backend_process)
+    SERVER_PROCESSES.append(backend_process)
     
-    # Wait a moment for the server to start
-    time.sleep(2)
+    # Wait for the server to accept requests
+    if wait_for_ready(f"http://localhost:{port}/api/health", backend_process):
+        logger.info(f"Backend started successfully on port {port}")
+        # Set environment variable for frontend to use
+        os.environ["BACKEND_API_URL"] = f"http://localhost:{port}/api"
+        return True
     
-    # Check if server is running
-    try:
-        response = requests.get(f"http://localhost:{port}/api/health")
-        if response.status_code == 200:
-            logger.info(f"Backend started successfully on port {port}")
-            # Set environment variable for frontend to use
-            os.environ["BACKEND_API_URL"] = f"http://localhost:{port}/api"
-            return True
-        else:
-            logger.warning(f"Backend may not have started correctly. Status code: {response.status_code}")
-            return False
-    except requests.RequestException:
-        logger.warning("Could not connect to backend. It may not have started correctly.")
-        return False
+    logger.warning("Could not connect to backend. It may not have started correctly.")
+    return False
 
 def start_frontend():
     """Start the Frontend server."""
@@ -237,28 +342,33 @@ def start_frontend():
     # Start the frontend in a subprocess
     frontend_path = Path(__file__).parent / "frontend"
     frontend_process = subprocess.Popen(
-        ["uvicorn", "app:app", "--host", "0.0.0.0", "--port", str(port), "--reload"],
+        build_uvicorn_command(port),
         cwd=frontend_path,
         stdout=sys.stdout,
         stderr=sys.stderr
     )
     PROCESSES.append(frontend_process)
+    SERVER_PROCESSES.append(frontend_process)
     
-    # Wait a moment for the server to start
-    time.sleep(2)
+    # Wait for the server to accept requests
+    if wait_for_ready(f"http://localhost:{port}/", frontend_process):
+        logger.info(f"Frontend started successfully on port {port}")
+        return True
     
-    # Check if server is running
-    try:
-        response = requests.get(f"http://localhost:{port}/")
-        if response.status_code == 200:
-            logger.info(f"Frontend started successfully on port {port}")
-            return True
-        else:
-            logger.warning(f"Frontend may not have started correctly. Status code: {response.status_code}")
-            return False
-    except requests.RequestException:
-        logger.warning("Could not connect to frontend. It may not have started correctly.")
-        return False
+    logger.warning("Could not connect to frontend. It may not have started correctly.")
+    return False
+
+def rolling_restart(signum=None, frame=None):
+    """Replace the server workers one at a time without dropping traffic (production mode only)."""
+    if LAUNCH_MODE != "production":
+        logger.info("Rolling restart is only available in production mode; --reload picks up changes automatically")
+        return
+    
+    for process in SERVER_PROCESSES:
+        if process.poll() is None:
+            # uvicorn's multi-worker supervisor (0.54.0 and later) starts each replacement before retiring the old worker
+            logger.info(f"Rolling restart of server process {process.pid}")
+            process.send_signal(signal.SIGHUP)
 
 def cleanup(signum=None, frame=None):
     """Clean up processes on exit."""
@@ -276,13 +386,36 @@ def cleanup(signum=None, frame=None):
     logger.info("All processes terminated")
     sys.exit(0)
 
+def parse_args():
+    """Parse command-line options."""
+    parser = argparse.ArgumentParser(description="Start the Pocket AI E-commerce Agent")
+    parser.add_argument("--mode", choices=["development", "production"], default=LAUNCH_MODE,
+                        help="development: single process with auto-reload; production: multiple workers "
+                             "(default: $POCKET_AI_MODE or development)")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="Worker processes per server in production mode (default: $POCKET_AI_WORKERS or CPU count)")
+    return parser.parse_args()
+
 def main():
     """Main entry point for the startup script."""
+    global LAUNCH_MODE, WORKERS, catalog_rebuild_requested
+    args = parse_args()
+    LAUNCH_MODE = args.mode
+    WORKERS = max(1, args.workers)
+    
     logger.info("Starting Pocket AI E-commerce Agent...")
+    if LAUNCH_MODE == "production":
+        logger.info(f"Production mode: {WORKERS} workers per server")
+    else:
+        # Export every trace while developing; production keeps the sampled default
+        os.environ.setdefault("TRACE_SAMPLE_RATE", "1")
     
     # Register signal handlers for graceful shutdown
     signal.signal(signal.SIGINT, cleanup)
     signal.signal(signal.SIGTERM, cleanup)
+    if hasattr(signal, "SIGHUP"):
+        # kill -HUP <pid> triggers a rolling restart of the server workers
+        signal.signal(signal.SIGHUP, rolling_restart)
     
     # Check if Ollama is installed
     if not check_command_exists("ollama"):
@@ -300,10 +433,8 @@ def main():
             )
             PROCESSES.append(ollama_process)
             
-            # Give Ollama some time to start
-            time.sleep(5)
-            
-            if not check_ollama_running():
+            # Wait for Ollama to accept requests
+            if not wait_for_ready(f"http://localhost:{OLLAMA_PORT}/api/tags", ollama_process, timeout=30):
                 logger.error("Failed to start Ollama. Please start it manually.")
                 return False
         except Exception as e:
@@ -334,6 +465,22 @@ def main():
         if "llava" in REQUIRED_MODELS and not verify_model_works("llava"):
             logger.warning("The llava model is not working correctly. Image analysis features will be limited.")
     
+    # Build the catalog and its indexes once; every backend and frontend worker maps the result
+    shared_catalog = LAUNCH_MODE == "production"
+    if shared_catalog:
+        # Workers share their rate limit buckets, so a client gets the same limit from each of them
+        os.environ.setdefault("RATE_LIMIT_SQLITE_PATH", RATE_LIMIT_SQLITE_PATH)
+        # Any worker can serve a session's next message, so they all need its history
+        os.environ.setdefault("SESSION_SQLITE_PATH", SESSION_SQLITE_PATH)
+        if build_catalog_snapshot():
+            os.environ["CATALOG_SNAPSHOT_PATH"] = CATALOG_SNAPSHOT_PATH
+        else:
+            logger.warning("Workers will load the catalog themselves")
+            shared_catalog = False
+        if hasattr(signal, "SIGUSR1"):
+            # kill -USR1 <pid> rebuilds the shared catalog snapshot
+            signal.signal(signal.SIGUSR1, request_catalog_rebuild)
+    
     # Start the backend server
     if not start_backend():
         logger.error("Failed to start backend server")
@@ -353,12 +500,31 @@ def main():
     logger.info(f"- Frontend: http://localhost:{frontend_port}")
     logger.info(f"- Backend API: {os.environ.get('BACKEND_API_URL', f'http://localhost:{API_PORT}/api')}")
     logger.info("=" * 60)
+    if LAUNCH_MODE == "production":
+        logger.info(f"Send SIGHUP (kill -HUP {os.getpid()}) for a rolling restart.")
+        if shared_catalog:
+            logger.info(f"Send SIGUSR1 (kill -USR1 {os.getpid()}) to reload the catalog.")
     logger.info("Press Ctrl+C to stop all servers.")
     
+    source_signature = catalog_source_signature()
+    last_catalog_check = time.monotonic()
     try:
         # Keep the script running to maintain the subprocesses
         while True:
             time.sleep(1)
+            if not shared_catalog:
+                continue
+            if CATALOG_WATCH_INTERVAL > 0 and time.monotonic() - last_catalog_check >= CATALOG_WATCH_INTERVAL:
+                last_catalog_check = time.monotonic()
+                signature = catalog_source_signature()
+                if signature != source_signature:
+                    logger.info("Catalog file changed")
+                    source_signature = signature
+                    catalog_rebuild_requested = True
+            if catalog_rebuild_requested:
+                catalog_rebuild_requested = False
+                # On failure the previous snapshot stays in place and workers keep using it
+                build_catalog_snapshot()
     except KeyboardInterrupt:
         pass
     finally:
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+Request tracing for the Pocket AI e-commerce agent.
+Provides lightweight spans shared by the frontend and backend, trace ID propagation
+through HTTP headers, a JSONL exporter, and a CLI that renders a trace as a waterfall.
+
+Usage:
+    python tracing.py list [--limit 20]
+    python tracing.py waterfall <trace_id>
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import zlib
+import queue
+import atexit
+import inspect
+import logging
+import argparse
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("tracing")
+
+# Headers used to propagate the trace between services
+TRACE_HEADER = "X-Trace-Id"
+PARENT_SPAN_HEADER = "X-Parent-Span-Id"
+
+# Exporter configuration (the default path is shared by the frontend and backend)
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() not in ("0", "false", "no")
+TRACE_EXPORT_PATH = os.getenv(
+    "TRACE_EXPORT_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces", "traces.jsonl")
+)
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "pocket-ai")
+# Fraction of traces exported, chosen by trace ID so every service keeps the same traces
+# (development mode in start.py exports all of them)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+# Size in bytes at which the trace file is rotated, and the number of rotated files kept (.1, .2, ...)
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", "2"))
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def is_sampled(trace_id: str, rate: float = TRACE_SAMPLE_RATE) -> bool:
+    """Whether the spans of a trace are exported; the same for a trace ID in every process."""
+    if rate >= 1:
+        return True
+    return zlib.crc32(trace_id.encode("utf-8")) < rate * 0x100000000
+
+
+class Span:
+    """A timed operation within a trace."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "service", "start",
+                 "duration_ms", "attributes", "error", "_start_perf")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], service: str,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = _new_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.service = service
+        self.start = time.time()
+        self.duration_ms: Optional[float] = None
+        self.attributes = dict(attributes or {})
+        self.error: Optional[str] = None
+        self._start_perf = time.perf_counter()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Attach an attribute to the span."""
+        self.attributes[key] = value
+
+    def finish(self) -> None:
+        """End the span and hand it to the exporter."""
+        if self.duration_ms is None:
+            self.duration_ms = (time.perf_counter() - self._start_perf) * 1000
+            exporter.export(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentId": self.parent_id,
+            "name": self.name,
+            "service": self.service,
+            "start": self.start,
+            "durationMs": round(self.duration_ms or 0.0, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class JsonlExporter:
+    """Writes the finished spans of sampled traces to a size-capped JSONL file from a background thread."""
+
+    def __init__(self, path: str, max_bytes: int = TRACE_MAX_BYTES, backups: int = TRACE_BACKUPS):
+        """
+        Args:
+            path: The JSONL trace file
+            max_bytes: Size at which the file is rotated (0 for no limit)
+            backups: Rotated files kept next to it
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        if not TRACING_ENABLED or not is_sampled(span.trace_id):
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+        self._queue.put(span.to_dict())
+
+    def _run(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        while True:
+            record = self._queue.get()
+            batch = [record]
+            # Drain whatever else is queued so each write is one append
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = "".join(json.dumps(item) + "\n" for item in batch if item is not None)
+            if lines:
+                try:
+                    self._rotate()
+                    with open(self.path, "a", encoding="utf-8") as trace_file:
+                        trace_file.write(lines)
+                except OSError as e:
+                    logger.warning("Failed to export spans: %s", e)
+            if None in batch:
+                return
+
+    def _rotate(self) -> None:
+        """Move a full trace file to path.1 (shifting older ones), deleting the oldest."""
+        if self.max_bytes <= 0:
+            return
+        try:
+            if os.path.getsize(self.path) < self.max_bytes:
+                return
+        except OSError:
+            return
+        # Processes sharing the file may rotate at the same time; os.replace keeps each step atomic
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def flush(self) -> None:
+        """Write any queued spans before the process exits."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=2)
+            self._thread = None
+
+
+exporter = JsonlExporter(TRACE_EXPORT_PATH)
+
+
+def current_span() -> Optional[Span]:
+    """Get the active span, if any."""
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    """Get the active trace ID, if any."""
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+
+def annotate(**attributes: Any) -> None:
+    """Attach attributes to the active span (no-op outside a span)."""
+    span = _current_span.get()
+    if span is not None:
+        span.attributes.update(attributes)
+
+
+@contextmanager
+def span(name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None,
+         service: Optional[str] = None, **attributes: Any):
+    """
+    Time a block of code as a span, nested under the active span.
+
+    Args:
+        name: Span name
+        trace_id: Explicit trace ID (defaults to the active trace, or a new one)
+        parent_id: Explicit parent span ID (defaults to the active span)
+        service: Service name (defaults to the parent's service or TRACE_SERVICE_NAME)
+        **attributes: Attributes recorded on the span
+
+    Yields:
+        The Span, so attributes can be added while it runs
+    """
+    parent = _current_span.get()
+    if trace_id is None:
+        trace_id = parent.trace_id if parent else _new_id() + _new_id()
+        if parent_id is None and parent is not None:
+            parent_id = parent.span_id
+    if service is None:
+        service = parent.service if parent else SERVICE_NAME
+
+    new_span = Span(name, trace_id, parent_id, service, attributes)
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.error = f"{type(e).__name__}: {str(e)}"
+        raise
+    finally:
+        _current_span.reset(token)
+        new_span.finish()
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """
+    Decorator wrapping a sync or async function in a span.
+
+    Args:
+        name: Span name (defaults to the function's qualified name)
+    """
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def inject_headers(headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    Add the active trace context to outgoing HTTP headers.
+
+    Args:
+        headers: Existing headers to extend (not modified)
+
+    Returns:
+        A new header dictionary including the trace headers
+    """
+    result = dict(headers or {})
+    active = _current_span.get()
+    if active is not None:
+        result[TRACE_HEADER] = active.trace_id
+        result[PARENT_SPAN_HEADER] = active.span_id
+    return result
+
+
+class TracingMiddleware:
+    """ASGI middleware that starts (or continues) a trace for each HTTP request."""
+
+    def __init__(self, app, service: str = SERVICE_NAME):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope.get("headers", [])}
+        trace_id = headers.get(TRACE_HEADER.lower()) or None
+        parent_id = headers.get(PARENT_SPAN_HEADER.lower()) or None
+        if trace_id is None:
+            parent_id = None
+
+        with span(f"{scope.get('method', '')} {scope.get('path', '')}", trace_id=trace_id or _new_id() + _new_id(),
+                  parent_id=parent_id, service=self.service) as request_span:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    request_span.set_attribute("status", message["status"])
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (TRACE_HEADER.lower().encode("latin-1"), request_span.trace_id.encode("latin-1"))
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+
+# CLI helpers
+
+def load_spans(path: str = TRACE_EXPORT_PATH, trace_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Load exported spans, optionally only those of one trace.
+
+    Args:
+        path: The JSONL trace file (its rotated files are read too)
+        trace_id: Only return spans of this trace
+
+    Returns:
+        A list of span dictionaries
+    """
+    spans = []
+    # Rotated files first, oldest first, so spans stay in export order
+    paths = [f"{path}.{index}" for index in range(TRACE_BACKUPS, 0, -1)] + [path]
+    for file_path in paths:
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, "r", encoding="utf-8") as trace_file:
+            for line in trace_file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if trace_id is None or record.get("traceId") == trace_id:
+                    spans.append(record)
+    return spans
+
+
+def render_waterfall(spans: List[Dict[str, Any]], width: int = 50) -> str:
+    """
+    Render the spans of one trace as an indented waterfall chart.
+
+    Args:
+        spans: Spans belonging to a single trace
+        width: Width of the timeline bar in characters
+
+    Returns:
+        The waterfall as text
+    """
+    if not spans:
+        return "No spans found."
+
+    by_id = {item["spanId"]: item for item in spans}
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for item in spans:
+        parent = item.get("parentId") if item.get("parentId") in by_id else None
+        children.setdefault(parent, []).append(item)
+    for siblings in children.values():
+        siblings.sort(key=lambda item: item["start"])
+
+    trace_start = min(item["start"] for item in spans)
+    trace_end = max(item["start"] + item["durationMs"] / 1000 for item in spans)
+    total_ms = max((trace_end - trace_start) * 1000, 0.001)
+
+    rows = []
+
+    def walk(item: Dict[str, Any], depth: int) -> None:
+        offset_ms = (item["start"] - trace_start) * 1000
+        bar_start = int(offset_ms / total_ms * width)
+        bar_length = max(1, int(item["durationMs"] / total_ms * width))
+        bar = " " * bar_start + "█" * min(bar_length, width - bar_start)
+        label = ("  " * depth + item["name"])[:44]
+        marker = " !" if item.get("error") else ""
+        rows.append(f"{label:<44} {item['service'][:10]:<10} {offset_ms:>9.1f} {item['durationMs']:>9.1f} |{bar:<{width}}|{marker}")
+        for child in children.get(item["spanId"], []):
+            walk(child, depth + 1)
+
+    for root in children.get(None, []):
+        walk(root, 0)
+
+    header = f"{'span':<44} {'service':<10} {'start ms':>9} {'dur ms':>9} |{'timeline':<{width}}|"
+    lines = [f"Trace {spans[0]['traceId']} - {len(spans)} spans, {total_ms:.1f} ms", header, "-" * len(header)]
+    lines.extend(rows)
+    errors = [item for item in spans if item.get("error")]
+    for item in errors:
+        lines.append(f"! {item['name']}: {item['error']}")
+    return "\n".join(lines)
+
+
+def main() -> int:
+    """Command-line entry point for inspecting exported traces."""
+    parser = argparse.ArgumentParser(description="Inspect Pocket AI request traces")
+    parser.add_argument("--file", default=TRACE_EXPORT_PATH, help="Trace JSONL file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = subparsers.add_parser("list", help="List recent traces")
+    list_parser.add_argument("--limit", type=int, default=20, help="Number of traces to show")
+
+    waterfall_parser = subparsers.add_parser("waterfall", help="Render a trace as a waterfall")
+    waterfall_parser.add_argument("trace_id", help="The trace ID (from the X-Trace-Id response header)")
+    waterfall_parser.add_argument("--width", type=int, default=50, help="Timeline width in characters")
+
+    args = parser.parse_args()
+
+    if args.command == "waterfall":
+        spans = load_spans(args.file, args.trace_id)
+        print(render_waterfall(spans, args.width))
+        return 0 if spans else 1
+
+    traces: Dict[str, Dict[str, Any]] = {}
+    for item in load_spans(args.file):
+        summary = traces.setdefault(item["traceId"], {"start": item["start"], "end": item["start"],
+                                                      "spans": 0, "root": item["name"]})
+        summary["spans"] += 1
+        if item["start"] <= summary["start"]:
+            summary["start"] = item["start"]
+            summary["root"] = item["name"]
+        summary["end"] = max(summary["end"], item["start"] + item["durationMs"] / 1000)
+
+    recent = sorted(traces.items(), key=lambda entry: entry[1]["start"], reverse=True)[:args.limit]
+    for trace_id, summary in recent:
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(summary["start"]))
+        duration_ms = (summary["end"] - summary["start"]) * 1000
+        print(f"{trace_id}  {started}  {duration_ms:>9.1f} ms  {summary['spans']:>3} spans  {summary['root']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())